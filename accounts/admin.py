@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser
+from .models import CustomUser, OutboundEmail
 
 
 @admin.register(CustomUser)
@@ -15,4 +15,12 @@ class CustomUserAdmin(UserAdmin):
 		('Gestor de Servicios', {'fields': ('approved', 'role', 'office', 'id_type', 'id_number', 'birth_date', 'phone')}),
 	)
 
+
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+	list_display = ('id', 'subject', 'to', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+	list_filter = ('status',)
+	search_fields = ('subject', 'to')
+	readonly_fields = ('created_at', 'sent_at', 'last_error')
+
 # Register your models here.
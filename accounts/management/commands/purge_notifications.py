@@ -0,0 +1,62 @@
+import gzip
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts import retention
+from accounts.models import Notification, NotificationDigest
+
+
+class Command(BaseCommand):
+    help = (
+        "Roll read notifications older than NOTIFICATION_READ_TTL_DAYS into per-day digests "
+        "and delete them in small batches; also drop digests older than NOTIFICATION_DIGEST_TTL_DAYS"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None, help='Override NOTIFICATION_READ_TTL_DAYS')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per batch/transaction (default 1000)')
+        parser.add_argument('--sleep', type=float, default=0.0, help='Seconds to pause between batches')
+        parser.add_argument('--archive', help='Append deleted rows as JSON lines to this file (.gz to compress)')
+        parser.add_argument('--no-digest', action='store_true', help='Delete without rolling up into digests')
+        parser.add_argument('--dry-run', action='store_true', help='Only report how many rows would be deleted')
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else retention.read_ttl_days()
+        if days < 1 or options['chunk_size'] < 1:
+            raise CommandError('--days and --chunk-size must be positive')
+        before = timezone.now() - timedelta(days=days)
+        total_before = Notification.objects.count()
+
+        archive = None
+        if options['archive'] and not options['dry_run']:
+            path = options['archive']
+            archive = gzip.open(path, 'at', encoding='utf-8') if path.endswith('.gz') else open(path, 'a', encoding='utf-8')
+        try:
+            report = retention.compact(
+                before, chunk_size=options['chunk_size'], digest=not options['no_digest'],
+                archive=archive, pause=options['sleep'], dry_run=options['dry_run'],
+            )
+        finally:
+            if archive is not None:
+                archive.close()
+
+        if options['dry_run']:
+            self.stdout.write(
+                f"{report['deleted']} of {total_before} notifications are read and older than {days} days (dry run)"
+            )
+            return
+
+        digests_deleted = retention.purge_digests(chunk_size=options['chunk_size'])
+        rate = report['deleted'] / report['seconds'] if report['seconds'] else 0
+        self.stdout.write(
+            f"Batches: {report['chunks']} in {report['seconds']:.1f}s ({rate:.0f} rows/s); "
+            f"digests created={report['digests_created']} updated={report['digests_updated']} "
+            f"expired digests deleted={digests_deleted}"
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Reclaimed {report['deleted']} notification rows "
+            f"({total_before} -> {total_before - report['deleted']}); "
+            f"{NotificationDigest.objects.count()} digest rows"
+        ))
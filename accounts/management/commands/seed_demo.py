@@ -3,6 +3,7 @@ from django.contrib.auth import get_user_model
 from accounts.models import Roles
 from oficinas.models import Office
 from tickets.models import Ticket, TicketPriority, TicketStatus, TicketNote, Evidence
+from tickets import broadcast
 from accounts.models import Notification
 from io import BytesIO
 from PIL import Image
@@ -23,6 +24,11 @@ class Command(BaseCommand):
         parser.add_argument('--reset', action='store_true', help='Delete existing demo tickets and notes/evidence before seeding')
 
     def handle(self, *args, **options):
+        # Agrupar las difusiones WebSocket de todos los tickets tocados en un solo envío por grupo
+        with broadcast.batch():
+            self.seed(**options)
+
+    def seed(self, **options):
         User = get_user_model()
         total_tickets_target = max(1, options['tickets'])
         months = max(1, options['months'])
@@ -368,6 +374,10 @@ class Command(BaseCommand):
                     defaults={"text": f"Actualización del ticket #{tk.id}"},
                 )
 
+        # Los timestamps se reescribieron con QuerySet.update (sin señales): recalcular contadores
+        from tickets import counters
+        counters.rebuild()
+
         # Summary output
         self.stdout.write(self.style.SUCCESS(
             f"Demo data created/updated. Offices: {Office.objects.count()} | Users: {User.objects.count()} | Tickets: {Ticket.objects.count()}"
@@ -0,0 +1,56 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from accounts import outbox
+from gestor_servicios import metrics
+
+
+class Command(BaseCommand):
+    help = (
+        "Send queued outbound emails (accounts.OutboundEmail). With --loop keeps running, "
+        "reusing one SMTP connection while there is work and polling every --interval seconds"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep draining the queue until interrupted')
+        parser.add_argument('--interval', type=float, default=5.0, help='Seconds to sleep when the queue is empty (default 5)')
+        parser.add_argument('--batch-size', type=int, default=50, help='Messages claimed per batch (default 50)')
+        parser.add_argument('--max-attempts', type=int, default=None, help='Override EMAIL_OUTBOX_MAX_ATTEMPTS')
+
+    def handle(self, *args, **options):
+        totals = {'sent': 0, 'retried': 0, 'failed': 0}
+        connection = get_connection()
+        try:
+            while True:
+                close_old_connections()
+                outbox.requeue_stale()
+                result = outbox.drain(options['batch_size'], options['max_attempts'], connection=connection)
+                for key, value in result.items():
+                    totals[key] += value
+                if any(result.values()):
+                    self.report(result)
+                    continue  # puede haber más: siguiente lote con la misma conexión
+                # Cola vacía: no retener la sesión SMTP mientras se espera
+                connection.close()
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Outbox: sent={totals['sent']} retried={totals['retried']} failed={totals['failed']} "
+            f"queue={outbox.queue_stats()}"
+        ))
+
+    def report(self, result):
+        count = metrics.get('outbox.send_seconds.count')
+        average = metrics.get('outbox.send_seconds.sum') / count if count else 0
+        self.stdout.write(
+            f"sent={result['sent']} retried={result['retried']} failed={result['failed']} "
+            f"avg_send={average * 1000:.1f}ms max_send={metrics.get('outbox.send_seconds.max') * 1000:.1f}ms"
+        )
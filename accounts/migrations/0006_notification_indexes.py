@@ -0,0 +1,22 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_alter_customuser_id_type'),
+        ('tickets', '0004_ticket_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['recipient', '-created_at'], name='notif_recipient_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('read_at__isnull', True)), fields=['recipient'], name='notif_unread_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:23
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_notification_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundEmail',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=255)),
+                ('body', models.TextField()),
+                ('from_email', models.CharField(blank=True, max_length=254)),
+                ('to', models.TextField()),
+                ('status', models.CharField(choices=[('PENDING', 'Pendiente'), ('SENDING', 'Enviando'), ('SENT', 'Enviado'), ('FAILED', 'Fallido')], default='PENDING', max_length=8)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['id'],
+                'indexes': [models.Index(condition=models.Q(('status', 'PENDING')), fields=['next_attempt_at', 'id'], name='outbox_due_idx')],
+            },
+        ),
+    ]
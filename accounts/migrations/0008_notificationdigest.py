@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_outboundemail'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('sample', models.CharField(blank=True, max_length=255)),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notification_digests', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-day'],
+                'constraints': [models.UniqueConstraint(fields=('recipient', 'day'), name='notification_digest_unique')],
+            },
+        ),
+    ]
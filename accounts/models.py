@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 
@@ -76,6 +77,66 @@ class Notification(models.Model):
 
 	class Meta:
 		ordering = ['-created_at']
+		indexes = [
+			models.Index(fields=['recipient', '-created_at'], name='notif_recipient_created_idx'),
+			# Contador de no leídas: índice parcial, solo filas con read_at NULL
+			models.Index(fields=['recipient'], name='notif_unread_idx', condition=models.Q(read_at__isnull=True)),
+		]
 
 	def __str__(self):
 		return f"Notificación para {self.recipient} - {self.text}"
+
+
+class NotificationDigest(models.Model):
+	"""Resumen por día de notificaciones leídas ya purgadas (ver ``accounts.retention``)."""
+	recipient = models.ForeignKey('accounts.CustomUser', on_delete=models.CASCADE, related_name='notification_digests')
+	# Día local (America/Bogota) de created_at de las notificaciones resumidas
+	day = models.DateField()
+	total = models.PositiveIntegerField(default=0)
+	# Texto de la última notificación resumida de ese día
+	sample = models.CharField(max_length=255, blank=True)
+
+	class Meta:
+		ordering = ['-day']
+		constraints = [
+			models.UniqueConstraint(fields=['recipient', 'day'], name='notification_digest_unique'),
+		]
+
+	def __str__(self):
+		return f"{self.recipient} {self.day}: {self.total}"
+
+
+class OutboundEmail(models.Model):
+	"""Correo pendiente de envío; lo despacha ``manage.py send_outbox`` (ver ``accounts.outbox``)."""
+
+	class Status(models.TextChoices):
+		PENDING = 'PENDING', _('Pendiente')
+		SENDING = 'SENDING', _('Enviando')
+		SENT = 'SENT', _('Enviado')
+		FAILED = 'FAILED', _('Fallido')
+
+	subject = models.CharField(max_length=255)
+	body = models.TextField()
+	from_email = models.CharField(max_length=254, blank=True)
+	# Destinatarios separados por comas
+	to = models.TextField()
+	status = models.CharField(max_length=8, choices=Status.choices, default=Status.PENDING)
+	attempts = models.PositiveSmallIntegerField(default=0)
+	next_attempt_at = models.DateTimeField(default=timezone.now)
+	last_error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	sent_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		ordering = ['id']
+		indexes = [
+			# Cola: pendientes cuyo próximo intento ya venció
+			models.Index(fields=['next_attempt_at', 'id'], name='outbox_due_idx', condition=models.Q(status='PENDING')),
+		]
+
+	def __str__(self):
+		return f"{self.subject} → {self.to} ({self.get_status_display()})"
+
+	@property
+	def recipients(self):
+		return [address.strip() for address in self.to.split(',') if address.strip()]
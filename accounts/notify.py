@@ -0,0 +1,107 @@
+"""Envío de notificaciones a varios destinatarios de una vez.
+
+``notify`` resuelve los destinatarios (usuarios, ids o querysets), quita duplicados
+(un supervisor que también es jefe recibe un único aviso: el del primer lote que lo
+incluya), escribe todas las filas con un solo ``bulk_create`` y, después del commit,
+publica los ``notification_update`` por WebSocket en una sola pasada por la capa de
+canales en lugar de un ``group_send`` síncrono por cada ``post_save``.
+
+``bulk_create`` no dispara ``post_save``: ``accounts.signals`` sigue cubriendo las
+notificaciones creadas una a una fuera de este módulo.
+"""
+import logging
+import time
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+from django.db.models import QuerySet
+
+from gestor_servicios import metrics
+from . import unread
+from .models import CustomUser, Notification, Roles
+
+logger = logging.getLogger(__name__)
+
+
+def active_jefes():
+    """Ids de los jefes activos (una consulta, sin instanciar usuarios)."""
+    return CustomUser.objects.filter(role=Roles.JEFE, is_active=True).values_list('id', flat=True)
+
+
+def _recipient_ids(recipients):
+    if isinstance(recipients, QuerySet):
+        if recipients.model is CustomUser and not recipients._fields:
+            recipients = recipients.values_list('id', flat=True)
+        return list(recipients)
+    ids = []
+    for recipient in recipients:
+        if recipient is None:
+            continue
+        ids.append(recipient if isinstance(recipient, int) else recipient.pk)
+    return ids
+
+
+def message_for(notification, unread_count=None):
+    """Mensaje de la capa de canales para ``notification`` (grupo ``user_<id>``).
+
+    ``unread_count`` es el contador de no leídas tras el alta: el badge se actualiza con él.
+    """
+    data = {
+        'event': 'notification_update',
+        'notification_id': notification.id,
+        'ticket_id': notification.ticket_id,
+        'text': notification.text,
+        'created_at': notification.created_at.isoformat(),
+    }
+    if unread_count is not None:
+        data['unread'] = unread_count
+    return {'type': 'notification_update', 'data': data}
+
+
+def publish(notifications):
+    """Ajusta los contadores de no leídas y envía ``notification_update`` a cada
+    destinatario dentro de un único ``async_to_sync``.
+    """
+    for notification in notifications:
+        if notification.read_at is None:
+            unread.adjust(notification.recipient_id, 1)
+    channel_layer = get_channel_layer()
+    if not channel_layer or not notifications:
+        return
+    counts = unread.counts({notification.recipient_id for notification in notifications})
+
+    async def send_all():
+        for notification in notifications:
+            message = message_for(notification, counts.get(notification.recipient_id))
+            try:
+                await channel_layer.group_send(f'user_{notification.recipient_id}', message)
+            except Exception:
+                metrics.inc('notifications.send_errors')
+                logger.exception('Error enviando la notificación %s', notification.id)
+
+    started = time.monotonic()
+    async_to_sync(send_all)()
+    metrics.observe('notifications.publish_seconds', time.monotonic() - started)
+
+
+def notify(*batches, ticket=None):
+    """Crea las notificaciones de ``batches`` = ``(destinatarios, texto)``, en orden de prioridad.
+
+    Devuelve la lista de ``Notification`` creadas. El envío por WebSocket ocurre al
+    confirmarse la transacción en curso (o enseguida si no hay ninguna).
+    """
+    seen = set()
+    notifications = []
+    for recipients, text in batches:
+        for recipient_id in _recipient_ids(recipients):
+            if recipient_id in seen:
+                continue
+            seen.add(recipient_id)
+            notifications.append(Notification(recipient_id=recipient_id, ticket=ticket, text=text))
+    if not notifications:
+        return []
+    Notification.objects.bulk_create(notifications)
+    metrics.inc('notifications.created', len(notifications))
+    transaction.on_commit(lambda: publish(notifications))
+    return notifications
@@ -0,0 +1,140 @@
+"""Cola persistente de correos salientes (``OutboundEmail``).
+
+Las vistas llaman a ``enqueue`` (un ``INSERT`` en la misma transacción que el cambio
+que lo origina) en lugar de ``send_mail``: un servidor SMTP lento ya no bloquea la
+respuesta. ``manage.py send_outbox`` reclama lotes con ``claim`` y los envía con
+``drain`` por una única conexión SMTP, que el worker mantiene abierta mientras haya
+trabajo. Un envío fallido se reintenta con espera exponencial
+(``EMAIL_OUTBOX_RETRY_SECONDS`` · 2ⁿ, hasta ``EMAIL_OUTBOX_RETRY_MAX_SECONDS``) y tras
+``EMAIL_OUTBOX_MAX_ATTEMPTS`` intentos queda en ``FAILED``.
+
+Profundidad de la cola en ``/metricas/`` (``queue_stats``); el worker registra
+``outbox.*`` en ``gestor_servicios.metrics`` y los resume en su salida.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from gestor_servicios import metrics, queue
+from .models import OutboundEmail
+
+logger = logging.getLogger(__name__)
+
+Status = OutboundEmail.Status
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue(subject, body, recipients, from_email=None):
+    """Encola un correo; devuelve la fila creada o ``None`` si no hay destinatarios."""
+    recipients = [address for address in recipients if address]
+    if not recipients:
+        return None
+    return OutboundEmail.objects.create(
+        subject=subject[:255], body=body, from_email=from_email or '', to=','.join(recipients),
+    )
+
+
+def backoff(attempts):
+    """Segundos hasta el siguiente intento tras ``attempts`` fallos."""
+    base = _setting('EMAIL_OUTBOX_RETRY_SECONDS', 30)
+    return min(base * 2 ** max(attempts - 1, 0), _setting('EMAIL_OUTBOX_RETRY_MAX_SECONDS', 3600))
+
+
+def requeue_stale():
+    """Devuelve a la cola los mensajes de un worker que murió a mitad de lote."""
+    return OutboundEmail.objects.filter(status=Status.SENDING, next_attempt_at__lte=timezone.now()).update(
+        status=Status.PENDING,
+    )
+
+
+def claim(batch_size=50):
+    """Marca como ``SENDING`` hasta ``batch_size`` mensajes vencidos y los devuelve."""
+    now = timezone.now()
+    # Si el worker muere, la fila vuelve a la cola cuando vence este plazo
+    lease = now + timedelta(seconds=_setting('EMAIL_OUTBOX_LEASE_SECONDS', 300))
+    due = OutboundEmail.objects.filter(next_attempt_at__lte=now).order_by('next_attempt_at', 'id')
+    return queue.claim(due, batch_size, 'status', Status.PENDING, status=Status.SENDING, next_attempt_at=lease)
+
+
+def _mark_sent(row, now):
+    OutboundEmail.objects.filter(pk=row.pk).update(
+        status=Status.SENT, sent_at=now, attempts=row.attempts + 1, last_error='',
+    )
+    metrics.inc('outbox.sent')
+    metrics.observe('outbox.latency_seconds', (now - row.created_at).total_seconds())
+
+
+def _mark_failed(row, exc, max_attempts):
+    attempts = row.attempts + 1
+    if attempts >= max_attempts:
+        status, next_attempt_at = Status.FAILED, timezone.now()
+        metrics.inc('outbox.failed')
+        logger.error('Correo %s descartado tras %s intentos: %s', row.pk, attempts, exc)
+    else:
+        status, next_attempt_at = Status.PENDING, timezone.now() + timedelta(seconds=backoff(attempts))
+        metrics.inc('outbox.retried')
+        logger.warning('Correo %s falló (intento %s), se reintenta: %s', row.pk, attempts, exc)
+    OutboundEmail.objects.filter(pk=row.pk).update(
+        status=status, attempts=attempts, next_attempt_at=next_attempt_at, last_error=repr(exc)[:1000],
+    )
+    return status
+
+
+def drain(batch_size=50, max_attempts=None, connection=None):
+    """Envía un lote. Devuelve ``{'sent': n, 'retried': n, 'failed': n}``.
+
+    ``connection`` permite reutilizar una conexión SMTP ya abierta entre lotes; si no
+    se pasa se abre una para el lote y se cierra al terminar.
+    """
+    max_attempts = max_attempts or _setting('EMAIL_OUTBOX_MAX_ATTEMPTS', 5)
+    result = {'sent': 0, 'retried': 0, 'failed': 0}
+    rows = claim(batch_size)
+    if not rows:
+        return result
+    own_connection = connection is None
+    connection = connection or get_connection()
+    try:
+        for row in rows:
+            started = time.monotonic()
+            try:
+                connection.open()  # no hace nada si ya está abierta
+                message = EmailMessage(row.subject, row.body, row.from_email or None, row.recipients, connection=connection)
+                if not connection.send_messages([message]):
+                    raise ValueError('El backend no envió el mensaje')
+            except Exception as exc:
+                # Tras un error SMTP la sesión puede quedar inservible: el siguiente reabre
+                try:
+                    connection.close()
+                except Exception:
+                    pass
+                status = _mark_failed(row, exc, max_attempts)
+                result['failed' if status == Status.FAILED else 'retried'] += 1
+            else:
+                _mark_sent(row, timezone.now())
+                result['sent'] += 1
+            finally:
+                metrics.observe('outbox.send_seconds', time.monotonic() - started)
+    finally:
+        if own_connection:
+            connection.close()
+    return result
+
+
+def queue_stats():
+    """Profundidad de la cola en una consulta: pendientes, fallidos y antigüedad del más viejo."""
+    stats = OutboundEmail.objects.exclude(status=Status.SENT).aggregate(
+        pending=Count('id', filter=Q(status__in=[Status.PENDING, Status.SENDING])),
+        failed=Count('id', filter=Q(status=Status.FAILED)),
+        oldest=Min('created_at', filter=Q(status__in=[Status.PENDING, Status.SENDING])),
+    )
+    oldest = stats.pop('oldest')
+    stats['oldest_pending_seconds'] = round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0
+    return stats
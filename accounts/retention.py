@@ -0,0 +1,121 @@
+"""Retención de notificaciones.
+
+Las notificaciones leídas con más de ``NOTIFICATION_READ_TTL_DAYS`` días se resumen en
+``NotificationDigest`` (una fila por usuario y día local, con el total y un texto de
+muestra) y se borran. Los resúmenes con más de ``NOTIFICATION_DIGEST_TTL_DAYS`` días
+se borran también. Las no leídas no se tocan.
+
+Todo se hace por lotes de ``chunk_size`` filas por id, cada lote en su propia
+transacción corta: no se bloquea la tabla mientras dura la purga y se puede
+interrumpir en cualquier momento. ``manage.py purge_notifications`` lo ejecuta y
+muestra cuántas filas se recuperaron.
+"""
+import json
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Notification, NotificationDigest
+
+
+def read_ttl_days():
+    return getattr(settings, 'NOTIFICATION_READ_TTL_DAYS', 30)
+
+
+def digest_ttl_days():
+    return getattr(settings, 'NOTIFICATION_DIGEST_TTL_DAYS', 365)
+
+
+def expired(before):
+    """Notificaciones leídas creadas antes de ``before``."""
+    return Notification.objects.filter(read_at__isnull=False, created_at__lt=before)
+
+
+def _add_to_digest(recipient_id, day, total, sample):
+    updated = NotificationDigest.objects.filter(recipient_id=recipient_id, day=day).update(
+        total=F('total') + total, sample=sample,
+    )
+    if updated:
+        return False
+    try:
+        with transaction.atomic():
+            NotificationDigest.objects.create(recipient_id=recipient_id, day=day, total=total, sample=sample)
+        return True
+    except IntegrityError:  # otro proceso lo creó entretanto
+        NotificationDigest.objects.filter(recipient_id=recipient_id, day=day).update(total=F('total') + total, sample=sample)
+        return False
+
+
+def _write_archive(archive, rows):
+    for row in rows:
+        archive.write(json.dumps({
+            'id': row['id'],
+            'recipient_id': row['recipient_id'],
+            'ticket_id': row['ticket_id'],
+            'text': row['text'],
+            'created_at': row['created_at'].isoformat(),
+            'read_at': row['read_at'].isoformat(),
+        }, ensure_ascii=False) + '\n')
+
+
+def compact(before=None, chunk_size=1000, digest=True, archive=None, pause=0, dry_run=False):
+    """Resume y borra las notificaciones leídas anteriores a ``before``.
+
+    ``archive`` (un fichero de texto abierto) recibe cada fila borrada como JSON por
+    línea. Con ``dry_run`` sólo cuenta. Devuelve un informe
+    ``{'deleted', 'digests_created', 'digests_updated', 'chunks', 'seconds'}``.
+    """
+    if before is None:
+        before = timezone.now() - timedelta(days=read_ttl_days())
+    report = {'deleted': 0, 'digests_created': 0, 'digests_updated': 0, 'chunks': 0, 'seconds': 0.0}
+    started = time.monotonic()
+    if dry_run:
+        report['deleted'] = expired(before).count()
+        return report
+
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            rows = list(
+                expired(before).filter(id__gt=last_id).order_by('id')
+                .values('id', 'recipient_id', 'ticket_id', 'text', 'created_at', 'read_at')[:chunk_size]
+            )
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            if archive is not None:
+                _write_archive(archive, rows)
+            if digest:
+                days = defaultdict(lambda: [0, ''])
+                for row in rows:
+                    entry = days[(row['recipient_id'], timezone.localdate(row['created_at']))]
+                    entry[0] += 1
+                    entry[1] = row['text']
+                for (recipient_id, day), (total, sample) in days.items():
+                    created = _add_to_digest(recipient_id, day, total, sample)
+                    report['digests_created' if created else 'digests_updated'] += 1
+            deleted, _ = Notification.objects.filter(id__in=[row['id'] for row in rows]).delete()
+        report['deleted'] += deleted
+        report['chunks'] += 1
+        if pause:
+            time.sleep(pause)  # deja respirar a la base de datos entre lotes
+    report['seconds'] = time.monotonic() - started
+    return report
+
+
+def purge_digests(before=None, chunk_size=1000):
+    """Borra por lotes los resúmenes anteriores a ``before`` (día). Devuelve cuántos."""
+    if before is None:
+        before = timezone.localdate() - timedelta(days=digest_ttl_days())
+    total = 0
+    while True:
+        ids = list(NotificationDigest.objects.filter(day__lt=before).order_by('id').values_list('id', flat=True)[:chunk_size])
+        if not ids:
+            return total
+        deleted, _ = NotificationDigest.objects.filter(id__in=ids).delete()
+        total += deleted
@@ -1,23 +1,49 @@
-from django.db.models.signals import post_save
+from functools import partial
+
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import Notification
+from gestor_servicios.conditional import bump_directory_version
+from oficinas.models import Office
+from .models import CustomUser, Notification
+from . import snapshot
+from .notify import publish
 
 @receiver(post_save, sender=Notification)
 def on_notification_save(sender, instance: Notification, created, **kwargs):
-    channel_layer = get_channel_layer()
-    if not channel_layer:
+    # Las creadas en bloque (accounts.notify) no pasan por aquí y se publican juntas.
+    # Marcar como leída también guarda, pero eso lo publica la vista (accounts.unread).
+    if not created:
         return
-    payload = {
-        'event': 'notification_update',
-        'notification_id': instance.id,
-        'ticket_id': instance.ticket_id,
-        'text': instance.text,
-        'created_at': instance.created_at.isoformat(),
-    }
-    # Emitir al grupo del usuario
-    async_to_sync(channel_layer.group_send)(f'user_{instance.recipient_id}', {
-        'type': 'notification_update',  # Usar el tipo correcto que espera el frontend
-        'data': payload,
-    })
+    # Contador y envío tras el commit, como las de accounts.notify: si la transacción se
+    # deshace, el badge no cuenta una notificación que no existe
+    transaction.on_commit(partial(publish, [instance]))
+
+
+# Nombres, roles y oficinas aparecen en respuestas con ETag: cualquier cambio las invalida
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def on_user_change(sender, instance, **kwargs):
+    if kwargs.get('update_fields') and set(kwargs['update_fields']) <= {'last_login'}:
+        return  # cada login guarda last_login; no afecta a nada visible
+    snapshot.invalidate(instance.pk)
+    bump_directory_version()
+
+
+@receiver(user_logged_in)
+def on_user_logged_in(sender, request, user, **kwargs):
+    # El WebSocket que abre la primera página ya encuentra rol y oficina en caché
+    snapshot.store(user)
+
+
+@receiver(pre_delete, sender=Office)
+def on_office_delete(sender, instance, **kwargs):
+    # ``SET_NULL`` deja a sus usuarios sin oficina con un UPDATE, sin post_save
+    snapshot.invalidate(*instance.users.values_list('id', flat=True))
+
+
+@receiver(post_save, sender=Office)
+@receiver(post_delete, sender=Office)
+def on_office_change(sender, instance, **kwargs):
+    bump_directory_version()
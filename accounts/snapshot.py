@@ -0,0 +1,66 @@
+"""Rol y oficina de cada usuario, en caché, para el ``connect`` del WebSocket.
+
+``StatsConsumer`` sólo necesita saber a qué grupos unir la conexión (``stats_jefes``,
+``stats_office_<id>``, ``stats_tech_<id>``). Antes lo resolvía con un
+``database_sync_to_async`` que además podía cargar ``user.office``: un salto al pool
+de hilos y una consulta por cada conexión y reconexión (el cliente reintenta cada
+2-3 s). La foto se guarda al iniciar sesión y se lee con ``cache.aget`` desde el bucle
+de eventos; si falta se construye con los campos ya cargados de ``user``
+(``role``/``office_id``), sin tocar la base de datos.
+
+Se invalida en ``accounts.signals`` cuando se guarda o borra un usuario (``user_edit``,
+``approve_user``, la asignación de supervisor en ``oficinas.views.edit``, el admin) y
+antes de borrar una oficina, cuyo ``SET_NULL`` no dispara ``post_save``.
+"""
+from django.conf import settings
+from django.core.cache import cache
+
+KEY = 'user:snapshot:{}'
+
+
+def _ttl():
+    return getattr(settings, 'USER_SNAPSHOT_TTL', 3600)
+
+
+def build(user):
+    return {
+        'role': user.role,
+        'office_id': user.office_id,
+        'is_jefe': user.is_jefe,
+        'is_supervisor': user.is_supervisor,
+        'is_tecnico': user.is_tecnico,
+    }
+
+
+def store(user):
+    snapshot = build(user)
+    cache.set(KEY.format(user.pk), snapshot, _ttl())
+    return snapshot
+
+
+def get(user):
+    return cache.get(KEY.format(user.pk)) or store(user)
+
+
+async def aget(user):
+    snapshot = await cache.aget(KEY.format(user.pk))
+    if snapshot is None:
+        snapshot = build(user)
+        await cache.aset(KEY.format(user.pk), snapshot, _ttl())
+    return snapshot
+
+
+def invalidate(*user_ids):
+    cache.delete_many([KEY.format(user_id) for user_id in user_ids])
+
+
+def groups_for(user_id, snapshot):
+    """Grupos lógicos de estadísticas que corresponden a la foto del usuario."""
+    groups = [f'user_{user_id}']
+    if snapshot.get('is_jefe'):
+        groups.append('stats_jefes')
+    if snapshot.get('is_supervisor') and snapshot.get('office_id'):
+        groups.append(f"stats_office_{snapshot['office_id']}")
+    if snapshot.get('is_tecnico'):
+        groups.append(f'stats_tech_{user_id}')
+    return groups
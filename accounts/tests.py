@@ -1,6 +1,20 @@
-from django.test import TestCase
+import io
+from datetime import timedelta
+from unittest import mock
+from django.core import mail
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
+from oficinas.models import Office
+from tickets import jobs
+from tickets.models import Ticket
+from . import outbox, retention, snapshot, unread
+from .models import Notification, NotificationDigest, OutboundEmail
+from .notify import active_jefes, notify
 
 
 User = get_user_model()
@@ -19,4 +33,215 @@ class RegistrationApprovalTests(TestCase):
         resp = self.client.get('/')
         self.assertEqual(resp.status_code, 200)
 
-# Create your tests here.
+class ConditionalNotificationsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_unchanged_notifications_answer_304(self):
+        u = User.objects.create_user(username='u3', password='pass12345', approved=True)
+        Notification.objects.create(recipient=u, text='Hola')
+        self.client.force_login(u)
+        url = reverse('notifications_data')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(reverse('notifications_mark_all_read'))
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['unread'], 0)
+
+class NotifyTests(TestCase):
+    def test_fan_out_is_one_insert_deduplicated_and_published_after_commit(self):
+        jefes = [User.objects.create_user(username=f'j{i}', password='pass12345', role='JEFE', approved=True) for i in range(3)]
+        supervisor = User.objects.create_user(username='s1', password='pass12345', role='SUPERVISOR', approved=True)
+        sent = []
+
+        class Layer:
+            async def group_send(self, group, message):
+                sent.append((group, message))
+
+        with mock.patch('accounts.notify.get_channel_layer', return_value=Layer()):
+            with self.captureOnCommitCallbacks(execute=True):
+                with CaptureQueriesContext(connection) as ctx:
+                    created = notify(
+                        (active_jefes(), 'a jefes'),
+                        ([supervisor, jefes[0], None], 'a supervisor'),
+                    )
+                self.assertEqual(sent, [])
+        inserts = [q for q in ctx.captured_queries if q['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(len(created), 4)
+        self.assertEqual(Notification.objects.get(recipient=jefes[0]).text, 'a jefes')
+        self.assertEqual(Notification.objects.get(recipient=supervisor).text, 'a supervisor')
+        self.assertEqual(sorted(group for group, _ in sent), sorted(f'user_{u.id}' for u in jefes + [supervisor]))
+        self.assertEqual(sent[0][1]['data']['notification_id'], created[0].id)
+
+    def test_ticket_creation_notifies_jefes_and_supervisor_once(self):
+        jefe = User.objects.create_user(username='j1', password='pass12345', role='JEFE', approved=True)
+        office = Office.objects.create(name='Of1')
+        supervisor = User.objects.create_user(username='s1', password='pass12345', role='SUPERVISOR', approved=True, office=office)
+        office.supervisor = supervisor
+        office.save()
+        self.client.force_login(jefe)
+        with self.settings(JOBS_EAGER=True), self.captureOnCommitCallbacks(execute=True):
+            resp = self.client.post(reverse('ticket_create'), {
+                'requester_name': 'Ana', 'description': 'PC', 'priority': 3, 'assigned_office': office.id,
+            })
+        self.assertEqual(resp.status_code, 302)
+        self.assertEqual(Notification.objects.filter(recipient=jefe).count(), 1)
+        self.assertEqual(Notification.objects.filter(recipient=supervisor).count(), 1)
+
+
+class UnreadCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='u1', password='pass12345', approved=True)
+        self.sent = []
+        sent = self.sent
+
+        class Layer:
+            async def group_send(self, group, message):
+                sent.append((group, message['data']))
+
+        for target in ('accounts.notify.get_channel_layer', 'accounts.unread.get_channel_layer'):
+            p = mock.patch(target, return_value=Layer())
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_counter_follows_create_read_and_read_all_and_is_pushed(self):
+        self.assertEqual(unread.count(self.user.id), 0)
+        with self.assertNumQueries(0):
+            unread.count(self.user.id)
+        with self.captureOnCommitCallbacks(execute=True):
+            created = notify(([self.user], 'uno'))
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(recipient=self.user, text='dos')
+        self.assertEqual([data['unread'] for _, data in self.sent], [1, 2])
+        with self.assertNumQueries(0):
+            self.assertEqual(unread.count(self.user.id), 2)
+
+        self.client.force_login(self.user)
+        self.client.post(reverse('notification_mark_read', args=[created[0].id]))
+        self.assertEqual(self.sent[-1], (f'user_{self.user.id}', {'event': 'unread_count', 'unread': 1}))
+        self.client.post(reverse('notifications_mark_all_read'))
+        self.assertEqual(self.sent[-1][1]['unread'], 0)
+        self.assertEqual(unread.count(self.user.id), 0)
+
+    def test_rolled_back_notification_is_not_counted(self):
+        self.assertEqual(unread.count(self.user.id), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError):
+                with transaction.atomic():
+                    Notification.objects.create(recipient=self.user, text='uno')
+                    raise RuntimeError
+        self.assertEqual(self.sent, [])
+        with self.assertNumQueries(0):
+            self.assertEqual(unread.count(self.user.id), 0)
+
+    def test_page_renders_badge_without_fetching_data(self):
+        Notification.objects.create(recipient=self.user, text='uno')
+        self.client.force_login(self.user)
+        resp = self.client.get('/')
+        self.assertContains(resp, '<span id="notif-count" class="badge">1</span>', html=True)
+
+
+class SnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.office = Office.objects.create(name='Norte')
+        self.jefe = User.objects.create_user(username='jefe', password='pass12345', role='JEFE', approved=True)
+        self.user = User.objects.create_user(username='u1', password='pass12345', approved=False, office=self.office)
+
+    def test_login_stores_snapshot_and_role_changes_invalidate_it(self):
+        self.client.login(username='u1', password='pass12345')
+        with self.assertNumQueries(0):
+            self.assertEqual(snapshot.groups_for(self.user.id, snapshot.get(self.user)), [f'user_{self.user.id}'])
+
+        self.client.force_login(self.jefe)
+        self.client.get(reverse('approve_user', args=[self.user.id]))
+        self.assertIsNone(cache.get(snapshot.KEY.format(self.user.id)))
+        self.user.refresh_from_db()
+        self.assertEqual(snapshot.groups_for(self.user.id, snapshot.get(self.user)), [f'user_{self.user.id}', f'stats_tech_{self.user.id}'])
+
+        self.office.delete()
+        self.assertIsNone(cache.get(snapshot.KEY.format(self.user.id)))
+
+
+class RetentionTests(TestCase):
+    def test_old_read_notifications_roll_into_digests_in_chunks(self):
+        user = User.objects.create_user(username='u1', password='pass12345', approved=True)
+        now = timezone.now()
+        old = now - timedelta(days=40)
+        for i in range(5):
+            Notification.objects.create(recipient=user, text=f'vieja {i}')
+        Notification.objects.create(recipient=user, text='vieja sin leer')
+        Notification.objects.create(recipient=user, text='reciente', read_at=now)
+        Notification.objects.exclude(text='reciente').update(created_at=old)
+        Notification.objects.filter(text__startswith='vieja ').exclude(text='vieja sin leer').update(read_at=old)
+
+        self.assertEqual(retention.compact(dry_run=True)['deleted'], 5)
+        archive = io.StringIO()
+        report = retention.compact(chunk_size=2, archive=archive)
+        self.assertEqual((report['deleted'], report['chunks']), (5, 3))
+        self.assertEqual((report['digests_created'], report['digests_updated']), (1, 2))
+        self.assertEqual(len(archive.getvalue().splitlines()), 5)
+        self.assertEqual(
+            sorted(Notification.objects.values_list('text', flat=True)), ['reciente', 'vieja sin leer'],
+        )
+        digest = NotificationDigest.objects.get()
+        self.assertEqual((digest.day, digest.total, digest.sample), (timezone.localdate(old), 5, 'vieja 4'))
+
+        self.client.force_login(user)
+        self.assertContains(self.client.get(reverse('notifications_list')), 'Historial resumido')
+
+
+class OutboxTests(TestCase):
+    def test_drain_sends_batch_over_one_connection(self):
+        outbox.enqueue('Uno', 'cuerpo', ['a@example.com'])
+        outbox.enqueue('Dos', 'cuerpo', ['b@example.com', 'c@example.com'])
+        self.assertIsNone(outbox.enqueue('Nadie', 'cuerpo', ['']))
+        self.assertEqual(outbox.queue_stats()['pending'], 2)
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as open_:
+            result = outbox.drain()
+        self.assertEqual(result, {'sent': 2, 'retried': 0, 'failed': 0})
+        self.assertEqual([m.subject for m in mail.outbox], ['Uno', 'Dos'])
+        self.assertEqual(mail.outbox[1].to, ['b@example.com', 'c@example.com'])
+        self.assertEqual(OutboundEmail.objects.filter(status=OutboundEmail.Status.SENT).count(), 2)
+        self.assertEqual(outbox.queue_stats()['pending'], 0)
+        self.assertTrue(open_.called)
+
+    @override_settings(EMAIL_OUTBOX_RETRY_SECONDS=60)
+    def test_failures_back_off_then_give_up(self):
+        row = outbox.enqueue('Uno', 'cuerpo', ['a@example.com'])
+        broken = mock.Mock()
+        broken.send_messages.side_effect = OSError('smtp caído')
+        with self.assertLogs('accounts.outbox', 'WARNING'):
+            self.assertEqual(outbox.drain(connection=broken, max_attempts=2)['retried'], 1)
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (OutboundEmail.Status.PENDING, 1))
+        self.assertGreater((row.next_attempt_at - row.created_at).total_seconds(), 50)
+        # No vence todavía: el siguiente lote no lo toma
+        self.assertEqual(outbox.drain(connection=broken, max_attempts=2)['retried'], 0)
+        OutboundEmail.objects.filter(pk=row.pk).update(next_attempt_at=row.created_at)
+        with self.assertLogs('accounts.outbox', 'ERROR'):
+            self.assertEqual(outbox.drain(connection=broken, max_attempts=2)['failed'], 1)
+        row.refresh_from_db()
+        self.assertEqual(row.status, OutboundEmail.Status.FAILED)
+        self.assertIn('smtp caído', row.last_error)
+
+    def test_assign_enqueues_instead_of_sending(self):
+        office = Office.objects.create(name='Of1')
+        supervisor = User.objects.create_user(username='s1', password='pass12345', role='SUPERVISOR', approved=True, office=office)
+        tech = User.objects.create_user(username='t1', password='pass12345', role='TECNICO', approved=True, office=office, email='t1@example.com')
+        ticket = Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=office, status='ASSIGNED')
+        self.client.force_login(supervisor)
+        with self.settings(JOBS_EAGER=False):
+            resp = self.client.post(reverse('ticket_assign', args=[ticket.id]), {'technician': tech.id})
+        self.assertEqual(resp.status_code, 302)
+        self.assertFalse(OutboundEmail.objects.exists())  # aún en la cola de trabajos
+        jobs.run_pending()
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutboundEmail.objects.get().recipients, ['t1@example.com'])
+        outbox.drain()
+        self.assertEqual(len(mail.outbox), 1)
@@ -0,0 +1,88 @@
+"""Contador de notificaciones no leídas por usuario, en caché.
+
+El badge de la barra superior lee ``count`` (caché; un ``COUNT`` sobre el índice
+parcial ``notif_unread_idx`` sólo si falta la entrada) y se actualiza por WebSocket:
+cada alta (``accounts.notify`` / ``post_save``), lectura y "marcar todas" ajusta el
+contador y envía ``{'event': 'unread_count', 'unread': n}`` al grupo ``user_<id>``,
+así que la página ya no consulta ``/accounts/notifications/data/`` para pintarlo.
+
+Los ajustes son ``incr``/``decr`` atómicos sobre una entrada que ya existe; si no
+existe no se hace nada y el siguiente ``count`` la recalcula. Cambios masivos que
+saltan estas funciones (``QuerySet.update``) quedan corregidos al vencer
+``NOTIFICATION_UNREAD_TTL``.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Notification
+
+KEY = 'notif:unread:{}'
+
+
+def _ttl():
+    return getattr(settings, 'NOTIFICATION_UNREAD_TTL', 3600)
+
+
+def count(user_id):
+    key = KEY.format(user_id)
+    value = cache.get(key)
+    if value is None:
+        value = Notification.objects.filter(recipient_id=user_id, read_at__isnull=True).count()
+        cache.set(key, value, _ttl())
+    return value
+
+
+def counts(user_ids):
+    """``{user_id: no leídas}`` con un ``get_many`` y un único ``COUNT ... GROUP BY`` para las que falten."""
+    keys = {KEY.format(user_id): user_id for user_id in user_ids}
+    found = {keys[key]: value for key, value in cache.get_many(keys).items()}
+    missing = [user_id for user_id in keys.values() if user_id not in found]
+    if missing:
+        rows = dict(
+            Notification.objects.filter(recipient_id__in=missing, read_at__isnull=True)
+            .values_list('recipient_id').order_by().annotate(n=Count('id'))
+        )
+        computed = {user_id: rows.get(user_id, 0) for user_id in missing}
+        cache.set_many({KEY.format(user_id): n for user_id, n in computed.items()}, _ttl())
+        found.update(computed)
+    return found
+
+
+def adjust(user_id, delta):
+    key = KEY.format(user_id)
+    try:
+        value = cache.incr(key, delta) if delta >= 0 else cache.decr(key, -delta)
+    except ValueError:
+        return  # no estaba en caché: se recalcula en el próximo count()
+    if value < 0:
+        cache.delete(key)
+
+
+def invalidate(user_id):
+    """Descarta el contador: el siguiente ``count`` lo recalcula (tras cambios masivos)."""
+    cache.delete(KEY.format(user_id))
+
+
+def message_for(unread):
+    return {
+        'type': 'notification_update',
+        'data': {'event': 'unread_count', 'unread': unread},
+    }
+
+
+def push(user_ids):
+    """Envía el contador actual a cada ``user_<id>`` (un solo ``async_to_sync``)."""
+    channel_layer = get_channel_layer()
+    if not channel_layer or not user_ids:
+        return
+    values = counts(user_ids)
+
+    async def send_all():
+        for user_id, unread in values.items():
+            await channel_layer.group_send(f'user_{user_id}', message_for(unread))
+
+    async_to_sync(send_all)()
+
@@ -5,11 +5,13 @@ from django.contrib import messages
 from django.contrib.auth.forms import PasswordChangeForm
 from django.contrib.auth import update_session_auth_hash
 from .forms import RegisterForm
-from .models import CustomUser, Roles, Notification
+from . import unread
+from .models import CustomUser, Roles, Notification, NotificationDigest
 from django import forms
 from django.core.paginator import Paginator
 from django.db import models
 from .decorators import jefe_required
+from search import index as search_index
 from django.core.paginator import Paginator
 from django.utils import timezone
 from django.views.decorators.http import require_POST
@@ -18,6 +20,8 @@ from django.contrib.auth.forms import SetPasswordForm
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import user_passes_test
 from urllib.parse import urlencode
+from gestor_servicios.conditional import conditional
+from gestor_servicios.pagination import CursorPaginator
 
 
 class UserEditForm(forms.ModelForm):
@@ -48,7 +52,7 @@ def users_list(request):
 	if active in ('0', '1'):
 		qs = qs.filter(is_active=(active == '1'))
 	if q:
-		qs = qs.filter(models.Q(username__icontains=q) | models.Q(email__icontains=q))
+		qs = search_index.filter_queryset(qs, q, ['user'])
 
 	qs = qs.order_by('date_joined')
 	paginator = Paginator(qs, 10)
@@ -125,11 +129,17 @@ def approve_user(request, user_id):
 @login_required
 def notifications_list(request):
 	qs = Notification.objects.filter(recipient=request.user)
-	qs = qs.order_by('-created_at')
-	paginator = Paginator(qs, 10)
-	page = request.GET.get('page', 1)
-	notifications = paginator.get_page(page)
-	return render(request, 'accounts/notifications.html', {'notifications': notifications})
+	if request.GET.get('page'):
+		# Enlaces antiguos con ?page=N (OFFSET)
+		notifications = Paginator(qs.order_by('-created_at', '-id'), 10).get_page(request.GET.get('page'))
+	else:
+		notifications = CursorPaginator(qs, '-created_at', 10, count='approx').get_page(request.GET.get('cursor'))
+	context = {'notifications': notifications}
+	has_next = notifications.has_next  # atributo en CursorPage, método en Page
+	if not (has_next() if callable(has_next) else has_next):
+		# Al final del historial: resúmenes por día de lo ya purgado (accounts.retention)
+		context['digests'] = NotificationDigest.objects.filter(recipient=request.user)[:30]
+	return render(request, 'accounts/notifications.html', context)
 
 
 @login_required
@@ -138,7 +148,10 @@ def notification_mark_read(request, notif_id):
 	notif = get_object_or_404(Notification, pk=notif_id, recipient=request.user)
 	if notif.read_at is None:
 		notif.read_at = timezone.now()
-		notif.save()
+		notif.save(update_fields=['read_at'])
+		# Contador en caché + badge de las otras pestañas del usuario
+		unread.adjust(request.user.id, -1)
+		unread.push([request.user.id])
 	return redirect('notifications_list')
 
 
@@ -146,15 +159,31 @@ def notification_mark_read(request, notif_id):
 @require_POST
 def notifications_mark_all_read(request):
 	Notification.objects.filter(recipient=request.user, read_at__isnull=True).update(read_at=timezone.now())
+	# Recalcular en vez de poner 0: una notificación creada entretanto sigue sin leer
+	unread.invalidate(request.user.id)
+	unread.push([request.user.id])
 	return redirect('notifications_list')
 
 
+def notifications_stamp(request):
+	# Marca de agua de las notificaciones del usuario: una sola agregación
+	stamp = Notification.objects.filter(recipient=request.user).aggregate(
+		last_id=models.Max('id'),
+		total=models.Count('id'),
+		unread=models.Count('id', filter=models.Q(read_at__isnull=True)),
+		last_created=models.Max('created_at'),
+		last_read=models.Max('read_at'),
+	)
+	last_modified = max(filter(None, [stamp['last_created'], stamp['last_read']]), default=None)
+	return (stamp['last_id'], stamp['total'], stamp['unread'], stamp['last_read']), last_modified
+
+
 @login_required
+@conditional(notifications_stamp)
 def notifications_data(request):
 	notifs = Notification.objects.filter(recipient=request.user).order_by('-created_at')[:5]
-	unread = Notification.objects.filter(recipient=request.user, read_at__isnull=True).count()
 	return JsonResponse({
-		'unread': unread,
+		'unread': unread.count(request.user.id),
 		'items': [
 			{
 				'id': n.id,
@@ -268,23 +297,22 @@ def admin_panel(request):
 		except Exception:
 			pass
 	if u_q:
-		users_qs = users_qs.filter(models.Q(username__icontains=u_q) | models.Q(email__icontains=u_q) | models.Q(first_name__icontains=u_q) | models.Q(last_name__icontains=u_q))
-	users_qs = users_qs.order_by('-date_joined')
-	users_page = Paginator(users_qs, 10).get_page(request.GET.get('users_page', 1))
+		users_qs = search_index.filter_queryset(users_qs, u_q, ['user'])
+	# Paginación por cursor (keyset) con total aproximado en ambos listados
+	users_page = CursorPaginator(users_qs, '-date_joined', 10, count='approx').get_page(request.GET.get('users_cursor'))
 
 	# Tickets filtering
-	tickets_qs = Ticket.objects.select_related('assigned_to', 'office').all()
+	tickets_qs = Ticket.objects.select_related('technician', 'assigned_office').all()
 	t_q = request.GET.get('t_q', '')
 	t_office = request.GET.get('t_office', '')
 	if t_q:
-		tickets_qs = tickets_qs.filter(models.Q(title__icontains=t_q) | models.Q(description__icontains=t_q))
+		tickets_qs = search_index.filter_queryset(tickets_qs, t_q, search_index.TICKET_KINDS)
 	if t_office:
 		try:
-			tickets_qs = tickets_qs.filter(office_id=int(t_office))
+			tickets_qs = tickets_qs.filter(assigned_office_id=int(t_office))
 		except Exception:
 			pass
-	tickets_qs = tickets_qs.order_by('-created_at')
-	tickets_page = Paginator(tickets_qs, 20).get_page(request.GET.get('tickets_page', 1))
+	tickets_page = CursorPaginator(tickets_qs, '-created_at', 20, count='approx').get_page(request.GET.get('tickets_cursor'))
 
 	offices = Office.objects.all().order_by('name')
 
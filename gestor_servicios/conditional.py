@@ -0,0 +1,63 @@
+"""GET condicional (ETag / Last-Modified) para los endpoints que se consultan por polling.
+
+Cada endpoint define una función de *sello* barata (un ``MAX``/``COUNT`` o versiones en
+caché) y se decora con ``conditional(sello)``, que envuelve
+``django.views.decorators.http.condition``: si el cliente envía el mismo ETag se
+responde ``304 Not Modified`` sin ejecutar la vista (ni la agregación ni la plantilla).
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+DIRECTORY_KEY = 'conditional:directory'
+# Los sellos con datos de usuarios/oficinas (nombres) caducan solos cada tanto, por si
+# la caché es local al proceso y el cambio ocurrió en otro proceso.
+DIRECTORY_BUCKET_SECONDS = 300
+
+
+def make_etag(*parts):
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def directory_version():
+    """Versión de los datos de usuarios y oficinas que aparecen en las respuestas."""
+    return (cache.get(DIRECTORY_KEY, 0), int(time.time() // DIRECTORY_BUCKET_SECONDS))
+
+
+def bump_directory_version():
+    cache.add(DIRECTORY_KEY, 0, None)
+    try:
+        cache.incr(DIRECTORY_KEY)
+    except ValueError:
+        cache.set(DIRECTORY_KEY, 1, None)
+
+
+def conditional(stamp_func):
+    """Decorador: ``stamp_func(request, *args, **kwargs)`` devuelve ``(partes, last_modified)``
+    o ``None`` para no aplicar GET condicional a esa petición.
+
+    El ETag combina las partes con el usuario y la URL completa (filtros incluidos).
+    ``no-cache`` obliga al navegador a revalidar siempre en vez de usar su caché heurística.
+    """
+    def stamp(request, *args, **kwargs):
+        if not hasattr(request, '_conditional_stamp'):
+            request._conditional_stamp = stamp_func(request, *args, **kwargs)
+        return request._conditional_stamp
+
+    def etag(request, *args, **kwargs):
+        result = stamp(request, *args, **kwargs)
+        if result is None:
+            return None
+        return make_etag(request.user.pk, request.get_full_path(), *result[0])
+
+    def last_modified(request, *args, **kwargs):
+        result = stamp(request, *args, **kwargs)
+        return result[1] if result else None
+
+    def decorator(view):
+        view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+        return cache_control(private=True, no_cache=True)(view)
+    return decorator
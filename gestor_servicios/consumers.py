@@ -1,19 +1,77 @@
 import json
 import logging
+import random
+import time
+from collections import Counter
+from functools import wraps
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
+from accounts import snapshot, unread
+from tickets import broadcast, live
+from . import metrics
 
 logger = logging.getLogger(__name__)
 
+# Un único socket por pestaña: la página se suscribe a los temas que necesita
+TOPICS = ('notifications', 'stats', 'tickets')
+STATS_TOPICS = {'stats', 'tickets'}
+
+
+def _topics(data):
+    """``{'topic': 'x'}`` o ``{'topics': ['x', 'y']}``."""
+    topics = data.get('topics', data.get('topic'))
+    if isinstance(topics, str):
+        return [topics]
+    return [t for t in topics or [] if isinstance(t, str)]
+
+
+def _filters(value):
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return {}
+    return value if isinstance(value, dict) else {}
+
+
+# Conexiones abiertas por usuario en este proceso (presencia, ver /metricas/ws/)
+presence = Counter()
+
+
+def group_label(group):
+    # user_<id> es un grupo por usuario: se agregan para no disparar la cardinalidad
+    return 'user' if group.startswith('user_') else group
+
+
+def _debug(message, *args):
+    # Muestreado: un INFO por cada connect/mensaje/ping cuesta con miles de conexiones
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < getattr(settings, 'WS_LOG_SAMPLE_RATE', 0.01):
+        logger.debug(message, *args)
+
+
+def timed(name):
+    """Tiempo de cada handler en ``ws.handler.<name>_seconds``."""
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(self, *args, **kwargs):
+            started = time.monotonic()
+            try:
+                return await handler(self, *args, **kwargs)
+            finally:
+                metrics.observe(f'ws.handler.{name}_seconds', time.monotonic() - started)
+        return wrapper
+    return decorator
+
+
 class StatsConsumer(AsyncWebsocketConsumer):
+    @timed('connect')
     async def connect(self):
         try:
             # Obtener el usuario de la sesión
             user = self.scope.get('user')
             
-            # Log para debug
-            logger.info(f"WebSocket connection attempt from user: {user}")
-            
             # Permitir conexión pero verificar autenticación después
             await self.accept()
             
@@ -28,42 +86,46 @@ class StatsConsumer(AsyncWebsocketConsumer):
             
             # Almacenar información del usuario
             self.user = user
-            self.groups_to_join = []
+            self.track_presence(1)
             
-            # Grupo general del usuario
+            # Rol y oficina desde la caché (accounts.snapshot): sin consulta ni salto al pool de hilos
             self.user_group = f'user_{user.id}'
-            self.groups_to_join.append(self.user_group)
-            
-            # Obtener información adicional del usuario de forma asíncrona
-            user_info = await self.get_user_info(user)
+            self.stats_groups = [
+                g for g in snapshot.groups_for(user.id, await snapshot.aget(user)) if g != self.user_group
+            ]
+            self.groups_to_join = []  # grupos físicos en los que está el canal ahora mismo
+            self.last_seq = {}  # grupo lógico -> último seq visto (mensajes perdidos)
             
-            # Grupos por rol usando la información obtenida de forma asíncrona
-            if user_info.get('is_jefe'):
-                self.groups_to_join.append('stats_jefes')
-                logger.info(f"User {user.username} added to stats_jefes group")
+            # Temas iniciales: ?topics=notifications,stats,tickets. Sin el parámetro, como
+            # antes: notificaciones y estadísticas (y filas del listado con ?rows=1)
+            query = parse_qs(self.scope.get('query_string', b'').decode())
+            if 'topics' in query:
+                self.topics = {t for t in query['topics'][0].split(',') if t in TOPICS}
+            else:
+                self.topics = {'notifications', 'stats'}
+                if query.get('rows', ['0'])[0] == '1':
+                    self.topics.add('tickets')
+            self.ticket_window = None
+            await self.sync_groups()
+            if 'tickets' in self.topics:
+                # Filtros y ventana del listado (JSON en ?filters=...), igual que en {'type': 'subscribe'}
+                await self.watch_tickets(_filters(query.get('filters', ['{}'])[0]))
             
-            if user_info.get('is_supervisor'):
-                office_id = user_info.get('office_id')
-                if office_id:
-                    self.groups_to_join.append(f'stats_office_{office_id}')
-                    logger.info(f"User {user.username} added to stats_office_{office_id} group")
-            
-            if user_info.get('is_tecnico'):
-                self.groups_to_join.append(f'stats_tech_{user.id}')
-                logger.info(f"User {user.username} added to stats_tech_{user.id} group")
-            
-            # Unirse a los grupos
-            for group in self.groups_to_join:
-                await self.channel_layer.group_add(group, self.channel_name)
+            # seq de cada grupo (para detectar mensajes perdidos desde aquí) y badge de
+            # notificaciones (al reconectar se corrige lo perdido), en un solo salto al pool de hilos
+            state = await self.get_connect_state(self.active_stats_groups())
+            self.last_seq.update(state['seq'])
             
             # Enviar confirmación de conexión exitosa
             await self.send(text_data=json.dumps({
                 'type': 'connected',
                 'message': 'WebSocket connected successfully',
-                'groups': self.groups_to_join
+                'topics': sorted(self.topics),
+                'groups': self.active_stats_groups(),
+                **state,
             }))
             
-            logger.info(f"WebSocket connected for user {user.username} with groups: {self.groups_to_join}")
+            _debug('WebSocket connected for user %s with groups: %s', user.username, self.groups_to_join)
             
         except Exception as e:
             logger.error(f"Error in WebSocket connect: {e}")
@@ -73,54 +135,135 @@ class StatsConsumer(AsyncWebsocketConsumer):
             }))
             await self.close()
 
+    def active_stats_groups(self):
+        return self.stats_groups if self.topics & STATS_TOPICS else []
+
+    async def sync_groups(self):
+        """Ajusta los grupos del canal a los temas suscritos.
+
+        ``notifications`` -> ``user_<id>``; ``stats``/``tickets`` -> grupos por rol
+        (``stats_jefes`` puede estar repartido en sub-grupos, ver tickets.broadcast).
+        """
+        wanted = [broadcast.shard_for(g, self.channel_name) for g in self.active_stats_groups()]
+        if 'notifications' in self.topics:
+            wanted.insert(0, self.user_group)
+        for group in wanted:
+            if group not in self.groups_to_join:
+                await self.channel_layer.group_add(group, self.channel_name)
+                metrics.gauge('ws.group_connections', 1, group=group_label(group))
+        for group in self.groups_to_join:
+            if group not in wanted:
+                await self.channel_layer.group_discard(group, self.channel_name)
+                metrics.gauge('ws.group_connections', -1, group=group_label(group))
+        self.groups_to_join = wanted
+
+    def track_presence(self, delta):
+        metrics.gauge('ws.connections', delta)
+        presence[self.user.id] += delta
+        if presence[self.user.id] <= 0:
+            del presence[self.user.id]
+            metrics.gauge('ws.users_online', -1)
+        elif presence[self.user.id] == delta == 1:
+            metrics.gauge('ws.users_online', 1)
+
+    async def send(self, text_data=None, bytes_data=None, close=False):
+        started = time.monotonic()
+        try:
+            await super().send(text_data=text_data, bytes_data=bytes_data, close=close)
+        except Exception:
+            metrics.inc('ws.send_errors')
+            raise
+        metrics.observe('ws.send_seconds', time.monotonic() - started)
+        metrics.inc('ws.messages_sent')
+
     @database_sync_to_async
-    def get_user_info(self, user):
-        """Obtener información del usuario de forma asíncrona"""
+    def get_connect_state(self, groups, unread_count=True):
+        state = {'seq': {group: broadcast.current_seq(group) for group in groups}}
+        if unread_count and 'notifications' in self.topics:
+            state['unread'] = unread.count(self.user.id)
+        return state
+
+    async def subscribe(self, data):
+        topics = [t for t in _topics(data) if t in TOPICS]
+        new = set(topics) - self.topics
+        self.topics.update(topics)
+        await self.sync_groups()
+        if 'tickets' in topics:
+            # También al re-suscribirse: cambian los filtros o la ventana ("Cargar más")
+            await self.watch_tickets(_filters(data.get('filters')))
+        # seq/unread de lo recién suscrito: es la base para detectar saltos desde aquí
+        state = {}
+        if new:
+            groups = self.active_stats_groups() if new & STATS_TOPICS else []
+            state = await self.get_connect_state(groups, unread_count='notifications' in new)
+            self.last_seq.update(state['seq'])
+        await self.send(text_data=json.dumps({
+            'type': 'subscribed',
+            'topics': sorted(self.topics),
+            'added': sorted(new),
+            **state,
+        }))
+
+    async def unsubscribe(self, data):
+        self.topics.difference_update(_topics(data))
+        if 'tickets' not in self.topics:
+            self.ticket_window = None
+        await self.sync_groups()
+        await self.send(text_data=json.dumps({'type': 'unsubscribed', 'topics': sorted(self.topics)}))
+
+    async def watch_tickets(self, filters):
         try:
-            info = {
-                'is_jefe': getattr(user, 'is_jefe', False),
-                'is_supervisor': getattr(user, 'is_supervisor', False),
-                'is_tecnico': getattr(user, 'is_tecnico', False),
-                'office_id': None
-            }
-            
-            # Obtener la oficina si existe de forma segura
-            try:
-                if hasattr(user, 'office') and user.office:
-                    info['office_id'] = user.office.id
-            except Exception:
-                # Ignorar errores de acceso a la oficina
-                pass
-                
-            return info
+            self.ticket_window = await self.get_window(filters)
         except Exception as e:
-            logger.error(f"Error getting user info: {e}")
-            return {
-                'is_jefe': False,
-                'is_supervisor': False,
-                'is_tecnico': False,
-                'office_id': None
-            }
+            # Filtros inválidos: sin ventana cada cambio pide recargar el tbody
+            logger.warning(f"Invalid ticket list filters {filters}: {e}")
+            self.ticket_window = None
 
+    @database_sync_to_async
+    def get_window(self, filters):
+        window = live.ListWindow(self.user, filters)
+        window.refresh()
+        return window
+
+    @database_sync_to_async
+    def get_window_update(self, ticket_ids, reset):
+        if reset:
+            self.ticket_window.refresh()
+            return {'reload': True}
+        return self.ticket_window.update(ticket_ids)
+
+    def missed_messages(self, data):
+        """Mensajes del grupo perdidos desde el último visto (capa de canales saturada)."""
+        group, seq = data.get('group'), data.get('seq')
+        if not group or not seq:
+            return 0
+        last = self.last_seq.get(group)
+        self.last_seq[group] = seq
+        return max(0, seq - last - 1) if last is not None else 0
+
+    @timed('disconnect')
     async def disconnect(self, close_code):
         try:
             # Salir de todos los grupos
             for group in getattr(self, 'groups_to_join', []):
                 await self.channel_layer.group_discard(group, self.channel_name)
+                metrics.gauge('ws.group_connections', -1, group=group_label(group))
+            self.groups_to_join = []
             
             user = getattr(self, 'user', None)
             if user:
-                logger.info(f"WebSocket disconnected for user {user.username}")
+                self.track_presence(-1)
+                _debug('WebSocket disconnected for user %s', user.username)
         except Exception as e:
             logger.error(f"Error in WebSocket disconnect: {e}")
 
+    @timed('receive')
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
             message_type = data.get('type', 'unknown')
-            
-            # Log para debug
-            logger.info(f"Received WebSocket message: {message_type}")
+            metrics.inc('ws.messages_received')
+            _debug('Received WebSocket message: %s', message_type)
             
             # Responder con pong si recibe ping
             if message_type == 'ping':
@@ -128,6 +271,10 @@ class StatsConsumer(AsyncWebsocketConsumer):
                     'type': 'pong',
                     'timestamp': data.get('timestamp')
                 }))
+            elif message_type == 'subscribe':
+                await self.subscribe(data)
+            elif message_type == 'unsubscribe':
+                await self.unsubscribe(data)
             
         except json.JSONDecodeError:
             logger.error("Invalid JSON received in WebSocket")
@@ -135,17 +282,50 @@ class StatsConsumer(AsyncWebsocketConsumer):
             logger.error(f"Error processing WebSocket message: {e}")
 
     # Handler para eventos de estadísticas
+    @timed('stats_update')
     async def stats_update(self, event):
+        if not self.topics & STATS_TOPICS:
+            metrics.inc('ws.messages_filtered')
+            return
         try:
-            await self.send(text_data=json.dumps({
+            data = event.get('payload') or event.get('data', {})
+            missed = self.missed_messages(data)
+            if missed:
+                metrics.inc('ws.messages_dropped', missed)
+            if data.get('sent_at'):
+                # Latencia extremo a extremo (commit -> este consumidor), mide la contrapresión
+                metrics.observe('ws.delivery_seconds', max(0.0, time.time() - data['sent_at']))
+            metrics.inc('ws.messages_delivered')
+            message = {
                 'type': 'stats_update',
-                'data': event.get('data', {})
-            }))
+                'data': data,
+            }
+            if 'stats' in self.topics:
+                await self.send(text_data=json.dumps(message))
+            if 'tickets' in self.topics:
+                await self.ticket_rows(data, missed)
         except Exception as e:
             logger.error(f"Error sending stats update: {e}")
     
+    async def ticket_rows(self, data, missed=0):
+        """Filas del listado afectadas por el cambio (tema ``tickets``, ver tickets.live)."""
+        if not missed and not data.get('ticket_ids'):
+            return
+        if self.ticket_window is None:
+            update = {'reload': True}
+        else:
+            update = await self.get_window_update(data.get('ticket_ids') or [], missed)
+        if update is None:
+            metrics.inc('ws.ticket_rows_skipped')
+            return
+        await self.send(text_data=json.dumps({'type': 'ticket_rows', 'data': update}))
+
     # Handler para notificaciones
+    @timed('notification_update')
     async def notification_update(self, event):
+        if 'notifications' not in self.topics:
+            metrics.inc('ws.messages_filtered')
+            return  # quedó en cola antes de darse de baja
         try:
             await self.send(text_data=json.dumps({
                 'type': 'notification_update',
@@ -1,3 +1,5 @@
+from functools import partial
+
 from django.conf import settings
 
 def brand(request):
@@ -16,3 +18,15 @@ def brand(request):
     'FOOTER_CONTACT_EMAIL': getattr(settings, 'APP_CONTACT_EMAIL', 'soporte@example.com'),
     'FOOTER_CONTACT_LOCATION': getattr(settings, 'APP_CONTACT_LOCATION', 'Colombia'),
     }
+
+
+def notifications(request):
+    """Contador de no leídas para el badge inicial (caché; ver ``accounts.unread``).
+
+    Se pasa como invocable: sólo se calcula si la plantilla lo usa.
+    """
+    user = getattr(request, 'user', None)
+    if not user or not user.is_authenticated:
+        return {}
+    from accounts import unread
+    return {'UNREAD_NOTIFICATIONS': partial(unread.count, user.id)}
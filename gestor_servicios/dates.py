@@ -0,0 +1,54 @@
+"""Rangos de fechas locales (``America/Bogota``) sobre columnas ``DateTimeField``.
+
+``created_at__date__gte=...`` o ``created_at__date=hoy`` envuelven la columna en una
+conversión de zona horaria y la base de datos ya no puede usar el índice sobre
+``created_at``. Aquí cada día local se traduce a un rango de instantes semiabierto
+``[inicio del día, inicio del día siguiente)``, que se compara directamente con la
+columna (en UTC) y sí usa el índice.
+"""
+from datetime import date, datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+
+
+def parse_date(value):
+    """``date`` a partir de ``yyyy-mm-dd`` o ``None`` si falta o es inválida."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def day_start(day):
+    """Instante (con zona) en que empieza ``day`` en la zona horaria activa."""
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def local_range(start=None, end=None):
+    """``(desde, hasta)`` para los días locales ``start``..``end`` inclusive.
+
+    ``hasta`` es exclusivo (inicio del día siguiente a ``end``); cualquiera de los dos
+    extremos puede ser ``None`` si no hay límite por ese lado.
+    """
+    since = day_start(start) if start else None
+    until = day_start(end + timedelta(days=1)) if end else None
+    return since, until
+
+
+def date_range_q(start=None, end=None, field='created_at'):
+    """``Q`` equivalente a ``field__date__range=(start, end)`` pero indexable."""
+    since, until = local_range(start, end)
+    q = Q()
+    if since is not None:
+        q &= Q(**{f'{field}__gte': since})
+    if until is not None:
+        q &= Q(**{f'{field}__lt': until})
+    return q
+
+
+def today_q(field='created_at'):
+    today = timezone.localdate()
+    return date_range_q(today, today, field)
@@ -0,0 +1,162 @@
+"""Contadores de métricas en memoria del proceso.
+
+Registro mínimo, seguro entre hilos, para instrumentar el tiempo real
+(WebSockets, difusión de cambios de tickets). Se consulta en ``/metricas/`` (JSON) y
+``/metricas/prometheus/`` (formato de texto de Prometheus).
+
+- ``inc``: contadores; además guardan sus últimos ``RATE_WINDOW`` segundos para ``rate``.
+- ``observe``: observaciones (p. ej. segundos) con ``count``/``sum``/``max`` y un
+  histograma por ``BUCKETS``.
+- ``gauge``: valores que suben y bajan (conexiones abiertas), con etiquetas opcionales.
+
+Cada proceso (Daphne/worker) tiene los suyos: con varios, Prometheus raspa cada uno.
+"""
+import bisect
+import threading
+import time
+from collections import deque
+
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}  # (nombre, ((etiqueta, valor), ...)) -> valor
+_histograms = {}  # nombre -> [cuenta por cubo]
+_windows = {}  # nombre -> deque([segundo, incremento])
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RATE_WINDOW = 60
+
+
+def inc(name, value=1):
+    now = int(time.monotonic())
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+        window = _windows.get(name)
+        if window is None:
+            window = _windows[name] = deque()
+        if window and window[-1][0] == now:
+            window[-1][1] += value
+        else:
+            window.append([now, value])
+            while window[0][0] <= now - RATE_WINDOW:
+                window.popleft()
+
+
+def observe(name, value):
+    """Registra una observación (p. ej. segundos): ``<name>.count``, ``<name>.sum`` y ``<name>.max``."""
+    with _lock:
+        _counters[f'{name}.count'] = _counters.get(f'{name}.count', 0) + 1
+        _counters[f'{name}.sum'] = _counters.get(f'{name}.sum', 0) + value
+        _counters[f'{name}.max'] = max(_counters.get(f'{name}.max', value), value)
+        buckets = _histograms.get(name)
+        if buckets is None:
+            buckets = _histograms[name] = [0] * (len(BUCKETS) + 1)
+        buckets[bisect.bisect_left(BUCKETS, value)] += 1
+
+
+def gauge(name, delta, **labels):
+    with _lock:
+        key = (name, tuple(sorted(labels.items())))
+        value = _gauges.get(key, 0) + delta
+        if value:
+            _gauges[key] = value
+        else:
+            _gauges.pop(key, None)
+
+
+def get(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def rate(name, window=RATE_WINDOW):
+    """Media por segundo de ``inc(name)`` en los últimos ``window`` segundos (máx. ``RATE_WINDOW``)."""
+    since = int(time.monotonic()) - min(window, RATE_WINDOW)
+    with _lock:
+        total = sum(value for second, value in _windows.get(name, ()) if second > since)
+    return total / min(window, RATE_WINDOW)
+
+
+def snapshot():
+    with _lock:
+        return dict(_counters)
+
+
+def gauges(prefix=''):
+    """``{nombre: valor}`` o ``{nombre: {etiquetas: valor}}`` si tiene etiquetas."""
+    result = {}
+    with _lock:
+        items = list(_gauges.items())
+    for (name, labels), value in sorted(items):
+        if not name.startswith(prefix):
+            continue
+        if labels:
+            result.setdefault(name, {})[','.join(f'{k}={v}' for k, v in labels)] = value
+        else:
+            result[name] = value
+    return result
+
+
+def histogram(name):
+    """``{'le=<límite>': acumulado}`` del histograma de ``name``."""
+    with _lock:
+        buckets = list(_histograms.get(name, ()))
+    if not buckets:
+        return {}
+    result, total = {}, 0
+    for bound, count in zip(BUCKETS + (float('inf'),), buckets):
+        total += count
+        result[f'le={bound:g}'] = total
+    return result
+
+
+def _prom_name(name):
+    return 'gestor_' + ''.join(c if c.isalnum() else '_' for c in name)
+
+
+def _prom_labels(labels):
+    if not labels:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"') for _, v in labels)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+
+def prometheus():
+    """Todas las métricas en el formato de texto de Prometheus (versión 0.0.4)."""
+    with _lock:
+        counters = dict(_counters)
+        gauge_items = sorted(_gauges.items())
+        histograms = {name: list(buckets) for name, buckets in _histograms.items()}
+    lines = []
+    observed = {name for name in histograms}
+    for name in sorted(counters):
+        base = name.rsplit('.', 1)[0]
+        if base in observed and name.rsplit('.', 1)[1] in ('count', 'sum', 'max'):
+            continue  # sale con el histograma
+        metric = _prom_name(name) + '_total'
+        lines += [f'# TYPE {metric} counter', f'{metric} {counters[name]:g}']
+    for name, buckets in sorted(histograms.items()):
+        metric = _prom_name(name)
+        lines.append(f'# TYPE {metric} histogram')
+        total = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), buckets):
+            total += count
+            le = '+Inf' if bound == float('inf') else f'{bound:g}'
+            lines.append(f'{metric}_bucket{{le="{le}"}} {total}')
+        lines.append(f"{metric}_sum {counters.get(f'{name}.sum', 0):g}")
+        lines.append(f"{metric}_count {counters.get(f'{name}.count', 0):g}")
+    typed = set()
+    for (name, labels), value in gauge_items:
+        metric = _prom_name(name)
+        if metric not in typed:
+            typed.add(metric)
+            lines.append(f'# TYPE {metric} gauge')
+        lines.append(f'{metric}{_prom_labels(labels)} {value:g}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _gauges.clear()
+        _histograms.clear()
+        _windows.clear()
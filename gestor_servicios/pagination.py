@@ -0,0 +1,165 @@
+"""Paginación por cursor (keyset) para listados grandes.
+
+En lugar de ``OFFSET n`` + ``COUNT(*)`` en cada página, cada página se pide a partir
+de la última fila vista: ``WHERE (campo, id) < (valor, id_visto) ORDER BY campo, id``.
+El coste no depende de la página en la que se esté y, con un índice sobre el campo de
+orden, sólo lee ``per_page + 1`` filas.
+
+El cursor es un token opaco (base64 de JSON) con el orden, la dirección y la fila de
+referencia; un cursor de otro orden o mal formado se ignora y se vuelve a la primera página.
+"""
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+
+
+def encode_cursor(data):
+    raw = json.dumps(data, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        data = json.loads(raw)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def approximate_count(queryset, cap=1000):
+    """Total barato: ``(n, etiqueta)``.
+
+    En PostgreSQL usa la estimación del planificador cuando supera ``cap``; en el resto
+    cuenta como mucho ``cap + 1`` filas (``COUNT`` sobre un ``LIMIT``) y muestra "cap+".
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate > cap:
+            return estimate, f'~{estimate}'
+    n = queryset.order_by()[:cap + 1].count()
+    if n > cap:
+        return cap, f'{cap}+'
+    return n, str(n)
+
+
+class CursorPage:
+    """Página de ``CursorPaginator``; iterable como una ``Page`` de Django."""
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor, previous_cursor, count=None, count_label=''):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.count = count
+        self.count_label = count_label
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+class CursorPaginator:
+    """Pagina ``queryset`` por ``ordering`` (p. ej. ``'-created_at'``) con ``id`` como desempate.
+
+    ``count``: ``None`` (sin total), ``'approx'`` (``approximate_count``) o ``'exact'``.
+    """
+
+    def __init__(self, queryset, ordering, per_page, count=None):
+        self.queryset = queryset
+        self.ordering = ordering
+        self.per_page = per_page
+        self.count = count
+        self.field_name = ordering.lstrip('-')
+        self.descending = ordering.startswith('-')
+        self.field = queryset.model._meta.get_field(self.field_name)
+
+    def _order(self, descending):
+        prefix = '-' if descending else ''
+        return (f'{prefix}{self.field_name}', f'{prefix}pk')
+
+    def _beyond(self, value, pk, descending):
+        op = 'lt' if descending else 'gt'
+        return Q(**{f'{self.field_name}__{op}': value}) | Q(**{self.field_name: value, f'pk__{op}': pk})
+
+    def _cursor(self, obj, direction):
+        value = getattr(obj, self.field_name)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()  # con microsegundos: el cursor debe ser exacto
+        return encode_cursor({'o': self.ordering, 'd': direction, 'k': [value, obj.pk]})
+
+    def _position(self, token):
+        data = decode_cursor(token)
+        if not data or data.get('o') != self.ordering or data.get('d') not in ('n', 'p'):
+            return None
+        try:
+            value, pk = data['k']
+            return data['d'], self.field.to_python(value), int(pk)
+        except (KeyError, TypeError, ValueError, ValidationError):
+            return None
+
+    def get_page(self, cursor=None):
+        position = self._position(cursor)
+        qs = self.queryset
+        if position is None:
+            rows = list(qs.order_by(*self._order(self.descending))[:self.per_page + 1])
+            has_next, has_previous = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        elif position[0] == 'n':
+            _, value, pk = position
+            rows = list(
+                qs.filter(self._beyond(value, pk, self.descending))
+                .order_by(*self._order(self.descending))[:self.per_page + 1]
+            )
+            has_next, has_previous = len(rows) > self.per_page, True
+            rows = rows[:self.per_page]
+        else:
+            # Hacia atrás: se recorre en orden inverso y se da la vuelta al resultado
+            _, value, pk = position
+            rows = list(
+                qs.filter(self._beyond(value, pk, not self.descending))
+                .order_by(*self._order(not self.descending))[:self.per_page + 1]
+            )
+            has_next, has_previous = True, len(rows) > self.per_page
+            if not has_previous:
+                return self.get_page(None)  # se llegó al principio: primera página completa
+            rows = rows[:self.per_page][::-1]
+
+        count, count_label = None, ''
+        if self.count == 'exact':
+            count = qs.count()
+            count_label = str(count)
+        elif self.count == 'approx':
+            count, count_label = approximate_count(qs)
+
+        return CursorPage(
+            rows,
+            has_next=has_next and bool(rows),
+            has_previous=has_previous and bool(rows),
+            next_cursor=self._cursor(rows[-1], 'n') if rows else '',
+            previous_cursor=self._cursor(rows[0], 'p') if rows else '',
+            count=count,
+            count_label=count_label,
+        )
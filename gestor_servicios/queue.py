@@ -0,0 +1,26 @@
+"""Reclamo de filas de colas en base de datos (``accounts.OutboundEmail``, ``tickets.Job``).
+
+Con ``SELECT ... FOR UPDATE SKIP LOCKED`` (PostgreSQL) varios workers toman lotes
+distintos sin esperarse; sin él (SQLite) cada fila se reclama con un ``UPDATE``
+condicional sobre su estado, así que dos workers nunca se llevan la misma.
+"""
+from django.db import connections, transaction
+
+
+def claim(queryset, limit, status_field, from_status, **update):
+    """Aplica ``update`` (que debe cambiar ``status_field``) a hasta ``limit`` filas de
+    ``queryset`` que sigan en ``from_status`` y devuelve esas filas ya actualizadas.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+    due = queryset.filter(**{status_field: from_status})
+    with transaction.atomic(using=queryset.db):
+        if connection.features.has_select_for_update_skip_locked:
+            ids = list(due.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            model._default_manager.filter(id__in=ids).update(**update)
+        else:
+            ids = [
+                pk for pk in due.values_list('id', flat=True)[:limit]
+                if model._default_manager.filter(id=pk, **{status_field: from_status}).update(**update)
+            ]
+    return list(model._default_manager.filter(id__in=ids).order_by(*queryset.query.order_by or ['id']))
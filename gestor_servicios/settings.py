@@ -14,6 +14,7 @@ from pathlib import Path
 import os
 from dotenv import load_dotenv
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 
 load_dotenv()
 
@@ -66,6 +67,7 @@ INSTALLED_APPS = [
     'accounts',
     'oficinas',
     'tickets',
+    'search',
 ]
 
 MIDDLEWARE = [
@@ -94,6 +96,8 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 # App brand (logo/name) available on all templates
                 'gestor_servicios.context_processors.brand',
+                # Badge de notificaciones sin petición extra
+                'gestor_servicios.context_processors.notifications',
             ],
         },
     },
@@ -174,17 +178,130 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Email
 EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'django.core.mail.backends.console.EmailBackend')
 DEFAULT_FROM_EMAIL = os.getenv('DEFAULT_FROM_EMAIL', 'no-reply@example.com')
+EMAIL_HOST = os.getenv('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.getenv('EMAIL_PORT', '25'))
+EMAIL_HOST_USER = os.getenv('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.getenv('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.getenv('EMAIL_USE_TLS', '0') == '1'
+EMAIL_TIMEOUT = int(os.getenv('EMAIL_TIMEOUT', '20'))
+# Cola de salida (accounts.outbox); la despacha `manage.py send_outbox --loop`
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '5'))
+EMAIL_OUTBOX_RETRY_SECONDS = int(os.getenv('EMAIL_OUTBOX_RETRY_SECONDS', '30'))
+EMAIL_OUTBOX_RETRY_MAX_SECONDS = int(os.getenv('EMAIL_OUTBOX_RETRY_MAX_SECONDS', '3600'))
+
+# Retención de notificaciones (`manage.py purge_notifications`, p. ej. a diario por cron):
+# las leídas más viejas que esto se resumen por día y se borran
+NOTIFICATION_READ_TTL_DAYS = int(os.getenv('NOTIFICATION_READ_TTL_DAYS', '30'))
+NOTIFICATION_DIGEST_TTL_DAYS = int(os.getenv('NOTIFICATION_DIGEST_TTL_DAYS', '365'))
+
+# Trabajos en segundo plano (tickets.jobs), ejecutados por `manage.py run_jobs --loop`.
+# JOBS_EAGER=1 los ejecuta en el propio proceso tras el commit (desarrollo sin worker).
+JOBS_EAGER = os.getenv('JOBS_EAGER', '1' if DEBUG else '0') == '1'
+JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', '5'))
+JOBS_RETRY_SECONDS = int(os.getenv('JOBS_RETRY_SECONDS', '10'))
+
+# Fotos de evidencia (tickets.evidence): lado máximo tras re-codificar, anchos de las
+# miniaturas WebP/JPEG y, con JOBS_EAGER, hilos que las procesan fuera de la petición
+EVIDENCE_MAX_DIMENSION = int(os.getenv('EVIDENCE_MAX_DIMENSION', '2560'))
+EVIDENCE_THUMBNAIL_SIZES = tuple(int(size) for size in os.getenv('EVIDENCE_THUMBNAIL_SIZES', '320,640').split(','))
+EVIDENCE_JPEG_QUALITY = int(os.getenv('EVIDENCE_JPEG_QUALITY', '82'))
+EVIDENCE_WEBP_QUALITY = int(os.getenv('EVIDENCE_WEBP_QUALITY', '80'))
+EVIDENCE_WORKERS = int(os.getenv('EVIDENCE_WORKERS', '2'))
+# Horas que un archivo de evidencia sin referencias se conserva antes de que
+# `manage.py gc_evidence_files` lo borre (cubre subidas a medio guardar)
+EVIDENCE_GC_GRACE_HOURS = int(os.getenv('EVIDENCE_GC_GRACE_HOURS', '24'))
+# Subidas por partes (tickets.uploads): tamaño máximo de una foto, de cada parte, horas
+# que se guarda una subida sin terminar y carpeta de sus temporales (fuera de MEDIA_ROOT)
+EVIDENCE_UPLOAD_MAX_BYTES = int(os.getenv('EVIDENCE_UPLOAD_MAX_BYTES', str(25 * 1024 * 1024)))
+EVIDENCE_UPLOAD_CHUNK_BYTES = int(os.getenv('EVIDENCE_UPLOAD_CHUNK_BYTES', str(1024 * 1024)))
+EVIDENCE_UPLOAD_TTL_HOURS = int(os.getenv('EVIDENCE_UPLOAD_TTL_HOURS', '24'))
+EVIDENCE_UPLOAD_DIR = os.getenv('EVIDENCE_UPLOAD_DIR', '')
+
+# Channels
+# Sin REDIS_URL se usa la capa en memoria (un solo proceso Daphne, desarrollo).
+# Con REDIS_URL (redis://host:6379/0, rediss://...) se usa channels_redis para
+# repartir los mensajes entre procesos/nodos; sirve cualquier servidor que hable
+# el protocolo Redis (redis-server local, Valkey, etc.).
+CHANNEL_LAYER_CAPACITY = int(os.getenv('CHANNEL_LAYER_CAPACITY', '100'))
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [REDIS_URL],
+                'capacity': CHANNEL_LAYER_CAPACITY,
+                'expiry': 60,
+                'group_expiry': 86400,
+                'prefix': os.getenv('CHANNEL_LAYER_PREFIX', 'pumasp'),
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+            'CONFIG': {
+                'capacity': CHANNEL_LAYER_CAPACITY,
+                'expiry': 60,
+            },
+        }
+    }
 
-# Channels - In-memory layer for development
-CHANNEL_LAYERS = {
+# Caché (KPIs del jefe, secuencias de WebSocket)
+# CACHE_BACKEND: locmem (por proceso), file (directorio compartido entre procesos del
+# mismo servidor) o redis (compartido entre servidores; REDIS_URL por defecto).
+# También acepta la ruta completa de cualquier backend de caché de Django.
+# Con REDIS_URL hay varios procesos y la caché tiene que ser compartida: ahí viven el
+# seq de cada grupo (broadcast), la versión de los KPIs, los no leídos y el rol con que
+# se une cada WebSocket. Por eso es redis por defecto y locmem no se admite.
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'redis' if REDIS_URL else 'locmem')
+if REDIS_URL and CACHE_BACKEND == 'locmem':
+    raise ImproperlyConfigured(
+        'CACHE_BACKEND=locmem no es válido con REDIS_URL (varios procesos): usa redis o file'
+    )
+_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'pumasp'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / '.cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', REDIS_URL or 'redis://127.0.0.1:6379/1'),
+}
+_cache_backend, _cache_location = _CACHE_BACKENDS.get(CACHE_BACKEND, (CACHE_BACKEND, ''))
+CACHES = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-        'CONFIG': {
-            'capacity': 100,
-            'expiry': 60,
-        },
+        'BACKEND': _cache_backend,
+        'LOCATION': os.getenv('CACHE_LOCATION', _cache_location),
     }
 }
+# Vigencia de los KPIs cacheados y ventana en que una entrada invalidada se sigue
+# sirviendo mientras se recalcula en segundo plano (ver gestor_servicios.stats_cache)
+STATS_CACHE_TTL = int(os.getenv('STATS_CACHE_TTL', '300'))
+STATS_CACHE_STALE_SECONDS = int(os.getenv('STATS_CACHE_STALE_SECONDS', '30'))
+
+# Número de sub-grupos en que se reparte ``stats_jefes`` (ver tickets.broadcast):
+# cada conexión entra en uno y los envíos recorren todos, así ningún group_send
+# tiene que iterar sobre todas las conexiones de jefes a la vez.
+STATS_JEFES_SHARDS = int(os.getenv('STATS_JEFES_SHARDS', '1'))
+
+# Ventana (segundos) para agrupar difusiones de cambios de tickets por WebSocket
+# (ver tickets.broadcast): lo confirmado dentro de la ventana sale en un mensaje por
+# grupo. Usa un temporizador en otro hilo, que sirve con capas de red (Redis) pero no
+# con InMemoryChannelLayer: sin REDIS_URL es 0 y cada cambio sale al confirmarse.
+TICKET_BROADCAST_WINDOW = float(os.getenv('TICKET_BROADCAST_WINDOW', '0.05' if REDIS_URL else '0'))
+
+# Búsqueda de texto (ver search.backends): auto = FTS5 en SQLite, GIN en PostgreSQL y
+# el índice invertido en Python en otras bases; también fts5 / postgres / python.
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'auto')
+# Resultados máximos al ordenar por relevancia
+SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', '1000'))
+# Segundos que se guarda cada respuesta del autocompletado de tickets (la clave incluye
+# la versión del índice, así que un cambio la invalida antes)
+SEARCH_LOOKUP_TTL = int(os.getenv('SEARCH_LOOKUP_TTL', '300'))
+
+# Fracción de connect/disconnect/mensajes del WebSocket que se registran (a nivel DEBUG).
+# Las cifras agregadas están en /metricas/ws/ y /metricas/prometheus/.
+WS_LOG_SAMPLE_RATE = float(os.getenv('WS_LOG_SAMPLE_RATE', '0.01'))
+# Token para que Prometheus lea /metricas/prometheus/ sin sesión (Authorization: Bearer ...)
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
 
 # --- App Branding (logo and name) ---
 # You can override these with environment variables or in your .env file
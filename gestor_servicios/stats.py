@@ -0,0 +1,159 @@
+"""Capa de consultas de estadísticas por rol.
+
+Cada función calcula el paquete completo de KPIs de un rol con una o dos consultas
+(agregación condicional sobre ``TicketCounter``) y la comparten ``my_stats`` (HTML)
+y ``my_stats_data`` (JSON). El número de consultas no depende de cuántos técnicos,
+oficinas o tickets existan.
+"""
+from django.db.models import Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from tickets import counters
+from tickets.models import TicketPriority, TicketStatus
+from tickets.workload import office_workload
+from . import stats_cache
+
+
+URGENT_PRIORITIES = [TicketPriority.P4, TicketPriority.P5]  # Alta y Urgente
+OPEN_STATUSES = [TicketStatus.DRAFT, TicketStatus.ASSIGNED, TicketStatus.IN_PROGRESS]
+
+
+def _sum(**filters):
+    """``SUM(count)`` condicional que devuelve 0 en lugar de NULL."""
+    return Coalesce(Sum('count', filter=Q(**filters) if filters else None), Value(0))
+
+
+def status_rows(totals):
+    """Filas ``{code, status, label, total, value}`` en el orden de ``TicketStatus``, omitiendo ceros."""
+    rows = []
+    for choice in TicketStatus:
+        total = totals.get(choice.value, 0)
+        if total:
+            label = choice.label
+            rows.append({
+                'code': choice.value,
+                'status': label,
+                'label': label,
+                'total': total,
+                'value': total,
+            })
+    return rows
+
+
+def _user_name(first, last, username):
+    return f"{first or ''} {last or ''}".strip() or (username or '')
+
+
+def _role_totals(counter_qs, **extra):
+    """Una sola consulta: total por estado, creados hoy y urgentes abiertos (más ``extra``)."""
+    aggregates = {f'status_{choice.value}': _sum(status=choice.value) for choice in TicketStatus}
+    aggregates['hoy'] = _sum(day=timezone.localdate())
+    aggregates['urgentes'] = _sum(priority__in=URGENT_PRIORITIES, status__in=OPEN_STATUSES)
+    for name, filters in extra.items():
+        aggregates[name] = _sum(**filters)
+    result = counter_qs.aggregate(**aggregates)
+    by_status = {choice.value: result.pop(f'status_{choice.value}') for choice in TicketStatus}
+    result['by_status'] = by_status
+    result['total'] = sum(by_status.values())
+    return result
+
+
+def jefe_bundle(office_id=None, technician_id=None, start=None, end=None, statuses=None):
+    """KPIs del jefe (opcionalmente filtrados) en una única consulta agrupada.
+
+    Se agrupa por estado × oficina × técnico × supervisor y los desgloses se
+    acumulan en Python: el resultado tiene O(dimensiones) filas, no O(tickets).
+    """
+    qs = counters.counter_queryset(
+        office_id=office_id, technician_id=technician_id,
+        start=start, end=end, statuses=statuses,
+    )
+    rows = (
+        qs.values(
+            'status', 'assigned_office_id', 'assigned_office__name',
+            'technician_id', 'technician__first_name', 'technician__last_name', 'technician__username',
+            'supervisor_id', 'supervisor__first_name', 'supervisor__last_name', 'supervisor__username',
+        )
+        .annotate(total=Sum('count'))
+        .order_by()
+    )
+    by_status = {}
+    by_office = {}
+    by_technician = {}
+    by_supervisor = {}
+    for row in rows:
+        total = row['total']
+        by_status[row['status']] = by_status.get(row['status'], 0) + total
+        entry = by_office.setdefault(row['assigned_office_id'], {
+            'assigned_office_id': row['assigned_office_id'],
+            'assigned_office__name': row['assigned_office__name'],
+            'total': 0,
+        })
+        entry['total'] += total
+        if row['technician_id']:
+            entry = by_technician.setdefault(row['technician_id'], {
+                'technician_id': row['technician_id'],
+                'name': _user_name(row['technician__first_name'], row['technician__last_name'], row['technician__username']),
+                'total': 0,
+            })
+            entry['total'] += total
+        if row['supervisor_id']:
+            entry = by_supervisor.setdefault(row['supervisor_id'], {
+                'supervisor_id': row['supervisor_id'],
+                'name': _user_name(row['supervisor__first_name'], row['supervisor__last_name'], row['supervisor__username']),
+                'total': 0,
+            })
+            entry['total'] += total
+
+    return {
+        'total': sum(by_status.values()),
+        'by_status': by_status,
+        'by_office': sorted(by_office.values(), key=lambda r: -r['total']),
+        'by_technician': sorted(by_technician.values(), key=lambda r: -r['total']),
+        'by_supervisor': sorted(by_supervisor.values(), key=lambda r: -r['total']),
+    }
+
+
+def cached_jefe_bundle(office_id=None, technician_id=None, start=None, end=None, statuses=None):
+    """``jefe_bundle`` servido desde ``stats_cache`` (compartido por todos los jefes)."""
+    normalized = stats_cache.normalize(
+        office_id, technician_id, start, end, statuses, all_statuses=TicketStatus.values,
+    )
+    statuses = list(normalized[4])
+    return stats_cache.get_or_compute(
+        'jefe', normalized,
+        stats_cache.version_keys(office_id, statuses),
+        lambda: jefe_bundle(office_id, technician_id, start, end, statuses),
+    )
+
+
+def supervisor_bundle(user):
+    """KPIs del supervisor de una oficina: dos consultas sin importar cuántos técnicos tenga."""
+    if not user.office_id:
+        return {
+            'total': 0, 'by_status': {}, 'hoy': 0, 'urgentes': 0, 'mis_supervisados': 0,
+            'tecnicos': [], 'top_tecnico': None, 'top_tecnico_total': 0,
+        }
+    office_id = user.office_id
+    result = _role_totals(
+        counters.counter_queryset(office_id=office_id),
+        mis_supervisados={'supervisor_id': user.id},
+    )
+
+    # Matriz técnico × estado en una consulta agrupada
+    tecnicos = office_workload(office_id)
+    result['tecnicos'] = tecnicos
+    top = max(tecnicos, key=lambda t: t.completados_oficina, default=None)
+    if top is not None and top.completados_oficina:
+        result['top_tecnico'] = top
+        result['top_tecnico_total'] = top.completados_oficina
+    else:
+        result['top_tecnico'] = None
+        result['top_tecnico_total'] = 0
+    return result
+
+
+def tecnico_bundle(user):
+    """KPIs personales del técnico en una sola consulta."""
+    return _role_totals(counters.counter_queryset(technician_id=user.id))
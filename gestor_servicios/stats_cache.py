@@ -0,0 +1,147 @@
+"""Caché de los KPIs del jefe (``dashboard`` y ``my_stats_data``).
+
+La clave es la tupla de filtros normalizada (oficina, técnico, inicio, fin, estados).
+Cada entrada guarda las versiones de los ámbitos que la cubren: global, oficina,
+estado u oficina×estado según los filtros, más una época común. ``tickets.signals``
+sube las versiones de la oficina y el estado de cada cambio después del commit, de
+modo que un cambio en la oficina A no invalida lo filtrado por la oficina B.
+
+Una entrada con versiones viejas calculada hace menos de ``STATS_CACHE_STALE_SECONDS``
+se sigue sirviendo mientras un hilo la recalcula (stale-while-revalidate).
+Contadores ``stats_cache.*`` en ``/metricas/``.
+"""
+import hashlib
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+EPOCH_KEY = 'stats:v:epoch'
+
+
+def _ttl():
+    return getattr(settings, 'STATS_CACHE_TTL', 300)
+
+
+def _stale_seconds():
+    return getattr(settings, 'STATS_CACHE_STALE_SECONDS', 30)
+
+
+def _bump(key):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:  # desalojada entre add() e incr()
+        cache.set(key, int(time.time() * 1000), None)
+
+
+def version_keys(office_id=None, statuses=()):
+    """Claves de versión que cubren una consulta con estos filtros."""
+    keys = [EPOCH_KEY]
+    if office_id is not None and statuses:
+        keys += [f'stats:v:office:{office_id}:status:{status}' for status in statuses]
+    elif office_id is not None:
+        keys.append(f'stats:v:office:{office_id}')
+    elif statuses:
+        keys += [f'stats:v:status:{status}' for status in statuses]
+    else:
+        keys.append('stats:v:all')
+    return keys
+
+
+def versions(keys):
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Arranca en un valor distinto tras un desalojo para no coincidir con entradas viejas
+            cache.add(key, int(time.time() * 1000), None)
+            found[key] = cache.get(key)
+    return tuple(found[key] for key in keys)
+
+
+def invalidate(dims_list):
+    """Sube las versiones afectadas por un cambio (dims de ``tickets.counters`` antes/después)."""
+    keys = {'stats:v:all'}
+    for dims in dims_list:
+        if not dims:
+            continue
+        office_id, status = dims['assigned_office_id'], dims['status']
+        keys.update({
+            f'stats:v:office:{office_id}',
+            f'stats:v:status:{status}',
+            f'stats:v:office:{office_id}:status:{status}',
+        })
+    for key in keys:
+        _bump(key)
+    metrics.inc('stats_cache.invalidations')
+
+
+def invalidate_all():
+    _bump(EPOCH_KEY)
+    metrics.inc('stats_cache.invalidations')
+
+
+def normalize(office_id=None, technician_id=None, start=None, end=None, statuses=None, all_statuses=()):
+    """Tupla canónica de filtros: mismos filtros en otro orden comparten entrada."""
+    statuses = tuple(sorted(set(statuses or ())))
+    if all_statuses and set(statuses) >= set(all_statuses):
+        statuses = ()  # todos los estados marcados == sin filtro
+    return (
+        office_id,
+        technician_id,
+        start.isoformat() if start else '',
+        end.isoformat() if end else '',
+        statuses,
+    )
+
+
+def _cache_key(name, normalized):
+    digest = hashlib.md5(repr(normalized).encode()).hexdigest()
+    return f'stats:{name}:{digest}'
+
+
+def _store(key, keys, compute):
+    current = versions(keys)
+    value = compute()
+    cache.set(key, {'versions': current, 'value': value, 'at': time.time()}, _ttl())
+    return value
+
+
+def _revalidate(key, keys, compute):
+    if not cache.add(f'{key}:lock', 1, 60):
+        return  # ya hay otro recálculo en curso
+
+    def run():
+        try:
+            _store(key, keys, compute)
+            metrics.inc('stats_cache.revalidations')
+        except Exception:
+            logger.exception('Error recalculando %s', key)
+        finally:
+            cache.delete(f'{key}:lock')
+            connections.close_all()
+
+    threading.Thread(target=run, daemon=True).start()
+
+
+def get_or_compute(name, normalized, keys, compute):
+    """Valor cacheado de ``compute()`` para ``normalized`` vigente según ``keys``."""
+    key = _cache_key(name, normalized)
+    entry = cache.get(key)
+    if entry is not None:
+        if entry['versions'] == versions(keys):
+            metrics.inc('stats_cache.hits')
+            return entry['value']
+        if time.time() - entry['at'] <= _stale_seconds():
+            metrics.inc('stats_cache.stale_hits')
+            _revalidate(key, keys, compute)
+            return entry['value']
+    metrics.inc('stats_cache.misses')
+    return _store(key, keys, compute)
@@ -29,6 +29,9 @@ urlpatterns = [
     path('estadisticas/', core_views.my_stats, name='my_stats'),
     path('estadisticas/data/', core_views.my_stats_data, name='my_stats_data'),
     path('estadisticas/technicians/', core_views.get_technicians_by_office, name='get_technicians_by_office'),
+    path('metricas/', core_views.metrics_view, name='metrics'),
+    path('metricas/ws/', core_views.ws_metrics_view, name='ws_metrics'),
+    path('metricas/prometheus/', core_views.metrics_prometheus, name='metrics_prometheus'),
     path('accounts/', include('accounts.urls')),
     path('oficinas/', include('oficinas.urls')),
     path('tickets/', include('tickets.urls')),
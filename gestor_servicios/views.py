@@ -1,11 +1,19 @@
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
+from accounts import outbox
 from accounts.models import CustomUser
 from oficinas.models import Office
+from tickets import jobs, uploads
 from tickets.models import Ticket, TicketStatus
-from django.db.models import Count, Q
-from datetime import date
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from . import consumers, metrics, stats, stats_cache
+from .conditional import conditional, directory_version
+from .dates import parse_date
 import json
 
 
@@ -21,36 +29,23 @@ def dashboard(request):
     end_str = request.GET.get('end')
     statuses = request.GET.getlist('status')  # puede ser múltiple
 
-    qs = Ticket.objects.all()
+    # Validar fechas (días locales; ver gestor_servicios.dates)
+    start = parse_date(start_str)
+    end = parse_date(end_str)
 
-    # Validar y aplicar fechas
-    start = None
-    end = None
-    try:
-        if start_str:
-            start = date.fromisoformat(start_str)
-            qs = qs.filter(created_at__date__gte=start)
-    except Exception:
-        start = None
-    try:
-        if end_str:
-            end = date.fromisoformat(end_str)
-            qs = qs.filter(created_at__date__lte=end)
-    except Exception:
-        end = None
-
-    # Validar y aplicar estados
+    # Validar estados
     valid_status_codes = {choice.value for choice in TicketStatus}
     if statuses:
         statuses = [s for s in statuses if s in valid_status_codes]
-        if statuses:
-            qs = qs.filter(status__in=statuses)
 
-    by_status = qs.values('status').annotate(total=Count('id')).order_by()
-    by_office = qs.values('assigned_office__name').annotate(total=Count('id')).order_by('-total')
-    pending_count = qs.filter(status__in=[TicketStatus.DRAFT, TicketStatus.ASSIGNED]).count()
-    in_progress_count = qs.filter(status=TicketStatus.IN_PROGRESS).count()
-    completed_count = qs.filter(status=TicketStatus.COMPLETED).count()
+    # Una sola consulta agrupada sobre los contadores (ver gestor_servicios.stats)
+    bundle = stats.cached_jefe_bundle(start=start, end=end, statuses=statuses)
+    status_totals = bundle['by_status']
+    by_status = [{'status': code, 'total': total} for code, total in status_totals.items()]
+    by_office = bundle['by_office']
+    pending_count = status_totals.get(TicketStatus.DRAFT, 0) + status_totals.get(TicketStatus.ASSIGNED, 0)
+    in_progress_count = status_totals.get(TicketStatus.IN_PROGRESS, 0)
+    completed_count = status_totals.get(TicketStatus.COMPLETED, 0)
     # Dashboard JSON payload for charts
     status_data = []
     for row in by_status:
@@ -82,8 +77,8 @@ def dashboard(request):
     ]
 
     context = {
-        'total_tickets': Ticket.objects.count(),  # total global
-        'total_tickets_filtered': qs.count(),      # total según filtros
+        'total_tickets': stats.cached_jefe_bundle()['total'],  # total global
+        'total_tickets_filtered': bundle['total'],  # total según filtros
         'pending_count': pending_count,
         'in_progress_count': in_progress_count,
         'completed_count': completed_count,
@@ -104,43 +99,22 @@ def dashboard(request):
 def my_stats(request):
     user = request.user
     context = {}
-    # Helper para mostrar etiquetas legibles de estado
-    def label_status_rows(rows):
-        labeled = []
-        for row in rows:
-            code = row['status']
-            try:
-                label = TicketStatus(code).label
-            except Exception:
-                label = code
-            # Expose human label under 'status' to match templates (e.g., 'COMPLETADO'),
-            # keep original code separately for potential programmatic use.
-            labeled.append({
-                'code': code,
-                'status': label,
-                'total': row['total'],
-                'label': label,
-                'value': row['total'],
-            })
-        return labeled
-    
     # Put role and optional IDs for client-side logic
     stats_payload = { 'userRole': 'NONE' }
     if user.is_jefe:
         context['role'] = 'JEFE'
         # KPIs generales
-        context['total_tickets'] = Ticket.objects.count()
-        by_status_raw = Ticket.objects.values('status').annotate(total=Count('id')).order_by()
-        context['by_status'] = label_status_rows(by_status_raw)
+        bundle = stats.cached_jefe_bundle()
+        context['total_tickets'] = bundle['total']
+        context['by_status'] = stats.status_rows(bundle['by_status'])
         stats_payload['userRole'] = 'JEFE'
         stats_payload['byStatus'] = context['by_status']
         
-        by_office_raw = Ticket.objects.values('assigned_office__name').annotate(total=Count('id')).order_by('-total')
         by_office_formatted = [
             {'label': row['assigned_office__name'] or 'Sin oficina', 'value': row['total']} 
-            for row in by_office_raw
+            for row in bundle['by_office']
         ]
-        context['by_office'] = by_office_raw  # para mostrar en HTML
+        context['by_office'] = bundle['by_office']  # para mostrar en HTML
         stats_payload['byOffice'] = by_office_formatted
         
         # Agregar listas para filtros
@@ -155,80 +129,51 @@ def my_stats(request):
     elif user.is_supervisor:
         context['role'] = 'SUPERVISOR'
         # Solo de su oficina
-        qs = Ticket.objects.filter(assigned_office=user.office)
+        bundle = stats.supervisor_bundle(user)
         context['oficina'] = user.office
         context['office_id'] = getattr(user.office, 'id', None)
-        context['asignados_oficina'] = qs.count()
-        por_estado_raw = qs.values('status').annotate(total=Count('id')).order_by()
-        context['por_estado'] = label_status_rows(por_estado_raw)
+        context['asignados_oficina'] = bundle['total']
+        context['por_estado'] = stats.status_rows(bundle['by_status'])
         stats_payload['userRole'] = 'SUPERVISOR'
         stats_payload['porEstado'] = context['por_estado']
         
-        context['tecnicos_activos'] = CustomUser.objects.filter(office=user.office, role='TECNICO').count()
-        context['mis_supervisados'] = qs.filter(supervisor=user).count()
+        context['tecnicos_activos'] = len(bundle['tecnicos'])
+        context['mis_supervisados'] = bundle['mis_supervisados']
         # Técnico con más tickets completados en su oficina
-        if user.office:
-            top_row = qs.filter(status='COMPLETED', technician__isnull=False) \
-                .values('technician') \
-                .annotate(total=Count('id')) \
-                .order_by('-total') \
-                .first()
-            if top_row:
-                try:
-                    context['top_tecnico'] = CustomUser.objects.get(id=top_row['technician'])
-                    context['top_tecnico_total'] = top_row['total']
-                except CustomUser.DoesNotExist:
-                    context['top_tecnico'] = None
-                    context['top_tecnico_total'] = 0
-            else:
-                context['top_tecnico'] = None
-                context['top_tecnico_total'] = 0
-        else:
-            context['top_tecnico'] = None
-            context['top_tecnico_total'] = 0
+        context['top_tecnico'] = bundle['top_tecnico']
+        context['top_tecnico_total'] = bundle['top_tecnico_total']
             
         # Información adicional para supervisor
         if user.office:
-            # Tickets del día para la oficina
-            from datetime import date
-            today = date.today()
-            context['tickets_hoy_oficina'] = qs.filter(created_at__date=today).count()
-            
-            # Tickets urgentes de la oficina
-            context['tickets_urgentes_oficina'] = qs.filter(
-                priority__in=[TicketPriority.P4, TicketPriority.P5],  # Alta y Urgente
-                status__in=['DRAFT', 'ASSIGNED', 'IN_PROGRESS']
-            ).count()
+            context['tickets_hoy_oficina'] = bundle['hoy']
+            context['tickets_urgentes_oficina'] = bundle['urgentes']
             
             # Lista de técnicos con sus estadísticas básicas
-            tecnicos_stats = []
-            tecnicos_oficina = CustomUser.objects.filter(office=user.office, role='TECNICO')
-            for tecnico in tecnicos_oficina:
-                tecnico_tickets = Ticket.objects.filter(technician=tecnico)
-                tecnicos_stats.append({
+            context['tecnicos_stats'] = [
+                {
                     'tecnico': tecnico,
-                    'asignados': tecnico_tickets.count(),
-                    'completados': tecnico_tickets.filter(status='COMPLETED').count(),
-                    'en_progreso': tecnico_tickets.filter(status='IN_PROGRESS').count()
-                })
-            context['tecnicos_stats'] = tecnicos_stats
+                    'asignados': tecnico.asignados,
+                    'completados': tecnico.completados,
+                    'en_progreso': tecnico.en_progreso,
+                }
+                for tecnico in bundle['tecnicos']
+            ]
             
             # Últimos tickets asignados a la oficina
-            context['ultimos_tickets_oficina'] = qs.select_related('technician').order_by('-created_at')[:5]
+            context['ultimos_tickets_oficina'] = Ticket.objects.filter(assigned_office=user.office).select_related('technician').order_by('-created_at')[:5]
             
     elif user.is_tecnico:
         context['role'] = 'TECNICO'
-        qs = Ticket.objects.filter(technician=user)
+        bundle = stats.tecnico_bundle(user)
         context['tech_id'] = user.id
-        context['asignados'] = qs.count()
-        por_estado_raw = qs.values('status').annotate(total=Count('id')).order_by()
-        context['por_estado'] = label_status_rows(por_estado_raw)
+        context['asignados'] = bundle['total']
+        context['por_estado'] = stats.status_rows(bundle['by_status'])
         stats_payload['userRole'] = 'TECNICO'
         stats_payload['porEstado'] = context['por_estado']
         stats_payload['totalAsignados'] = context['asignados']
         
-        context['completados'] = qs.filter(status='COMPLETED').count()
-        context['pendientes_insumos'] = qs.filter(status='PENDING_SUPPLIES').count()
+        context['completados'] = bundle['by_status'][TicketStatus.COMPLETED]
+        context['pendientes_insumos'] = bundle['by_status'][TicketStatus.PENDING_SUPPLIES]
         stats_payload['completados'] = context['completados']
         
         # Información de oficina del técnico
@@ -247,20 +192,12 @@ def my_stats(request):
             context['companeros_tecnicos'] = 0
             context['supervisor_oficina'] = None
         
-        # Tickets del día actual (creados hoy)
-        from datetime import date
-        today = date.today()
-        context['tickets_hoy'] = qs.filter(created_at__date=today).count()
-        
-        # Tickets urgentes asignados al técnico (sin completar)
-        from tickets.models import TicketPriority
-        context['tickets_urgentes'] = qs.filter(
-            priority__in=[TicketPriority.P4, TicketPriority.P5],  # Alta y Urgente
-            status__in=['DRAFT', 'ASSIGNED', 'IN_PROGRESS']
-        ).count()
+        # Tickets creados hoy y urgentes sin completar
+        context['tickets_hoy'] = bundle['hoy']
+        context['tickets_urgentes'] = bundle['urgentes']
         
         # Últimos 3 tickets asignados
-        context['ultimos_tickets'] = qs.select_related('assigned_office').order_by('-created_at')[:3]
+        context['ultimos_tickets'] = Ticket.objects.filter(technician=user).select_related('assigned_office').order_by('-created_at')[:3]
     else:
         context['role'] = 'NONE'
         # Sin rol asignado
@@ -269,7 +206,30 @@ def my_stats(request):
     return render(request, 'my_stats.html', context)
 
 
+def _tickets_stamp(qs):
+    stamp = qs.aggregate(last=Max('updated_at'), total=Count('id'))
+    return (stamp['last'], stamp['total']), stamp['last']
+
+
+def my_stats_stamp(request):
+    user = request.user
+    common = (directory_version(), timezone.localdate())  # 'hoy' cambia con el día
+    if user.is_jefe:
+        # Las mismas versiones que invalidan la caché de KPIs; sin consultas
+        return (stats_cache.versions(stats_cache.version_keys()),) + common, None
+    if user.is_supervisor:
+        if not user.office_id:
+            return None
+        parts, last = _tickets_stamp(Ticket.objects.filter(assigned_office_id=user.office_id))
+    elif user.is_tecnico:
+        parts, last = _tickets_stamp(Ticket.objects.filter(technician=user))
+    else:
+        return None
+    return parts + common, last
+
+
 @login_required
+@conditional(my_stats_stamp)
 def my_stats_data(request):
     user = request.user
     # Build JSON payload per role with the same fields used in the template
@@ -281,114 +241,57 @@ def my_stats_data(request):
         end_str = request.GET.get('end')
         statuses = request.GET.getlist('status')  # puede ser múltiple
         
-        # Base queryset
-        tickets_qs = Ticket.objects.all()
-        
-        # Aplicar filtros
+        # Validar filtros
+        office_filter = None
+        technician_filter = None
         if office_id and office_id != 'all':
             try:
                 office_id = int(office_id)
-                tickets_qs = tickets_qs.filter(assigned_office_id=office_id)
+                office_filter = office_id
             except (ValueError, TypeError):
                 pass
                 
         if technician_id and technician_id != 'all':
             try:
                 technician_id = int(technician_id)
-                tickets_qs = tickets_qs.filter(technician_id=technician_id)
+                technician_filter = technician_id
             except (ValueError, TypeError):
                 pass
-        # Fechas (ISO yyyy-mm-dd) sobre created_at__date
-        from datetime import date
-        try:
-            if start_str:
-                start = date.fromisoformat(start_str)
-                tickets_qs = tickets_qs.filter(created_at__date__gte=start)
-        except Exception:
-            start = None
-        try:
-            if end_str:
-                end = date.fromisoformat(end_str)
-                tickets_qs = tickets_qs.filter(created_at__date__lte=end)
-        except Exception:
-            end = None
+        # Fechas (ISO yyyy-mm-dd) sobre el día local de creación
+        start = parse_date(start_str)
+        end = parse_date(end_str)
         # Estados
         valid_status_codes = {choice.value for choice in TicketStatus}
         if statuses:
             statuses = [s for s in statuses if s in valid_status_codes]
-            if statuses:
-                tickets_qs = tickets_qs.filter(status__in=statuses)
         
-        by_status = list(tickets_qs.values('status').annotate(total=Count('id')).order_by())
-        try:
-            by_status = [
-                {'status': TicketStatus(row['status']).label, 'total': row['total'], 'code': row['status']}
-                for row in by_status
-            ]
-        except Exception:
-            pass
-        by_office = list(
-            tickets_qs.values('assigned_office__name').annotate(total=Count('id')).order_by('-total')
+        bundle = stats.cached_jefe_bundle(
+            office_id=office_filter, technician_id=technician_filter,
+            start=start, end=end, statuses=statuses,
         )
+        by_status = [
+            {'status': row['status'], 'total': row['total'], 'code': row['code']}
+            for row in stats.status_rows(bundle['by_status'])
+        ]
 
         # Distribuciones adicionales
-        by_technician = []
-        by_supervisor = []
         # Por técnico: tiene sentido cuando hay oficina concreta seleccionada
-        if office_id and office_id != 'all':
-            by_technician_qs = (
-                tickets_qs
-                .filter(technician__isnull=False)
-                .values('technician_id',
-                        'technician__first_name', 'technician__last_name', 'technician__username')
-                .annotate(total=Count('id'))
-                .order_by('-total')
-            )
-            for row in by_technician_qs:
-                first = row.get('technician__first_name') or ''
-                last = row.get('technician__last_name') or ''
-                uname = row.get('technician__username') or ''
-                full_name = (first + ' ' + last).strip() or uname
-                by_technician.append({
-                    'technician_id': row.get('technician_id'),
-                    'name': full_name,
-                    'total': row.get('total', 0),
-                })
+        by_technician = bundle['by_technician'] if office_filter is not None else []
         # Por supervisor: incluir siempre (respetando otros filtros aplicados)
-        try:
-            by_supervisor_qs = (
-                tickets_qs
-                .filter(supervisor__isnull=False)
-                .values('supervisor_id',
-                        'supervisor__first_name', 'supervisor__last_name', 'supervisor__username')
-                .annotate(total=Count('id'))
-                .order_by('-total')
-            )
-            for row in by_supervisor_qs:
-                first = row.get('supervisor__first_name') or ''
-                last = row.get('supervisor__last_name') or ''
-                uname = row.get('supervisor__username') or ''
-                full_name = (first + ' ' + last).strip() or uname
-                by_supervisor.append({
-                    'supervisor_id': row.get('supervisor_id'),
-                    'name': full_name,
-                    'total': row.get('total', 0),
-                })
-        except Exception:
-            by_supervisor = []
+        by_supervisor = bundle['by_supervisor']
         
         # Estadísticas adicionales para filtros
         filter_info = {}
-        if office_id and office_id != 'all':
+        if office_filter is not None:
             try:
-                office = Office.objects.get(id=office_id)
+                office = Office.objects.get(id=office_filter)
                 filter_info['office_name'] = office.name
             except Office.DoesNotExist:
                 pass
                 
-        if technician_id and technician_id != 'all':
+        if technician_filter is not None:
             try:
-                tech = CustomUser.objects.get(id=technician_id)
+                tech = CustomUser.objects.get(id=technician_filter)
                 filter_info['technician_name'] = tech.get_full_name() or tech.username
             except CustomUser.DoesNotExist:
                 pass
@@ -403,13 +306,14 @@ def my_stats_data(request):
         
         payload = {
             'role': 'JEFE',
-            'total_tickets': tickets_qs.count(),
+            'total_tickets': bundle['total'],
             'by_status': by_status,
             'by_office': [
                 {
+                    'office_id': row['assigned_office_id'],
                     'office': row['assigned_office__name'] or '(Sin oficina)',
                     'total': row['total']
-                } for row in by_office
+                } for row in bundle['by_office']
             ],
             'filter_info': filter_info,
             'filters': filters_payload,
@@ -420,61 +324,61 @@ def my_stats_data(request):
             payload['by_supervisor'] = by_supervisor
         return JsonResponse(payload)
     elif user.is_supervisor:
-        qs = Ticket.objects.filter(assigned_office=user.office)
-        por_estado = list(qs.values('status').annotate(total=Count('id')).order_by())
-        try:
-            por_estado = [
-                {'status': TicketStatus(row['status']).label, 'total': row['total']}
-                for row in por_estado
-            ]
-        except Exception:
-            pass
-        # top tecnico
-        top_row = qs.filter(status='COMPLETED', technician__isnull=False).values('technician').annotate(total=Count('id')).order_by('-total').first()
+        bundle = stats.supervisor_bundle(user)
         top_tecnico = None
-        if top_row:
-            try:
-                tech = CustomUser.objects.get(id=top_row['technician'])
-                top_tecnico = {
-                    'id': tech.id,
-                    'name': tech.get_full_name() or tech.username,
-                    'email': tech.email,
-                    'total': top_row['total'],
-                }
-            except CustomUser.DoesNotExist:
-                top_tecnico = None
+        tech = bundle['top_tecnico']
+        if tech is not None:
+            top_tecnico = {
+                'id': tech.id,
+                'name': tech.get_full_name() or tech.username,
+                'email': tech.email,
+                'total': bundle['top_tecnico_total'],
+            }
         return JsonResponse({
             'role': 'SUPERVISOR',
             'office': {'id': getattr(user.office, 'id', None), 'name': getattr(user.office, 'name', '')},
-            'asignados_oficina': qs.count(),
-            'por_estado': por_estado,
-            'tecnicos_activos': CustomUser.objects.filter(office=user.office, role='TECNICO').count(),
-            'mis_supervisados': qs.filter(supervisor=user).count(),
+            'asignados_oficina': bundle['total'],
+            'por_estado': [
+                {'status': row['status'], 'total': row['total'], 'code': row['code']}
+                for row in stats.status_rows(bundle['by_status'])
+            ],
+            'tecnicos_activos': len(bundle['tecnicos']),
+            'mis_supervisados': bundle['mis_supervisados'],
             'top_tecnico': top_tecnico,
         })
     elif user.is_tecnico:
-        qs = Ticket.objects.filter(technician=user)
-        por_estado = list(qs.values('status').annotate(total=Count('id')).order_by())
-        try:
-            por_estado = [
-                {'status': TicketStatus(row['status']).label, 'total': row['total']}
-                for row in por_estado
-            ]
-        except Exception:
-            pass
+        bundle = stats.tecnico_bundle(user)
         return JsonResponse({
             'role': 'TECNICO',
-            'asignados': qs.count(),
-            'por_estado': por_estado,
-            'completados': qs.filter(status='COMPLETED').count(),
-            'pendientes_insumos': qs.filter(status='PENDING_SUPPLIES').count(),
+            'asignados': bundle['total'],
+            'por_estado': [
+                {'status': row['status'], 'total': row['total'], 'code': row['code']}
+                for row in stats.status_rows(bundle['by_status'])
+            ],
+            'completados': bundle['by_status'][TicketStatus.COMPLETED],
+            'pendientes_insumos': bundle['by_status'][TicketStatus.PENDING_SUPPLIES],
             'tech_id': user.id,
         })
     else:
         return JsonResponse({'role': 'NONE'})
 
 
+def technicians_stamp(request):
+    if not request.user.is_jefe:
+        return None
+    office_id = request.GET.get('office_id')
+    if office_id and office_id != 'all':
+        try:
+            # Entran también técnicos que aparecen en tickets de la oficina
+            parts, last = _tickets_stamp(Ticket.objects.filter(assigned_office_id=int(office_id)))
+        except (ValueError, TypeError):
+            return None
+        return parts + (directory_version(),), None
+    return (directory_version(),), None
+
+
 @login_required
+@conditional(technicians_stamp)
 def get_technicians_by_office(request):
     """Endpoint para obtener técnicos filtrados por oficina"""
     if not request.user.is_jefe:
@@ -527,4 +431,60 @@ def get_technicians_by_office(request):
     
     return JsonResponse({
         'technicians': technicians_data
-    })
\ No newline at end of file
+    })
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def metrics_view(request):
+    """Métricas internas del proceso (solo staff)"""
+    return JsonResponse({
+        'metrics': metrics.snapshot(),
+        'outbox': outbox.queue_stats(),
+        'jobs': jobs.queue_stats(),
+        'uploads': uploads.stats(),
+    })
+
+
+WS_RATES = ('ws.messages_sent', 'ws.messages_delivered', 'ws.messages_dropped', 'ws.messages_filtered', 'ws.messages_received')
+
+
+def _timing(name):
+    count = metrics.get(f'{name}.count')
+    return {
+        'count': count,
+        'avg_ms': round(metrics.get(f'{name}.sum') / count * 1000, 3) if count else 0,
+        'max_ms': round(metrics.get(f'{name}.max') * 1000, 3),
+        'buckets': metrics.histogram(name),
+    }
+
+
+@login_required
+@user_passes_test(lambda u: u.is_staff)
+def ws_metrics_view(request):
+    """Conexiones WebSocket de este proceso: presencia, grupos, ritmo de mensajes y latencias (solo staff)"""
+    gauges = metrics.gauges('ws.')
+    names = dict(CustomUser.objects.filter(id__in=list(consumers.presence)).values_list('id', 'username'))
+    handlers = sorted({
+        name[len('ws.handler.'):-len('_seconds.count')]
+        for name in metrics.snapshot() if name.startswith('ws.handler.') and name.endswith('_seconds.count')
+    })
+    return JsonResponse({
+        'connections': gauges.get('ws.connections', 0),
+        'users_online': gauges.get('ws.users_online', 0),
+        'groups': gauges.get('ws.group_connections', {}),
+        'presence': {names.get(user_id, str(user_id)): n for user_id, n in consumers.presence.most_common(100)},
+        'per_second': {name[len('ws.'):]: round(metrics.rate(name), 3) for name in WS_RATES},
+        'send': _timing('ws.send_seconds'),
+        'delivery': _timing('ws.delivery_seconds'),
+        'handlers': {name: _timing(f'ws.handler.{name}_seconds') for name in handlers},
+    })
+
+
+def metrics_prometheus(request):
+    """Métricas del proceso en formato Prometheus: staff con sesión o ``Authorization: Bearer <METRICS_TOKEN>``"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    auth = request.headers.get('Authorization', '')
+    if not (token and constant_time_compare(auth, f'Bearer {token}')):
+        if not (request.user.is_authenticated and request.user.is_staff):
+            raise PermissionDenied
+    return HttpResponse(metrics.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
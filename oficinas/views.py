@@ -7,6 +7,7 @@ from django.core.paginator import Paginator
 from django.db import models
 from .models import Office
 from accounts.decorators import jefe_required
+from search import index as search_index
 
 def is_jefe(user):
 	return user.is_authenticated and user.is_jefe
@@ -25,7 +26,7 @@ def index(request):
 	supervisor = request.GET.get('supervisor')
 
 	if q:
-		qs = qs.filter(models.Q(name__icontains=q) | models.Q(description__icontains=q))
+		qs = search_index.filter_queryset(qs, q, ['office'])
 	if supervisor:
 		qs = qs.filter(supervisor_id=supervisor)
 
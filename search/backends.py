@@ -0,0 +1,156 @@
+"""Motores del índice de búsqueda sobre ``SearchDocument``.
+
+- ``fts5`` (SQLite): tabla virtual ``search_fts`` de contenido externo, mantenida por
+  triggers sobre ``search_searchdocument``; ranking BM25 con el título pesando más.
+- ``postgres``: índice GIN sobre ``setweight(to_tsvector('simple', title), 'A') ||
+  setweight(to_tsvector('simple', body), 'B')``; ranking ``ts_rank``. Configuración
+  ``simple`` porque el texto llega ya analizado (``search.text``).
+- ``python``: índice invertido en ``SearchToken`` para cualquier otra base de datos.
+
+Todas buscan cada término como prefijo (``impre`` encuentra ``impresora``) y exigen
+todos los términos. ``SEARCH_BACKEND`` (``auto`` por defecto) fuerza uno.
+"""
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.functions import Coalesce
+from django.db.models.expressions import RawSQL
+
+from .models import SearchDocument, SearchToken
+
+FTS_TABLE = 'search_fts'
+DOC_TABLE = SearchDocument._meta.db_table
+PG_VECTOR = (
+    "(setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B'))"
+)
+TITLE_WEIGHT = 3  # motor python: un término del título cuenta como tres del cuerpo
+
+
+def _scope(within, alias):
+    """Condición SQL para quedarse con los documentos cuyo objeto (o ticket) está en ``within``."""
+    if within is None:
+        return '', []
+    sql, params = within.order_by().values('pk').query.sql_with_params()
+    return f' AND COALESCE({alias}.parent_id, {alias}.object_id) IN ({sql})', list(params)
+
+
+def token_weights(document):
+    """Términos de un documento con su peso para ``SearchToken`` (motor python)."""
+    counts = defaultdict(int)
+    for term in document.title.split():
+        counts[term] += TITLE_WEIGHT
+    for term in document.body.split():
+        counts[term] += 1
+    return counts
+
+
+class Fts5Backend:
+    name = 'fts5'
+    maintains_tokens = False
+
+    def _expression(self, terms):
+        return ' '.join(f'"{term}"*' for term in terms)
+
+    def match(self, terms):
+        return Q(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [self._expression(terms)]))
+
+    def ranked(self, terms, kinds, limit, within=None):
+        placeholders = ', '.join(['%s'] * len(kinds))
+        scope, scope_params = _scope(within, 'd')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT d.kind, d.object_id, d.parent_id FROM {FTS_TABLE} '
+                f'JOIN {DOC_TABLE} d ON d.id = {FTS_TABLE}.rowid '
+                f'WHERE {FTS_TABLE} MATCH %s AND d.kind IN ({placeholders}){scope} '
+                f'ORDER BY bm25({FTS_TABLE}, 10.0, 1.0) LIMIT %s',
+                [self._expression(terms), *kinds, *scope_params, limit],
+            )
+            return cursor.fetchall()
+
+    def store(self, documents):
+        pass  # los triggers mantienen search_fts
+
+
+class PostgresBackend:
+    name = 'postgres'
+    maintains_tokens = False
+
+    def _query(self, terms):
+        return ' & '.join(f'{term}:*' for term in terms)
+
+    def match(self, terms):
+        return Q(id__in=RawSQL(
+            f"SELECT id FROM {DOC_TABLE} WHERE {PG_VECTOR} @@ to_tsquery('simple', %s)", [self._query(terms)],
+        ))
+
+    def ranked(self, terms, kinds, limit, within=None):
+        scope, scope_params = _scope(within, DOC_TABLE)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT kind, object_id, parent_id FROM {DOC_TABLE}, to_tsquery('simple', %s) query "
+                f"WHERE {PG_VECTOR} @@ query AND kind = ANY(%s){scope} "
+                f"ORDER BY ts_rank({PG_VECTOR}, query) DESC LIMIT %s",
+                [self._query(terms), list(kinds), *scope_params, limit],
+            )
+            return cursor.fetchall()
+
+    def store(self, documents):
+        pass  # el índice GIN es de expresión: se actualiza solo
+
+
+class PythonBackend:
+    name = 'python'
+    maintains_tokens = True
+
+    def _documents(self, term):
+        # Rango en lugar de LIKE: usa search_token_idx en cualquier base de datos
+        return SearchToken.objects.filter(token__gte=term, token__lt=term + '\uffff')
+
+    def match(self, terms):
+        q = Q()
+        for term in terms:
+            q &= Q(id__in=self._documents(term).values('document_id'))
+        return q
+
+    def ranked(self, terms, kinds, limit, within=None):
+        scores = None
+        for term in terms:
+            found = defaultdict(int)
+            tokens = self._documents(term).filter(document__kind__in=kinds)
+            if within is not None:
+                tokens = tokens.annotate(target=Coalesce('document__parent_id', 'document__object_id')).filter(target__in=within.values('pk'))
+            for document_id, weight in tokens.values_list('document_id', 'weight'):
+                found[document_id] += weight
+            scores = found if scores is None else {d: scores[d] + s for d, s in found.items() if d in scores}
+            if not scores:
+                return []
+        best = sorted(scores, key=lambda d: (-scores[d], d))[:limit]
+        rows = {row[0]: row[1:] for row in SearchDocument.objects.filter(id__in=best).values_list('id', 'kind', 'object_id', 'parent_id')}
+        return [rows[d] for d in best if d in rows]
+
+    def store(self, documents):
+        SearchToken.objects.filter(document__in=documents).delete()
+        SearchToken.objects.bulk_create(
+            [SearchToken(document=d, token=term, weight=n) for d in documents for term, n in token_weights(d).items()],
+            batch_size=1000,
+        )
+
+
+BACKENDS = {backend.name: backend for backend in (Fts5Backend(), PostgresBackend(), PythonBackend())}
+_resolved = {}
+
+
+def get_backend():
+    name = getattr(settings, 'SEARCH_BACKEND', 'auto') or 'auto'
+    if name != 'auto':
+        return BACKENDS[name]
+    vendor = connection.vendor
+    if vendor not in _resolved:
+        if vendor == 'sqlite':
+            # Sin FTS5 compilado la migración no pudo crear la tabla virtual
+            _resolved[vendor] = 'fts5' if FTS_TABLE in connection.introspection.table_names() else 'python'
+        else:
+            _resolved[vendor] = 'postgres' if vendor == 'postgresql' else 'python'
+    return BACKENDS[_resolved[vendor]]
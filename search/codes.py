@@ -0,0 +1,100 @@
+"""Búsqueda de tickets por código de equipo.
+
+Los códigos se comparan normalizados (``normalize_code``: sin tildes, minúsculas y solo
+letras y dígitos), así ``pc-0045``, ``PC 0045`` y ``PC0045`` son el mismo. Cada ticket
+con código tiene un ``SearchDocument`` de tipo ``equipment`` con el código en ``title``
+y sus trigramas en ``SearchTrigram``:
+
+- exacto y prefijo: rango sobre el índice parcial ``search_code_idx``;
+- contenido (``0045`` en ``PC0045``, desde 3 caracteres): documentos que tienen todos
+  los trigramas de la consulta, comprobados después con ``contains``.
+
+``lookup`` devuelve ids de ticket en ese orden (exactos, prefijo, contenido) para el
+autocompletado; ``targets`` es la subconsulta equivalente, sin orden ni límite, para filtrar.
+"""
+import re
+
+from django.db.models import Count, Q
+
+from .models import SearchDocument, SearchTrigram
+from .text import normalize
+
+KIND = 'equipment'
+MAX_CODE_LENGTH = 120  # Ticket.equipment_code
+_NOT_CODE = re.compile(r'[^0-9a-z]')
+
+
+def normalize_code(code):
+    return _NOT_CODE.sub('', normalize(code))[:MAX_CODE_LENGTH]
+
+
+def trigrams(code):
+    return {code[i:i + 3] for i in range(len(code) - 2)}
+
+
+def store(documents):
+    """Regenera los trigramas de ``documents`` (tipo ``equipment``)."""
+    SearchTrigram.objects.filter(document__in=documents).delete()
+    SearchTrigram.objects.bulk_create(
+        [SearchTrigram(document=document, trigram=gram) for document in documents for gram in trigrams(document.title)],
+        batch_size=1000,
+    )
+
+
+def _documents(within=None):
+    documents = SearchDocument.objects.filter(kind=KIND)
+    if within is not None:
+        documents = documents.filter(object_id__in=within.order_by().values('pk'))
+    return documents
+
+
+def _prefix(code):
+    # Rango en lugar de LIKE: usa el índice en SQLite y PostgreSQL por igual
+    return Q(title__gte=code, title__lt=code + '\uffff')
+
+
+def _containing(code):
+    grams = trigrams(code)
+    with_all = (
+        SearchTrigram.objects.filter(trigram__in=grams)
+        .values('document_id').annotate(n=Count('id')).filter(n=len(grams)).values('document_id')
+    )
+    return Q(id__in=with_all, title__contains=code)
+
+
+def targets(q):
+    """Subconsulta con los ids de ticket cuyo código empieza por ``q`` o lo contiene (``None`` si ``q`` no es un código)."""
+    code = normalize_code(q)
+    if not code:
+        return None
+    documents = _documents()
+    found = documents.filter(_prefix(code)).values('object_id')
+    if len(code) >= 3:
+        # UNION y no OR: con OR SQLite deja de usar search_code_idx y recorre todos los códigos
+        found = found.union(documents.filter(_containing(code)).values('object_id'), all=True)
+    return found
+
+
+def filter_queryset(qs, q):
+    """``qs`` (tickets) restringido a los que tienen un código de equipo que coincide con ``q``."""
+    found = targets(q)
+    if found is None:
+        return qs.none()
+    return qs.filter(pk__in=found)
+
+
+def lookup(q, limit=10, within=None):
+    """Ids de ticket cuyo código coincide con ``q``: exactos, luego por prefijo y luego el resto."""
+    code = normalize_code(q)
+    if not code:
+        return []
+    documents = _documents(within)
+    ids = list(documents.filter(title=code).order_by('-object_id').values_list('object_id', flat=True)[:limit])
+    stages = [_prefix(code) & ~Q(title=code)]
+    if len(code) >= 3:
+        stages.append(_containing(code) & ~_prefix(code))
+    for condition in stages:
+        if len(ids) >= limit:
+            break
+        ids += documents.filter(condition).order_by('title', '-object_id').values_list('object_id', flat=True)[:limit - len(ids)]
+    return ids
@@ -0,0 +1,145 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+
+from oficinas.models import Office
+from search import codes, index
+from search.backends import get_backend
+from tickets.models import Ticket, TicketNote, TicketPriority
+
+WORDS = (
+    'impresora', 'cámara', 'red', 'conexión', 'monitor', 'teclado', 'portátil', 'servidor',
+    'correo', 'contraseña', 'acceso', 'tóner', 'escáner', 'licencia', 'antivirus', 'batería',
+    'cable', 'pantalla', 'proyector', 'teléfono', 'sistema', 'lento', 'falla', 'instalación',
+    'configuración', 'actualización', 'usuario', 'oficina', 'reunión', 'archivo', 'carpeta',
+)
+NAMES = ('José', 'María', 'Andrés', 'Lucía', 'Sebastián', 'Valentina', 'Ramón', 'Inés', 'Óscar', 'Sofía')
+SURNAMES = ('Gómez', 'Pérez', 'Muñoz', 'Rodríguez', 'Martínez', 'Díaz', 'Peña', 'Núñez', 'Ordóñez', 'Suárez')
+QUERIES = ('impresora', 'camara', 'conexion red', 'Muñoz', 'configura', 'toner escaner', 'servidor lento falla')
+CODE_PREFIXES = ('PC', 'IMP', 'CAM', 'SRV', 'PRY', 'TEL')
+CODE_QUERIES = ('PC-000123', 'pc0001', 'imp', '01234', 'zz-9')
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed N tickets (with equipment codes) and notes with Spanish text inside a transaction, "
+        "build the search index and compare the old icontains filters with the index "
+        "(first page, count, ranking and equipment-code autocomplete). "
+        "Everything is rolled back unless --keep is given"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=500000, help='Tickets to seed (default 500000)')
+        parser.add_argument('--notes', type=int, default=None, help='Notes to seed (default: as many as tickets)')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query; the median is reported')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows and their index')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['tickets'] < 1:
+            raise CommandError('--tickets must be positive')
+        self.stdout.write(f'Search backend: {get_backend().name} ({connection.vendor})')
+        try:
+            with transaction.atomic():
+                tickets = self.seed(options)
+                started = time.monotonic()
+                done = 0
+                for start in range(0, len(tickets), 5000):
+                    done += index.index('ticket', tickets[start:start + 5000])
+                    index.index('equipment', tickets[start:start + 5000])
+                self.stdout.write(f'Indexed {done} tickets and their codes in {time.monotonic() - started:.1f}s')
+                started = time.monotonic()
+                done = self.seed_notes(options, tickets)
+                self.stdout.write(f'Seeded and indexed {done} notes in {time.monotonic() - started:.1f}s')
+                if connection.vendor in ('sqlite', 'postgresql'):
+                    with connection.cursor() as cursor:
+                        cursor.execute('ANALYZE')
+                self.run(options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Datos de prueba descartados (rollback).')
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        started = time.monotonic()
+        office = Office.objects.create(name=f'bench{int(time.time())} oficina')
+        batch, created = [], []
+        for n in range(options['tickets']):
+            batch.append(Ticket(
+                requester_name=f'{rng.choice(NAMES)} {rng.choice(SURNAMES)}',
+                description=' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 14))),
+                equipment_code=f'{rng.choice(CODE_PREFIXES)}-{n:06d}',
+                priority=rng.choice(TicketPriority.values), assigned_office=office,
+            ))
+            if len(batch) == 5000:
+                created += Ticket.objects.bulk_create(batch)
+                batch = []
+        created += Ticket.objects.bulk_create(batch)
+        if created and created[0].pk is None:
+            created = list(Ticket.objects.filter(assigned_office=office).order_by('pk'))
+        self.stdout.write(f"Seeded {options['tickets']} tickets in {time.monotonic() - started:.1f}s")
+        return created
+
+    def seed_notes(self, options, tickets):
+        rng = random.Random(options['seed'] + 1)
+        total = len(tickets) if options['notes'] is None else options['notes']
+        done = 0
+        for start in range(0, total, 5000):
+            notes = TicketNote.objects.bulk_create([
+                TicketNote(ticket=rng.choice(tickets), text=' '.join(rng.choice(WORDS) for _ in range(rng.randint(3, 10))))
+                for _ in range(min(5000, total - start))
+            ])
+            if notes and notes[0].pk is None:
+                notes = list(TicketNote.objects.order_by('-pk')[:len(notes)])
+            done += index.index('note', notes)
+        return done
+
+    def time(self, fn, repeat):
+        timings = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            result = fn()
+            timings.append(time.perf_counter() - t0)
+        return statistics.median(timings) * 1000, result
+
+    def run(self, options):
+        repeat = options['repeat']
+        base = Ticket.objects.all()
+        self.stdout.write('')
+        self.stdout.write(
+            f"{'q':<22} {'icontains n':>11} {'page':>9} {'count':>9}   {'index n':>8} {'page':>9} {'count':>9} {'ranked':>9}"
+        )
+        for q in QUERIES:
+            like = base
+            for word in q.split():
+                like = like.filter(Q(requester_name__icontains=word) | Q(description__icontains=word))
+            found = index.filter_queryset(base, q, index.TICKET_KINDS)
+            like_page, _ = self.time(lambda: list(like.order_by('-created_at', '-id')[:11]), repeat)
+            like_count, like_n = self.time(like.count, repeat)
+            page, _ = self.time(lambda: list(found.order_by('-created_at', '-id')[:11]), repeat)
+            count, n = self.time(found.count, repeat)
+            ranked, _ = self.time(lambda: list(index.order_by_rank(base, q, index.TICKET_KINDS)[:10]), repeat)
+            self.stdout.write(
+                f'{q:<22} {like_n:>11} {like_page:>7.1f}ms {like_count:>7.1f}ms   '
+                f'{n:>8} {page:>7.1f}ms {count:>7.1f}ms {ranked:>7.1f}ms'
+            )
+
+        self.stdout.write('')
+        self.stdout.write(f"{'code':<22} {'icontains n':>11} {'page':>9}   {'lookup n':>8} {'lookup':>9} {'filter':>9}")
+        for q in CODE_QUERIES:
+            like = base.filter(equipment_code__icontains=q)
+            like_page, like_n = self.time(lambda: len(list(like.order_by('-created_at', '-id')[:10])), repeat)
+            lookup, found = self.time(lambda: codes.lookup(q, 10), repeat)
+            filtered, _ = self.time(lambda: list(codes.filter_queryset(base, q).order_by('-created_at', '-id')[:10]), repeat)
+            self.stdout.write(
+                f'{q:<22} {like_n:>11} {like_page:>7.1f}ms   {len(found):>8} {lookup:>7.1f}ms {filtered:>7.1f}ms'
+            )
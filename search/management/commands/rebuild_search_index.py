@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from search import index
+from search.backends import get_backend
+
+
+class Command(BaseCommand):
+    help = (
+        "Rebuild the full-text search index (tickets, notes, users, offices) from the "
+        "database. Needed after bulk_create/update imports, which skip the save signals"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', action='append', choices=sorted(index.KINDS), help='Only this kind (repeatable)')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Rows per batch (default 2000)')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        self.stdout.write(f'Search backend: {get_backend().name}')
+
+        def progress(kind, total):
+            if total % (options['chunk_size'] * 25) == 0:
+                self.stdout.write(f'  {kind}: {total}')
+
+        totals = index.rebuild(options['kind'], chunk_size=options['chunk_size'], progress=progress)
+        self.stdout.write(self.style.SUCCESS(
+            'Indexed ' + ', '.join(f'{kind}={total}' for kind, total in totals.items())
+        ))
@@ -0,0 +1,81 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+FTS_SQL = [
+    "CREATE VIRTUAL TABLE search_fts USING fts5(title, body, content='search_searchdocument', "
+    "content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER search_fts_ai AFTER INSERT ON search_searchdocument BEGIN "
+    "INSERT INTO search_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER search_fts_ad AFTER DELETE ON search_searchdocument BEGIN "
+    "INSERT INTO search_fts(search_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); END",
+    "CREATE TRIGGER search_fts_au AFTER UPDATE ON search_searchdocument BEGIN "
+    "INSERT INTO search_fts(search_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO search_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+PG_SQL = [
+    "CREATE INDEX search_doc_fts_idx ON search_searchdocument USING GIN "
+    "((setweight(to_tsvector('simple', title), 'A') || setweight(to_tsvector('simple', body), 'B')))",
+]
+
+
+def create_fulltext(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        try:
+            schema_editor.execute(FTS_SQL[0])
+        except Exception:
+            return  # SQLite compilado sin FTS5: se usará el motor python
+        for sql in FTS_SQL[1:]:
+            schema_editor.execute(sql)
+    elif vendor == 'postgresql':
+        for sql in PG_SQL:
+            schema_editor.execute(sql)
+
+
+def drop_fulltext(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        for name in ('search_fts_ai', 'search_fts_ad', 'search_fts_au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        schema_editor.execute('DROP TABLE IF EXISTS search_fts')
+    elif vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS search_doc_fts_idx')
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = []
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('parent_id', models.BigIntegerField(blank=True, null=True)),
+                ('title', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['kind', 'parent_id'], name='search_doc_parent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id'), name='search_doc_unique')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('weight', models.PositiveIntegerField(default=1)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tokens', to='search.searchdocument')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token', 'document'], name='search_token_idx')],
+            },
+        ),
+        migrations.RunPython(create_fulltext, drop_fulltext),
+    ]
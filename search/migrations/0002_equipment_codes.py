@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchTrigram',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('trigram', models.CharField(max_length=3)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='searchdocument',
+            index=models.Index(condition=models.Q(('kind', 'equipment')), fields=['title'], name='search_code_idx'),
+        ),
+        migrations.AddField(
+            model_name='searchtrigram',
+            name='document',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trigrams', to='search.searchdocument'),
+        ),
+        migrations.AddIndex(
+            model_name='searchtrigram',
+            index=models.Index(fields=['trigram', 'document'], name='search_trigram_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from search import index
+
+
+def populate_index(apps, schema_editor):
+    # Los objetos creados antes del índice no pasaron por las señales de search
+    index.backfill(apps, ['ticket', 'note', 'user', 'office'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0002_equipment_codes'),
+        ('tickets', '0009_ticketcounter_null_dims'),
+        ('accounts', '0008_notificationdigest'),
+        ('oficinas', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_index, migrations.RunPython.noop),
+    ]
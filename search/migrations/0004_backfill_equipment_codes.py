@@ -0,0 +1,19 @@
+from django.db import migrations
+
+from search import index
+
+
+def populate_codes(apps, schema_editor):
+    # Códigos de equipo de los tickets anteriores a search.codes
+    index.backfill(apps, ['equipment'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0003_backfill_index'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_codes, migrations.RunPython.noop),
+    ]
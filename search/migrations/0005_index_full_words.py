@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from search import index
+
+TEXT_KINDS = ['ticket', 'note', 'user', 'office']
+
+
+def reindex(apps, schema_editor):
+    # Los documentos guardan ahora también la palabra entera (search.text.analyze)
+    apps.get_model('search', 'SearchDocument').objects.filter(kind__in=TEXT_KINDS).delete()
+    index.backfill(apps, TEXT_KINDS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('search', '0004_backfill_equipment_codes'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex, migrations.RunPython.noop),
+    ]
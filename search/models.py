@@ -0,0 +1,53 @@
+from django.db import models
+
+
+class SearchDocument(models.Model):
+    """Texto analizado (``search.text``) de un objeto buscable.
+
+    ``kind`` dice qué es (``ticket``, ``note``, ``user``, ``office``, ``equipment``) y
+    ``parent_id`` a qué ticket pertenece una nota. Los de ``equipment`` guardan en
+    ``title`` el código de equipo normalizado del ticket (``search.codes``). Sobre esta tabla se montan el índice FTS5 (SQLite)
+    o GIN (PostgreSQL); ver ``search.backends``.
+    """
+    kind = models.CharField(max_length=16)
+    object_id = models.BigIntegerField()
+    parent_id = models.BigIntegerField(null=True, blank=True)
+    title = models.TextField(blank=True)
+    body = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id'], name='search_doc_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['kind', 'parent_id'], name='search_doc_parent_idx'),
+            # Búsqueda exacta y por prefijo de códigos de equipo
+            models.Index(fields=['title'], name='search_code_idx', condition=models.Q(kind='equipment')),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id}'
+
+
+class SearchToken(models.Model):
+    """Índice invertido del motor ``python`` (bases de datos sin FTS): término -> documento."""
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='tokens')
+    token = models.CharField(max_length=64)
+    weight = models.PositiveIntegerField(default=1)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['token', 'document'], name='search_token_idx'),
+        ]
+
+
+class SearchTrigram(models.Model):
+    """Trigramas de los códigos de equipo: ``1234`` encuentra ``PC-01234`` sin recorrer la tabla."""
+    document = models.ForeignKey(SearchDocument, on_delete=models.CASCADE, related_name='trigrams')
+    trigram = models.CharField(max_length=3)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['trigram', 'document'], name='search_trigram_idx'),
+        ]
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save
+
+from . import index
+
+
+def _connect(kind):
+    model = index.model_for(kind)
+
+    def on_save(sender, instance, **kwargs):
+        if kwargs.get('raw'):
+            return  # loaddata
+        if kwargs.get('update_fields') and set(kwargs['update_fields']) <= {'last_login'}:
+            return  # cada login guarda last_login; no cambia nada buscable
+        index.index(kind, [instance])
+
+    def on_delete(sender, instance, **kwargs):
+        index.remove(kind, [instance.pk])
+
+    post_save.connect(on_save, sender=model, weak=False, dispatch_uid=f'search_index_{kind}')
+    post_delete.connect(on_delete, sender=model, weak=False, dispatch_uid=f'search_remove_{kind}')
+
+
+for _kind in index.KINDS:
+    _connect(_kind)
@@ -0,0 +1,130 @@
+from importlib import import_module
+
+from django.apps import apps as django_apps
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from oficinas.models import Office
+from tickets.access import filter_tickets, order_tickets
+from tickets.models import Ticket, TicketNote, TicketPriority, TicketStatus
+from . import codes, index
+from .models import SearchDocument
+from .text import analyze, terms
+
+
+User = get_user_model()
+
+
+class TextAnalysisTests(TestCase):
+    def test_accents_case_and_plurals_are_folded(self):
+        self.assertEqual(terms('Cámaras LENTAS'), ['camara', 'lenta'])
+        self.assertEqual(terms('la impresora de la oficina'), ['impresora', 'oficina'])
+        self.assertEqual(terms('luces'), terms('luz'))
+        self.assertEqual(analyze('Cámaras LENTAS'), 'camara camaras lenta lentas')
+
+
+class SearchIndexTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.office = Office.objects.create(name='Sistemas', description='Soporte de cómputo')
+        self.jefe = User.objects.create_user(username='jefe', password='pass12345', approved=True, role='JEFE')
+        self.printer = Ticket.objects.create(
+            requester_name='Ana', requester_office=self.office, description='La impresora no imprime', equipment_code='PC-0045',
+            priority=TicketPriority.P3, assigned_office=self.office, status=TicketStatus.ASSIGNED,
+        )
+        self.camera = Ticket.objects.create(
+            requester_name='Impresiones Luis', requester_office=self.office, description='Cámara de seguridad apagada', equipment_code='CAM-00451',
+            priority=TicketPriority.P3, assigned_office=self.office, status=TicketStatus.ASSIGNED,
+        )
+
+    def search(self, q):
+        return set(index.filter_queryset(Ticket.objects.all(), q, index.TICKET_KINDS).values_list('id', flat=True))
+
+    def test_accent_insensitive_prefix_match(self):
+        self.assertEqual(self.search('CAMARA'), {self.camera.id})
+        self.assertEqual(self.search('impres'), {self.printer.id, self.camera.id})
+        self.assertEqual(self.search('impresora apagada'), set())
+
+    def test_partial_word_and_stopword_only_queries(self):
+        monitors = Ticket.objects.create(
+            requester_name='Eva', description='Monitores sin imagen',
+            priority=TicketPriority.P3, assigned_office=self.office, status=TicketStatus.ASSIGNED,
+        )
+        self.assertEqual(self.search('monitore'), {monitors.id})
+        self.assertEqual(self.search('monitor'), {monitors.id})
+        everything = {self.printer.id, self.camera.id, monitors.id}
+        self.assertEqual(self.search('de el'), everything)  # solo palabras vacías: no filtra
+        self.assertEqual(set(filter_tickets(self.jefe, {'q': 'de'}).values_list('id', flat=True)), everything)
+        self.assertEqual(len(order_tickets(Ticket.objects.all(), 'relevance', 'de')), 3)
+
+    def test_note_finds_its_ticket_and_delete_removes_it(self):
+        note = TicketNote.objects.create(ticket=self.printer, author=self.jefe, text='Se cambió el tóner')
+        self.assertEqual(self.search('toner'), {self.printer.id})
+        note.delete()
+        self.assertEqual(self.search('toner'), set())
+        self.printer.delete()
+        self.assertFalse(SearchDocument.objects.filter(kind='ticket', object_id=self.printer.id).exists())
+
+    def test_title_matches_rank_first(self):
+        ordered = order_tickets(Ticket.objects.all(), 'relevance', 'impresiones')
+        self.assertEqual(list(ordered.values_list('id', flat=True)), [self.camera.id])
+        ordered = order_tickets(Ticket.objects.all(), 'relevance', 'impres')
+        self.assertEqual(list(ordered.values_list('id', flat=True)), [self.camera.id, self.printer.id])
+
+    def test_equipment_code_exact_prefix_and_contained(self):
+        self.assertEqual(codes.lookup('pc 0045'), [self.printer.id])
+        self.assertEqual(codes.lookup('0045'), [self.camera.id, self.printer.id])
+        self.assertEqual(codes.lookup('cam-004'), [self.camera.id])
+        self.assertEqual(codes.lookup('45'), [])  # menos de 3 caracteres: solo prefijo
+        self.assertEqual(set(filter_tickets(self.jefe, {'q': '0045'}).values_list('id', flat=True)), {self.printer.id, self.camera.id})
+        self.camera.equipment_code = ''
+        self.camera.save()
+        self.assertEqual(codes.lookup('0045'), [self.printer.id])
+
+    def test_lookup_endpoint_caches_until_index_changes(self):
+        self.client.login(username='jefe', password='pass12345')
+        url = reverse('ticket_lookup')
+        resp = self.client.get(url, {'q': 'PC-0045'})
+        self.assertIn('private', resp['Cache-Control'])
+        results = resp.json()['results']
+        self.assertEqual([(r['id'], r['match']) for r in results], [(self.printer.id, 'code')])
+        with self.assertNumQueries(2):  # sesión y usuario
+            self.client.get(url, {'q': 'pc-0045'})
+        with self.captureOnCommitCallbacks(execute=True):
+            TicketNote.objects.create(ticket=self.camera, author=self.jefe, text='Revisar junto al PC-0045')
+        results = self.client.get(url, {'q': 'pc-0045'}).json()['results']
+        self.assertEqual([(r['id'], r['match']) for r in results], [(self.printer.id, 'code'), (self.camera.id, 'text')])
+
+    def test_rebuild_restores_documents(self):
+        SearchDocument.objects.all().delete()
+        totals = index.rebuild(['ticket', 'office', 'equipment'])
+        self.assertEqual(totals, {'ticket': 2, 'office': 1, 'equipment': 2})
+        self.assertEqual(self.search('camara'), {self.camera.id})
+
+    def test_migration_indexes_existing_rows(self):
+        SearchDocument.objects.all().delete()  # filas anteriores al índice
+        backfill = import_module('search.migrations.0003_backfill_index')
+        backfill.populate_index(django_apps, None)
+        backfill.populate_index(django_apps, None)  # volver a ejecutarla no duplica
+        self.assertEqual(self.search('ana'), {self.printer.id})
+        self.assertEqual(list(index.filter_queryset(User.objects.all(), 'jefe').values_list('id', flat=True)), [self.jefe.id])
+        self.assertEqual(SearchDocument.objects.filter(kind='office').count(), 1)
+
+    def test_migration_indexes_existing_equipment_codes(self):
+        SearchDocument.objects.filter(kind='equipment').delete()
+        import_module('search.migrations.0004_backfill_equipment_codes').populate_codes(django_apps, None)
+        self.assertEqual(codes.lookup('0045'), [self.camera.id, self.printer.id])
+
+    def test_ticket_list_filter_uses_index(self):
+        visible = filter_tickets(self.jefe, {'q': 'impresora'})
+        self.assertEqual(list(visible.values_list('id', flat=True)), [self.printer.id])
+        self.client.login(username='jefe', password='pass12345')
+        resp = self.client.get(reverse('tickets_index'), {'q': 'camara', 'sort': 'relevance'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([t.id for t in resp.context['tickets']], [self.camera.id])
+
+
+@override_settings(SEARCH_BACKEND='python')
+class PythonBackendTests(SearchIndexTests):
+    """Los mismos casos con el índice invertido de ``SearchToken``."""
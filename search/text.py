@@ -0,0 +1,68 @@
+"""Análisis de texto común a todos los motores de búsqueda.
+
+El índice guarda el texto ya analizado: minúsculas, sin tildes (``canción`` ->
+``cancion``), sin palabras vacías del español y con un recorte ligero de plurales
+(``monitores`` -> ``monitor``, ``luces`` -> ``luz``). Consultas y documentos pasan por
+el mismo ``terms``, así FTS5, PostgreSQL y el índice en Python dan los mismos resultados
+y la búsqueda no depende de extensiones (``unaccent``) ni de diccionarios del servidor.
+
+Los términos se buscan por prefijo, y una palabra a medio escribir no siempre empieza
+por la raíz guardada (``monitore`` no es prefijo de ``monitor``): por eso ``analyze``
+guarda también la palabra sin recortar cuando cambia (``monitor monitores``).
+"""
+import re
+import unicodedata
+
+_WORD = re.compile(r'\w+')
+_VOWELS = set('aeiou')
+
+STOPWORDS = frozenset('''
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde
+durante e el ella ellas ellos en entre era es esa ese eso esta estas este esto estos
+fue ha hay la las le les lo los mas me mi mis muy ni no nos o otra otro para pero poco
+por porque que quien se si sin sobre su sus tambien te tiene todo todos tu un una uno
+unos y ya yo
+'''.split())
+
+MAX_TERM_LENGTH = 64
+
+
+def normalize(text):
+    """Minúsculas y sin diacríticos (la ñ queda como n)."""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def stem(word):
+    if len(word) > 4 and word.endswith('ces'):
+        return word[:-3] + 'z'
+    if len(word) > 4 and word.endswith('es') and word[-3] not in _VOWELS:
+        return word[:-2]
+    if len(word) > 3 and word.endswith('s') and word[-2] in _VOWELS:
+        return word[:-1]
+    return word
+
+
+def _words(text):
+    return [word for word in _WORD.findall(normalize(text)) if word not in STOPWORDS and word != '_']
+
+
+def terms(text):
+    """Términos de búsqueda de ``text``, en orden y con repeticiones."""
+    return [stem(word)[:MAX_TERM_LENGTH] for word in _words(text)]
+
+
+def index_terms(text):
+    """Términos que se guardan de ``text``: la raíz y, si es distinta, la palabra entera."""
+    result = []
+    for word in _words(text):
+        root = stem(word)[:MAX_TERM_LENGTH]
+        result.append(root)
+        if root != word[:MAX_TERM_LENGTH]:
+            result.append(word[:MAX_TERM_LENGTH])
+    return result
+
+
+def analyze(*parts):
+    """Texto analizado para guardar en el índice (términos separados por espacios)."""
+    return ' '.join(term for part in parts if part for term in index_terms(str(part)))
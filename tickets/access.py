@@ -0,0 +1,103 @@
+"""Visibilidad de tickets por rol y renderizado de filas para actualizaciones en vivo."""
+from types import SimpleNamespace
+
+from django.template.loader import render_to_string
+
+from search import codes as search_codes, index as search_index
+
+from .models import Ticket
+
+
+def visible_tickets(user):
+    """Tickets que ``user`` ve en el listado: todos (jefe), su oficina (supervisor) o los suyos."""
+    if user.is_jefe:
+        return Ticket.objects.select_related('assigned_office', 'technician').all()
+    if user.is_supervisor:
+        return Ticket.objects.filter(assigned_office_id=user.office_id).select_related('assigned_office', 'technician')
+    return Ticket.objects.filter(technician=user).select_related('assigned_office', 'technician')
+
+
+def visibility_scope(user):
+    """Clave de lo que ``user`` puede ver (usuarios con la misma clave ven los mismos tickets)."""
+    if user.is_jefe:
+        return 'all'
+    if user.is_supervisor:
+        return f'office:{user.office_id}'
+    return f'tech:{user.pk}'
+
+
+# Órdenes admitidos en el listado (?sort=)
+SORTS = [
+    '-created_at',  # Newest first
+    'created_at',   # Oldest first
+    '-updated_at',  # Recently updated first
+    'updated_at',   # Least recently updated first
+    '-priority',    # High priority first
+    'priority',     # Low priority first
+    'status',       # Status alphabetical
+    '-status',      # Status reverse alphabetical
+    'relevance',    # Mejor coincidencia con ?q= primero
+]
+DEFAULT_SORT = '-created_at'
+
+
+def filter_tickets(user, params):
+    """Tickets visibles para ``user`` con los filtros del listado (status, priority, office, tech, q)."""
+    qs = visible_tickets(user)
+    status = params.get('status')
+    priority = params.get('priority')
+    office = params.get('office')
+    tech = params.get('tech')
+    q = params.get('q')
+
+    if status:
+        qs = qs.filter(status=status)
+    if priority:
+        qs = qs.filter(priority=priority)
+    if office:
+        qs = qs.filter(assigned_office_id=office)
+    if tech:
+        qs = qs.filter(technician_id=tech)
+    if q:
+        qs = search_tickets(qs, q)
+    return qs
+
+
+def search_tickets(qs, q):
+    """``qs`` restringido a lo que coincide con ``q``: texto del ticket o de sus notas
+    (sin tildes, por prefijo) o código de equipo (exacto, prefijo o contenido).
+    Una búsqueda de solo palabras vacías (``de``, ``el``) no filtra."""
+    if not search_index.searchable(q):
+        return qs
+    found = [search_codes.targets(q)]
+    text = search_index.matching(q, search_index.TICKET_KINDS)
+    if text is not None:
+        found.append(search_index.targets(text))
+    found = [subquery for subquery in found if subquery is not None]
+    if not found:
+        return qs.none()
+    # Una sola subconsulta (UNION) en lugar de OR entre dos: SQLite la resuelve una vez
+    return qs.filter(pk__in=found[0].union(*found[1:], all=True) if len(found) > 1 else found[0])
+
+
+def order_tickets(qs, sort, q=None):
+    """Orden del listado con ``id`` como desempate (estable para paginar por cursor).
+
+    ``relevance`` ordena por el ranking de la búsqueda ``q`` (sin ``q``, el orden por defecto):
+    primero los códigos de equipo que coinciden y después el texto.
+    """
+    if sort == 'relevance':
+        if q and search_index.searchable(q):
+            ids = search_codes.lookup(q, search_index.max_results(), within=qs)
+            return search_index.order_by_ids(qs, ids + search_index.ranked_ids(q, search_index.TICKET_KINDS, within=qs))
+        sort = DEFAULT_SORT
+    return qs.order_by(sort, '-id' if sort.startswith('-') else 'id')
+
+
+def render_rows(user, ticket_ids):
+    """``{ticket_id: html}`` de ``tickets/_table_row.html``; ``None`` si ya no es visible o se borró."""
+    rows = {ticket_id: None for ticket_id in ticket_ids}
+    request = SimpleNamespace(user=user)
+    for ticket in visible_tickets(user).filter(id__in=ticket_ids):
+        rows[ticket.id] = render_to_string('tickets/_table_row.html', {'t': ticket, 'request': request})
+    return rows
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Ticket, TicketNote, Evidence
+from .models import Ticket, TicketNote, Evidence, Job
 
 
 @admin.register(Ticket)
@@ -18,4 +18,11 @@ class TicketNoteAdmin(admin.ModelAdmin):
 class EvidenceAdmin(admin.ModelAdmin):
 	list_display = ('id', 'ticket', 'uploaded_at')
 
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+	list_display = ('id', 'name', 'priority', 'status', 'attempts', 'run_at', 'created_at', 'duration_ms')
+	list_filter = ('status', 'name')
+	readonly_fields = ('created_at', 'started_at', 'finished_at', 'duration_ms', 'last_error')
+
 # Register your models here.
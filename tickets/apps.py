@@ -5,4 +5,4 @@ class TicketsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'tickets'
     def ready(self):
-        from . import signals  # noqa
+        from . import signals, tasks  # noqa
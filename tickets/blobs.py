@@ -0,0 +1,183 @@
+"""Cuenta de referencias de los archivos de evidencia y su recolección.
+
+Cada nombre de ``tickets.storage`` que usa una ``Evidence`` (la foto y sus miniaturas,
+``names``) tiene una fila ``Blob`` con ``refcount``. Las señales de ``Evidence`` llaman a
+``retain``/``release`` con la diferencia entre los nombres de antes y de después, en
+la misma transacción que el cambio.
+
+``collect`` (``manage.py gc_evidence_files``) borra:
+
+- los ``Blob`` con ``refcount`` 0 desde hace más de ``EVIDENCE_GC_GRACE_HOURS`` (el
+  margen cubre las subidas cuyo ``Evidence`` aún no se ha guardado);
+- los archivos con nombre de contenido que no tienen ``Blob`` (transacciones que se
+  deshicieron tras escribir el archivo) y los temporales abandonados en ``.incoming``.
+
+``recount`` recalcula las cuentas desde las evidencias, por si algo las saltó
+(``QuerySet.update``/``delete`` masivos no disparan señales).
+"""
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Blob, Evidence
+from .storage import INCOMING, ContentAddressedStorage
+
+
+def storage():
+    return Evidence._meta.get_field('image').storage
+
+
+def grace():
+    return timedelta(hours=getattr(settings, 'EVIDENCE_GC_GRACE_HOURS', 24))
+
+
+def names(image_name, thumbnails):
+    """Nombres de archivo con contenido direccionado que usa una evidencia."""
+    found = {image_name}
+    for thumb in (thumbnails or {}).values():
+        found.update((thumb.get('webp'), thumb.get('jpeg')))
+    return {name for name in found if ContentAddressedStorage.digest_of(name)}
+
+
+def names_for(evidence):
+    return names(evidence.image.name, evidence.thumbnails)
+
+
+def find(digest):
+    """``Blob`` con contenido ``digest`` (por índice), o ``None``."""
+    return Blob.objects.filter(sha256=digest).first()
+
+
+def _size(name):
+    try:
+        return storage().size(name)
+    except OSError:
+        return 0
+
+
+def retain(blob_names):
+    for name in blob_names:
+        if Blob.objects.filter(name=name).update(refcount=F('refcount') + 1):
+            continue
+        try:
+            with transaction.atomic():
+                Blob.objects.create(name=name, sha256=ContentAddressedStorage.digest_of(name), size=_size(name), refcount=1)
+        except IntegrityError:  # otro proceso la creó entretanto
+            Blob.objects.filter(name=name).update(refcount=F('refcount') + 1)
+
+
+def release(blob_names):
+    if blob_names:
+        Blob.objects.filter(name__in=list(blob_names)).update(refcount=F('refcount') - 1)
+
+
+def recount(chunk_size=1000):
+    """Recalcula ``refcount`` de todos los ``Blob`` desde las evidencias. Devuelve cuántos cambiaron."""
+    counts = {}
+    last_id = 0
+    while True:
+        rows = list(
+            Evidence.objects.filter(id__gt=last_id).order_by('id').values_list('id', 'image', 'thumbnails')[:chunk_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        for _, image_name, thumbnails in rows:
+            for name in names(image_name, thumbnails):
+                counts[name] = counts.get(name, 0) + 1
+    changed = 0
+    with transaction.atomic():
+        for blob in Blob.objects.select_for_update().only('name', 'refcount'):
+            expected = counts.pop(blob.name, 0)
+            if blob.refcount != expected:
+                Blob.objects.filter(pk=blob.pk).update(refcount=expected)
+                changed += 1
+        for name, refcount in counts.items():  # referenciados sin fila
+            Blob.objects.create(name=name, sha256=ContentAddressedStorage.digest_of(name), size=_size(name), refcount=refcount)
+            changed += 1
+    return changed
+
+
+def _walk(store):
+    """Nombres (relativos) de los archivos de contenido del almacenamiento."""
+    root = store.location
+    for directory, subdirs, files in os.walk(root):
+        subdirs[:] = [d for d in subdirs if d != INCOMING]
+        for filename in files:
+            name = os.path.relpath(os.path.join(directory, filename), root).replace(os.sep, '/')
+            if ContentAddressedStorage.digest_of(name):
+                yield name
+
+
+def _older_than(path, cutoff):
+    try:
+        return os.path.getmtime(path) < cutoff
+    except OSError:
+        return False
+
+
+def collect(chunk_size=500, dry_run=False):
+    """Borra los archivos sin referencias (ver el docstring del módulo). Devuelve un informe."""
+    store = storage()
+    report = {'blobs': 0, 'orphans': 0, 'temporary': 0, 'bytes': 0}
+    before = timezone.now() - grace()
+    cutoff = time.time() - grace().total_seconds()
+
+    last_id = 0
+    while True:
+        batch = list(
+            Blob.objects.filter(refcount__lte=0, updated_at__lt=before, id__gt=last_id).order_by('id')[:chunk_size]
+        )
+        if not batch:
+            break
+        last_id = batch[-1].pk
+        for blob in batch:
+            path = store.path(blob.name)
+            if os.path.exists(path) and not _older_than(path, cutoff):
+                continue  # una subida idéntica acaba de reutilizarlo (storage lo "toca")
+            report['blobs'] += 1
+            report['bytes'] += blob.size
+            if dry_run:
+                continue
+            with transaction.atomic():
+                # Se vuelve a comprobar: pudo recibir una referencia después de leer el lote
+                if Blob.objects.filter(pk=blob.pk, refcount__lte=0).delete()[0]:
+                    store.delete(blob.name)
+
+    if not os.path.isdir(store.location):
+        return report
+    known = set()
+    for name in _walk(store):
+        known.add(name)
+        if len(known) >= chunk_size:
+            _collect_orphans(store, known, cutoff, report, dry_run)
+            known = set()
+    _collect_orphans(store, known, cutoff, report, dry_run)
+
+    incoming = store.path(INCOMING)
+    if os.path.isdir(incoming):
+        for filename in os.listdir(incoming):
+            path = os.path.join(incoming, filename)
+            if _older_than(path, cutoff):
+                report['temporary'] += 1
+                report['bytes'] += os.path.getsize(path)
+                if not dry_run:
+                    os.remove(path)
+    return report
+
+
+def _collect_orphans(store, candidates, cutoff, report, dry_run):
+    tracked = set(Blob.objects.filter(name__in=candidates).values_list('name', flat=True))
+    for name in candidates - tracked:
+        path = store.path(name)
+        if not _older_than(path, cutoff):
+            continue  # recién escrito: su Evidence puede estar guardándose ahora
+        report['orphans'] += 1
+        report['bytes'] += os.path.getsize(path)
+        if not dry_run:
+            store.delete(name)
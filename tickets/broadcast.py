@@ -0,0 +1,206 @@
+"""Difusión agrupada de cambios de tickets por WebSocket.
+
+Los eventos de ``tickets.signals`` no se envían en el momento: se guardan con la
+transacción que los produjo y, solo cuando esta se confirma, pasan al buffer compartido
+por grupo (``stats_jefes``, ``stats_office_<id>``, ``stats_tech_<id>``); los de una
+transacción deshecha se descartan. Lo que se confirma dentro de la ventana
+``TICKET_BROADCAST_WINDOW`` (segundos, aunque sea de varias transacciones) sale en un
+único mensaje por grupo con la lista de tickets modificados; con 0 cada evento sale
+en cuanto se confirma.
+
+Cada ticket trae ``deltas`` (``-1``/``+1`` sobre las dimensiones de ``TicketCounter``)
+para que los clientes ajusten sus KPIs sin volver a pedir los agregados, y cada mensaje
+lleva un ``seq`` monótono por grupo: si el cliente detecta un salto (o se reconecta)
+hace un único refetch completo.
+
+``stats_jefes`` puede repartirse en ``STATS_JEFES_SHARDS`` sub-grupos
+(``stats_jefes.0``, ``stats_jefes.1``...): cada conexión entra en uno según su canal
+y el envío recorre todos. El ``seq`` sigue siendo del grupo lógico.
+
+Para operaciones masivas fuera de una transacción usar ``with batch(): ...``.
+"""
+import logging
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from functools import partial
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from gestor_servicios import metrics
+
+logger = logging.getLogger(__name__)
+
+SHARDED_GROUPS = {'stats_jefes': 'STATS_JEFES_SHARDS'}
+
+
+def shard_count(group):
+    setting = SHARDED_GROUPS.get(group)
+    return max(1, int(getattr(settings, setting, 1) or 1)) if setting else 1
+
+
+def shard_groups(group):
+    """Grupos físicos del grupo lógico ``group``."""
+    shards = shard_count(group)
+    if shards == 1:
+        return [group]
+    return [f'{group}.{n}' for n in range(shards)]
+
+
+def shard_for(group, channel_name):
+    """Sub-grupo físico al que se une ``channel_name`` (reparto estable por hash)."""
+    shards = shard_count(group)
+    if shards == 1:
+        return group
+    return f'{group}.{zlib.crc32(channel_name.encode()) % shards}'
+
+
+SEQ_KEY = 'ws_seq:{}'
+
+
+def next_seq(group):
+    """Siguiente número de secuencia del grupo (compartido entre procesos vía caché)."""
+    key = SEQ_KEY.format(group)
+    cache.add(key, 0, None)
+    try:
+        return cache.incr(key)
+    except ValueError:  # expiró/desalojada entre add() e incr()
+        cache.set(key, 1, None)
+        return 1
+
+
+def current_seq(group):
+    return cache.get(SEQ_KEY.format(group), 0)
+
+
+def merge_deltas(*delta_lists):
+    """Combina listas de deltas sumando los de iguales dimensiones y omitiendo los netos en 0."""
+    merged = {}
+    for deltas in delta_lists:
+        for item in deltas:
+            key = tuple(sorted((k, v) for k, v in item.items() if k != 'delta'))
+            if key in merged:
+                merged[key]['delta'] += item['delta']
+            else:
+                merged[key] = dict(item)
+    return [item for item in merged.values() if item['delta']]
+
+
+def send(channel_layer, group, message):
+    """``group_send`` cronometrado; un fallo de la capa no debe tumbar la petición que lo originó."""
+    started = time.monotonic()
+    try:
+        async_to_sync(channel_layer.group_send)(group, message)
+    except Exception:
+        metrics.inc('broadcast.send_errors')
+        logger.exception('Error enviando %s al grupo %s', message.get('type'), group)
+    finally:
+        # Un group_send lento es la primera señal de una capa de canales saturada
+        metrics.observe('broadcast.group_send_seconds', time.monotonic() - started)
+
+
+class BroadcastBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # grupo -> {ticket_id: payload}, solo eventos ya confirmados
+        self._timer = None
+        self._local = threading.local()
+
+    @property
+    def window(self):
+        return float(getattr(settings, 'TICKET_BROADCAST_WINDOW', 0) or 0)
+
+    def add(self, groups, payload):
+        """Encola ``payload`` para cada grupo cuando se confirme la transacción en curso.
+
+        Cada evento va en su propio callback de ``on_commit``: si la transacción o el
+        savepoint en que se produjo se deshace, Django lo descarta y el evento no sale.
+        """
+        metrics.inc('broadcast.events')
+        metrics.inc('broadcast.group_events', len(groups))
+        transaction.on_commit(partial(self._committed, groups, payload))
+
+    def _committed(self, groups, payload):
+        self.merge([(groups, payload)])
+        self.schedule()
+
+    def merge(self, events):
+        """Pasa eventos confirmados al buffer compartido.
+
+        Un ticket repetido reemplaza su evento anterior, acumulando los ``deltas`` de ambos.
+        """
+        with self._lock:
+            for groups, payload in events:
+                for group in groups:
+                    items = self._pending.setdefault(group, {})
+                    previous = items.get(payload['ticket_id'])
+                    if previous is not None:
+                        metrics.inc('broadcast.events_coalesced')
+                        items[payload['ticket_id']] = dict(
+                            payload, deltas=merge_deltas(previous.get('deltas', []), payload.get('deltas', [])),
+                        )
+                    else:
+                        items[payload['ticket_id']] = payload
+
+    def schedule(self):
+        if getattr(self._local, 'depth', 0):
+            return  # dentro de batch(): se envía al salir
+        window = self.window
+        if window <= 0:
+            self.flush()
+            return
+        with self._lock:
+            if self._timer is not None:
+                return
+            self._timer = threading.Timer(window, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()  # llamado a mano (batch, tests): el temporizador sobra
+            self._timer = None
+        if not pending:
+            return
+        channel_layer = get_channel_layer()
+        if not channel_layer:
+            return
+        for group, items in pending.items():
+            tickets = list(items.values())
+            message = {
+                'type': 'stats_update',
+                'payload': {
+                    'event': 'tickets_changed',
+                    'group': group,
+                    'seq': next_seq(group),
+                    'sent_at': time.time(),
+                    'ticket_ids': [t['ticket_id'] for t in tickets],
+                    'tickets': tickets,
+                },
+            }
+            for physical in shard_groups(group):
+                send(channel_layer, physical, message)
+            metrics.inc('broadcast.messages_sent')
+            metrics.inc('broadcast.tickets_sent', len(tickets))
+
+    @contextmanager
+    def batch(self):
+        """Retiene los envíos hasta salir del bloque (anidable)."""
+        self._local.depth = getattr(self._local, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            self._local.depth -= 1
+            if not self._local.depth:
+                transaction.on_commit(self.schedule)
+
+
+buffer = BroadcastBuffer()
+batch = buffer.batch
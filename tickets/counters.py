@@ -0,0 +1,168 @@
+"""Contadores incrementales de tickets.
+
+Las señales de ``Ticket`` (ver ``tickets.signals``) llaman a ``apply_change`` con las
+dimensiones anteriores y nuevas de cada ticket; las vistas de KPIs leen
+``TicketCounter`` agregando ``count`` en lugar de hacer ``COUNT(*)`` sobre ``Ticket``.
+
+Las escrituras masivas que saltan las señales (``QuerySet.update``, ``bulk_create``)
+dejan los contadores desfasados: usar ``rebuild`` (o ``manage.py rebuild_ticket_counters``).
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from gestor_servicios import stats_cache
+from gestor_servicios.dates import date_range_q
+from .models import Ticket, TicketCounter
+
+
+DIMENSIONS = ('assigned_office_id', 'status', 'priority', 'technician_id', 'supervisor_id')
+
+
+def dims_for(ticket):
+    """Dimensiones de contador de un ticket (``None`` si aún no se puede contar)."""
+    if not ticket.assigned_office_id or not ticket.created_at:
+        return None
+    dims = {name: getattr(ticket, name) for name in DIMENSIONS}
+    dims['day'] = timezone.localdate(ticket.created_at)
+    return dims
+
+
+def stored_dims(ticket_id):
+    """Dimensiones del ticket tal como están guardadas en la base de datos."""
+    row = Ticket.objects.filter(pk=ticket_id).values(*DIMENSIONS, 'created_at').first()
+    if not row or not row['assigned_office_id']:
+        return None
+    created_at = row.pop('created_at')
+    row['day'] = timezone.localdate(created_at)
+    return row
+
+
+def _bump(dims, delta):
+    qs = TicketCounter.objects.filter(**dims)
+    if qs.update(count=F('count') + delta):
+        if delta < 0:
+            qs.filter(count__lte=0).delete()
+        return
+    if delta < 0:
+        # Nada que descontar: los contadores ya estaban desfasados (ver rebuild)
+        return
+    try:
+        with transaction.atomic():
+            TicketCounter.objects.create(count=delta, **dims)
+    except IntegrityError:
+        qs.update(count=F('count') + delta)
+
+
+def apply_change(before, after):
+    """Mueve una unidad de las dimensiones ``before`` a ``after`` (cualquiera puede ser ``None``)."""
+    if before == after:
+        return
+    with transaction.atomic():
+        if before:
+            _bump(before, -1)
+        if after:
+            _bump(after, 1)
+
+
+def detach_user(user_id):
+    """Funde los contadores de un usuario que se va a eliminar en la fila 'sin técnico/supervisor'.
+
+    Replica en los contadores el ``SET_NULL`` que sufrirán sus tickets, sin dejar filas duplicadas.
+    """
+    with transaction.atomic():
+        for field in ('technician_id', 'supervisor_id'):
+            rows = list(TicketCounter.objects.filter(**{field: user_id}).values('id', *DIMENSIONS, 'day', 'count'))
+            for row in rows:
+                TicketCounter.objects.filter(pk=row.pop('id')).delete()
+                count = row.pop('count')
+                row[field] = None
+                if count > 0:
+                    _bump(row, count)
+        transaction.on_commit(stats_cache.invalidate_all)
+
+
+def live_rows(start=None, end=None):
+    """Agregado en vivo sobre ``Ticket`` con las mismas dimensiones que ``TicketCounter``.
+
+    ``start``/``end`` (días locales inclusivos) limitan el recorrido a esa ventana.
+    """
+    return (
+        Ticket.objects
+        .filter(date_range_q(start, end))
+        .annotate(day=TruncDate('created_at'))
+        .values(*DIMENSIONS, 'day')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+
+
+def _day_window(qs, start=None, end=None):
+    if start:
+        qs = qs.filter(day__gte=start)
+    if end:
+        qs = qs.filter(day__lte=end)
+    return qs
+
+
+def rebuild(start=None, end=None):
+    """Recalcula los contadores desde cero (o sólo los días ``start``..``end``).
+
+    Devuelve el número de filas creadas.
+    """
+    with transaction.atomic():
+        _day_window(TicketCounter.objects.all(), start, end).delete()
+        counters = [
+            TicketCounter(count=row.pop('total'), **row)
+            for row in live_rows(start, end)
+        ]
+        TicketCounter.objects.bulk_create(counters, batch_size=500)
+        transaction.on_commit(stats_cache.invalidate_all)
+    return len(counters)
+
+
+def check_consistency(start=None, end=None):
+    """Compara los contadores con el agregado en vivo (opcionalmente sólo ``start``..``end``).
+
+    Devuelve una lista de diferencias ``{'dims': ..., 'expected': n, 'actual': m}``;
+    una lista vacía significa que los contadores están al día.
+    """
+    keys = DIMENSIONS + ('day',)
+    expected = {tuple(row[k] for k in keys): row['total'] for row in live_rows(start, end)}
+    actual = {
+        tuple(row[k] for k in keys): row['count']
+        for row in _day_window(TicketCounter.objects.filter(count__gt=0), start, end).values(*keys, 'count')
+    }
+    diffs = []
+    for key in sorted(set(expected) | set(actual), key=str):
+        if expected.get(key, 0) != actual.get(key, 0):
+            diffs.append({
+                'dims': dict(zip(keys, key)),
+                'expected': expected.get(key, 0),
+                'actual': actual.get(key, 0),
+            })
+    return diffs
+
+
+def counter_queryset(office_id=None, technician_id=None, start=None, end=None, statuses=None):
+    """``TicketCounter`` filtrado con los mismos criterios que usan las vistas de estadísticas.
+
+    ``start``/``end`` son fechas locales inclusivas; ``statuses`` una lista de códigos.
+    """
+    qs = TicketCounter.objects.filter(count__gt=0)
+    if office_id is not None:
+        qs = qs.filter(assigned_office_id=office_id)
+    if technician_id is not None:
+        qs = qs.filter(technician_id=technician_id)
+    qs = _day_window(qs, start, end)
+    if statuses:
+        qs = qs.filter(status__in=statuses)
+    return qs
+
+
+def total(qs=None):
+    """Total de tickets representados por un queryset de contadores."""
+    if qs is None:
+        qs = TicketCounter.objects.all()
+    return qs.aggregate(total=Sum('count'))['total'] or 0
@@ -0,0 +1,196 @@
+"""Procesamiento de las fotos de evidencia (Pillow), fuera de la petición.
+
+``add_evidence`` guarda el archivo tal como llega y llama a ``schedule``: con worker
+(``JOBS_EAGER=0``) se encola el trabajo ``evidence.process``; sin él, se manda al pool de
+hilos del proceso (``EVIDENCE_WORKERS``) para no hacer esperar a quien sube la foto.
+
+``process``:
+
+- calcula el sha256 del archivo subido; si otra evidencia con el mismo contenido ya está
+  procesada, reutiliza sus archivos y suelta la copia nueva;
+- si no, ``render`` la re-codifica (orientación EXIF aplicada y luego descartada junto
+  con el resto de metadatos, p. ej. el GPS del teléfono) con lado máximo
+  ``EVIDENCE_MAX_DIMENSION`` y genera miniaturas WebP y JPEG de ``EVIDENCE_THUMBNAIL_SIZES``.
+
+Los archivos van al almacenamiento direccionado por contenido de ``Evidence.image``
+(``tickets.storage``): el original subido deja de estar referenciado y lo recoge
+``manage.py gc_evidence_files``. ``manage.py process_evidences`` procesa las evidencias
+pendientes (las anteriores a este cambio) con varios hilos.
+"""
+import hashlib
+import io
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from gestor_servicios import metrics
+from . import jobs
+from .models import Evidence
+from .storage import ContentAddressedStorage
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+@dataclass
+class Rendition:
+    """Resultado de ``render``: imagen principal y miniaturas ya codificadas."""
+    format: str
+    data: bytes
+    width: int
+    height: int
+    thumbnails: dict = field(default_factory=dict)  # ancho -> {'webp': bytes, 'jpeg': bytes, 'height': alto}
+
+
+def content_hash(fileobj, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    for chunk in iter(lambda: fileobj.read(chunk_size), b''):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _has_alpha(image):
+    return image.mode in ('RGBA', 'LA', 'PA') or (image.mode == 'P' and 'transparency' in image.info)
+
+
+def _flatten(image):
+    if image.mode != 'RGBA':
+        return image
+    background = Image.new('RGB', image.size, (255, 255, 255))
+    background.paste(image, mask=image.getchannel('A'))
+    return background
+
+
+def _encode(image, fmt):
+    buffer = io.BytesIO()
+    if fmt == 'JPEG':
+        image.save(buffer, 'JPEG', quality=_setting('EVIDENCE_JPEG_QUALITY', 82), optimize=True, progressive=True)
+    elif fmt == 'WEBP':
+        image.save(buffer, 'WEBP', quality=_setting('EVIDENCE_WEBP_QUALITY', 80), method=4)
+    else:
+        image.save(buffer, fmt, optimize=True)
+    return buffer.getvalue()
+
+
+def render(data):
+    """Re-codifica los bytes de una imagen subida y genera sus miniaturas (sin metadatos)."""
+    max_dimension = _setting('EVIDENCE_MAX_DIMENSION', 2560)
+    with Image.open(io.BytesIO(data)) as source:
+        # JPEG: decodifica ya reducida (escalado DCT), mucho más rápido con fotos de 12+ MP
+        source.draft('RGB', (max_dimension, max_dimension))
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if _has_alpha(image) else 'RGB')
+    image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    fmt = 'PNG' if image.mode == 'RGBA' else 'JPEG'
+    rendition = Rendition(fmt, _encode(image, fmt), image.width, image.height)
+    for size in sorted(_setting('EVIDENCE_THUMBNAIL_SIZES', (320, 640))):
+        if size >= max(image.size) and rendition.thumbnails:
+            break  # no se amplía: con una miniatura del tamaño original basta
+        thumb = image.copy()
+        thumb.thumbnail((size, size), Image.LANCZOS)
+        rendition.thumbnails[thumb.width] = {
+            'webp': _encode(thumb, 'WEBP'),
+            'jpeg': _encode(_flatten(thumb), 'JPEG'),
+            'height': thumb.height,
+        }
+    return rendition
+
+
+def store(evidence, digest, rendition):
+    """Escribe los archivos de ``rendition`` y apunta ``evidence`` a ellos."""
+    storage = evidence.image.storage
+    original = evidence.image.name
+    # El almacenamiento elige el nombre final por contenido; aquí solo cuentan directorio y extensión
+    name = storage.save(f'evidences/{digest}.{EXTENSIONS[rendition.format]}', ContentFile(rendition.data))
+    thumbnails = {}
+    for width, thumb in rendition.thumbnails.items():
+        thumbnails[str(width)] = {
+            'webp': storage.save(f'evidences/thumbs/{digest}-{width}.webp', ContentFile(thumb['webp'])),
+            'jpeg': storage.save(f'evidences/thumbs/{digest}-{width}.jpg', ContentFile(thumb['jpeg'])),
+            'height': thumb['height'],
+        }
+    _update(evidence, name, digest, rendition.width, rendition.height, thumbnails, original)
+
+
+def _update(evidence, name, digest, width, height, thumbnails, original):
+    evidence.image.name = name
+    evidence.content_hash = digest
+    evidence.width, evidence.height = width, height
+    evidence.thumbnails = thumbnails
+    evidence.processed_at = timezone.now()
+    evidence.save(update_fields=['image', 'content_hash', 'width', 'height', 'thumbnails', 'processed_at'])
+    storage = evidence.image.storage
+    if original != name and not ContentAddressedStorage.digest_of(original):
+        # Archivo anterior al almacenamiento por contenido: nadie más lo usa
+        transaction.on_commit(lambda: storage.delete(original))
+
+
+def process(evidence_id):
+    """Procesa una evidencia pendiente. Devuelve ``'processed'``, ``'reused'`` o ``None``."""
+    evidence = Evidence.objects.filter(pk=evidence_id).first()
+    if evidence is None or evidence.processed_at is not None:
+        return None  # borrada o ya procesada (reintento)
+    started = time.monotonic()
+    with evidence.image.open('rb') as fileobj:
+        # Con el almacenamiento por contenido el hash ya está en el nombre
+        digest = ContentAddressedStorage.digest_of(evidence.image.name) or content_hash(fileobj)
+        twin = (
+            Evidence.objects.filter(content_hash=digest, processed_at__isnull=False)
+            .exclude(pk=evidence.pk).first()
+        )
+        if twin is not None:
+            _update(evidence, twin.image.name, digest, twin.width, twin.height, twin.thumbnails, evidence.image.name)
+            metrics.inc('evidence.deduplicated')
+            return 'reused'
+        fileobj.seek(0)
+        data = fileobj.read()
+    rendition = render(data)
+    store(evidence, digest, rendition)
+    metrics.observe('evidence.process_seconds', time.monotonic() - started)
+    metrics.inc('evidence.bytes_in', len(data))
+    metrics.inc('evidence.bytes_out', len(rendition.data))
+    return 'processed'
+
+
+def pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(_setting('EVIDENCE_WORKERS', 2), thread_name_prefix='evidence')
+        return _pool
+
+
+def process_safely(evidence_id):
+    """``process`` en su propia transacción, para hilos del pool: registra el error en vez de propagarlo."""
+    try:
+        with transaction.atomic():
+            return process(evidence_id)
+    except Exception:
+        metrics.inc('evidence.failed')
+        logger.exception('Error procesando la evidencia %s', evidence_id)
+        return 'failed'
+    finally:
+        close_old_connections()
+
+
+def schedule(evidence):
+    """Procesa ``evidence`` fuera de la petición, tras confirmarse la transacción."""
+    if _setting('JOBS_EAGER', False):
+        transaction.on_commit(lambda: pool().submit(process_safely, evidence.pk))
+    else:
+        jobs.enqueue('evidence.process', {'evidence_id': evidence.pk}, priority=jobs.LOW, key=f'evidence.process:{evidence.pk}')
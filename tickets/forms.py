@@ -1,5 +1,6 @@
 from django import forms
 from .models import Ticket, TicketStatus, TicketPriority
+from . import uploads
 
 
 class TicketCreateForm(forms.ModelForm):
@@ -68,3 +69,10 @@ class TicketNoteForm(forms.Form):
 
 class EvidenceForm(forms.Form):
     image = forms.ImageField(label='Imagen')
+
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        limit = uploads.max_bytes()
+        if image.size > limit:
+            raise forms.ValidationError(f'La imagen supera el máximo de {limit // (1024 * 1024)} MB.')
+        return image
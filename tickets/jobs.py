@@ -0,0 +1,150 @@
+"""Cola de trabajos en base de datos para los efectos secundarios de los cambios de tickets.
+
+Las vistas sólo escriben el ticket y encolan (``enqueue``) lo demás: un ``INSERT`` en
+``Job`` dentro de la misma transacción, de modo que el trabajo existe si y sólo si el
+cambio se confirmó. ``manage.py run_jobs`` los ejecuta por prioridad (menor número
+primero) y luego por antigüedad, reintenta los fallidos con espera exponencial y
+guarda la duración de cada uno en ``Job.duration_ms``.
+
+Los manejadores se registran con ``@handler('nombre')`` (ver ``tickets.tasks``) y
+reciben el ``payload`` como argumentos con nombre; se ejecutan dentro de una
+transacción, así que un reintento no deja efectos a medias.
+
+Con ``JOBS_EAGER`` (desarrollo sin worker) el trabajo se ejecuta en el propio proceso
+al confirmarse la transacción, sin pasar por la tabla.
+"""
+import logging
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from gestor_servicios import metrics, queue
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+Status = Job.Status
+
+HIGH = 0
+NORMAL = 5
+LOW = 9
+
+_handlers = {}
+
+
+def handler(name):
+    """Registra la función decorada como manejador de los trabajos ``name``."""
+    def decorator(func):
+        _handlers[name] = func
+        return func
+    return decorator
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _run_eager(name, payload):
+    try:
+        _execute(name, payload)
+    except Exception:
+        logger.exception('Error ejecutando el trabajo %s', name)
+
+
+def enqueue(name, payload=None, priority=NORMAL, key=None, delay=None):
+    """Encola el trabajo ``name``; devuelve el ``Job`` (el existente si ``key`` ya estaba).
+
+    En modo ``JOBS_EAGER`` se ejecuta tras el commit y devuelve ``None``.
+    """
+    if name not in _handlers:
+        raise KeyError(f'Trabajo sin manejador: {name}')
+    payload = payload or {}
+    if _setting('JOBS_EAGER', False):
+        transaction.on_commit(lambda: _run_eager(name, payload))
+        return None
+    run_at = timezone.now() + timedelta(seconds=delay) if delay else timezone.now()
+    if key is None:
+        return Job.objects.create(name=name, payload=payload, priority=priority, run_at=run_at)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(name=name, payload=payload, priority=priority, run_at=run_at, idempotency_key=key)
+    except IntegrityError:
+        metrics.inc('jobs.duplicates')
+        return Job.objects.get(idempotency_key=key)
+
+
+def backoff(attempts):
+    base = _setting('JOBS_RETRY_SECONDS', 10)
+    return min(base * 2 ** max(attempts - 1, 0), 3600)
+
+
+def requeue_stale():
+    """Devuelve a la cola los trabajos de un worker que murió a mitad de ejecución."""
+    return Job.objects.filter(status=Status.RUNNING, run_at__lte=timezone.now()).update(status=Status.PENDING)
+
+
+def claim(limit=20):
+    now = timezone.now()
+    # run_at de un trabajo RUNNING es su plazo: vencido, requeue_stale lo recupera
+    lease = now + timedelta(seconds=_setting('JOBS_LEASE_SECONDS', 300))
+    due = Job.objects.filter(run_at__lte=now).order_by('priority', 'run_at', 'id')
+    return queue.claim(due, limit, 'status', Status.PENDING, status=Status.RUNNING, run_at=lease, started_at=now)
+
+
+def _execute(name, payload):
+    func = _handlers[name]
+    started = time.monotonic()
+    try:
+        with transaction.atomic():
+            func(**payload)
+    finally:
+        elapsed = time.monotonic() - started
+        metrics.observe(f'jobs.{name}.seconds', elapsed)
+    metrics.inc('jobs.done')
+    return elapsed
+
+
+def run_job(job):
+    """Ejecuta un trabajo ya reclamado y guarda el resultado. Devuelve el estado final."""
+    attempts = job.attempts + 1
+    try:
+        elapsed = _execute(job.name, job.payload)
+    except Exception as exc:
+        if attempts >= _setting('JOBS_MAX_ATTEMPTS', 5):
+            status, run_at = Status.FAILED, timezone.now()
+            metrics.inc('jobs.failed')
+            logger.exception('Trabajo %s #%s descartado tras %s intentos', job.name, job.pk, attempts)
+        else:
+            status, run_at = Status.PENDING, timezone.now() + timedelta(seconds=backoff(attempts))
+            metrics.inc('jobs.retried')
+            logger.warning('Trabajo %s #%s falló (intento %s): %r', job.name, job.pk, attempts, exc)
+        Job.objects.filter(pk=job.pk).update(status=status, attempts=attempts, run_at=run_at, last_error=repr(exc)[:1000])
+        return status
+    Job.objects.filter(pk=job.pk).update(
+        status=Status.DONE, attempts=attempts, finished_at=timezone.now(),
+        duration_ms=int(elapsed * 1000), last_error='',
+    )
+    return Status.DONE
+
+
+def run_pending(limit=20):
+    """Reclama y ejecuta un lote. Devuelve ``{estado: n}``."""
+    result = {Status.DONE: 0, Status.PENDING: 0, Status.FAILED: 0}
+    for job in claim(limit):
+        result[run_job(job)] += 1
+    return result
+
+
+def queue_stats():
+    stats = Job.objects.exclude(status=Status.DONE).aggregate(
+        pending=Count('id', filter=Q(status__in=[Status.PENDING, Status.RUNNING])),
+        failed=Count('id', filter=Q(status=Status.FAILED)),
+        oldest=Min('created_at', filter=Q(status=Status.PENDING)),
+    )
+    oldest = stats.pop('oldest')
+    stats['oldest_pending_seconds'] = round((timezone.now() - oldest).total_seconds(), 1) if oldest else 0
+    return stats
@@ -0,0 +1,61 @@
+"""Listado de tickets en vivo: la ventana de filas que tiene en pantalla cada conexión.
+
+La página se suscribe al tema ``tickets`` con sus filtros (``status``, ``priority``,
+``office``, ``tech``, ``q``, ``sort``) y su ventana: ``page`` (paginación clásica) o
+``size`` (filas cargadas desde arriba con "Cargar más"). ``StatsConsumer`` guarda un
+``ListWindow`` por conexión con los ids visibles y, por cada ``stats_update``:
+
+- si ningún ticket cambiado estaba en pantalla ni cumple los filtros, no envía nada
+  (un ``EXISTS`` sobre los ids cambiados, sin repetir la consulta del listado);
+- si no, recalcula sólo los ids de la ventana y envía ``{'order': [...], 'rows': {...}}``
+  con el orden nuevo y el HTML de las filas cambiadas o recién entradas; el resto se
+  reutiliza del DOM. Así se evita el ``reloadTbody()`` completo en cada cambio.
+"""
+from .access import DEFAULT_SORT, SORTS, filter_tickets, order_tickets, render_rows
+
+PAGE_SIZE = 10  # como tickets.views.index
+MAX_WINDOW = 200  # "Cargar más" no puede pedir ventanas arbitrarias
+FILTER_KEYS = ('status', 'priority', 'office', 'tech', 'q')
+
+
+def _positive_int(value):
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        return None
+    return value if value > 0 else None
+
+
+class ListWindow:
+    def __init__(self, user, filters):
+        self.user = user
+        self.filters = {k: str(filters[k]) for k in FILTER_KEYS if filters.get(k) not in (None, '')}
+        sort = filters.get('sort')
+        self.sort = sort if sort in SORTS else DEFAULT_SORT
+        page = _positive_int(filters.get('page'))
+        if page:
+            self.offset, self.size = (page - 1) * PAGE_SIZE, PAGE_SIZE
+        else:
+            self.offset, self.size = 0, min(_positive_int(filters.get('size')) or PAGE_SIZE, MAX_WINDOW)
+        self.ids = []
+
+    def matching(self):
+        return filter_tickets(self.user, self.filters)
+
+    def refresh(self):
+        """Vuelve a leer los ids de la ventana (sólo ids, sin renderizar)."""
+        qs = order_tickets(self.matching(), self.sort, self.filters.get('q'))
+        self.ids = list(qs.values_list('id', flat=True)[self.offset:self.offset + self.size])
+        return self.ids
+
+    def update(self, ticket_ids):
+        """``{'order', 'rows'}`` tras cambiar ``ticket_ids``; ``None`` si la ventana no cambia."""
+        changed = set(ticket_ids)
+        previous = list(self.ids)
+        if not changed & set(previous) and not self.matching().filter(id__in=changed).exists():
+            return None
+        self.refresh()
+        if self.ids == previous and not changed & set(previous):
+            return None  # cumple los filtros pero cae fuera de la ventana
+        render = [ticket_id for ticket_id in self.ids if ticket_id in changed or ticket_id not in previous]
+        return {'order': self.ids, 'rows': render_rows(self.user, render) if render else {}}
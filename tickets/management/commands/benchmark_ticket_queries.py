@@ -0,0 +1,192 @@
+import random
+import statistics
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from accounts.models import CustomUser, Notification, Roles
+from gestor_servicios.dates import date_range_q, today_q
+from gestor_servicios.pagination import CursorPaginator
+from oficinas.models import Office
+from tickets.models import Ticket, TicketPriority, TicketStatus
+
+
+class Rollback(Exception):
+    pass
+
+
+@contextmanager
+def manual_timestamps(*models):
+    """Permite fijar created_at al sembrar (auto_now_add lo pisaría)."""
+    fields = [m._meta.get_field('created_at') for m in models]
+    saved = [f.auto_now_add for f in fields]
+    for f in fields:
+        f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, value in zip(fields, saved):
+            f.auto_now_add = value
+
+
+def hot_queries(ctx):
+    """Consultas de las vistas calientes: (etiqueta, queryset, evaluación)."""
+    office, tech, user = ctx['office'], ctx['tech'], ctx['user']
+    open_statuses = [TicketStatus.ASSIGNED, TicketStatus.IN_PROGRESS, TicketStatus.PENDING_SUPPLIES]
+    today = timezone.localdate()
+    since = today - timedelta(days=30)
+    page = lambda qs, ordering: CursorPaginator(qs, ordering, 10).get_page()  # noqa: E731
+    return [
+        ('tickets jefe, -created_at (1ª página)', Ticket.objects.order_by('-created_at', '-id')[:11],
+         lambda qs: page(Ticket.objects.all(), '-created_at')),
+        ('tickets jefe, -priority (1ª página)', Ticket.objects.order_by('-priority', '-id')[:11],
+         lambda qs: page(Ticket.objects.all(), '-priority')),
+        ('tickets supervisor (oficina)', Ticket.objects.filter(assigned_office=office).order_by('-created_at', '-id')[:11],
+         lambda qs: page(Ticket.objects.filter(assigned_office=office), '-created_at')),
+        ('tickets supervisor, estado=En curso', Ticket.objects.filter(assigned_office=office, status=TicketStatus.IN_PROGRESS).order_by('-created_at', '-id')[:11],
+         list),
+        ('tickets técnico (abiertos)', Ticket.objects.filter(technician=tech, status__in=open_statuses).order_by('-created_at')[:11],
+         list),
+        ('abiertos de la oficina por prioridad', Ticket.objects.filter(assigned_office=office).exclude(status=TicketStatus.COMPLETED).order_by('-priority', 'created_at')[:20],
+         list),
+        # El mismo filtro de 30 días locales: __date no usa el índice, el rango semiabierto sí
+        ('created_at__date 30 días (no sargable)', Ticket.objects.filter(created_at__date__range=(since, today)).values('id'),
+         lambda qs: qs.count()),
+        ('date_range_q 30 días', Ticket.objects.filter(date_range_q(since, today)).values('id'),
+         lambda qs: qs.count()),
+        ('creados hoy en la oficina', Ticket.objects.filter(today_q(), assigned_office=office).values('id'),
+         lambda qs: qs.count()),
+        ('ETag tbody oficina (MAX updated_at)', Ticket.objects.filter(assigned_office=office).values('assigned_office'),
+         lambda qs: qs.aggregate(last=Max('updated_at'), total=Count('id'))),
+        ('notificaciones no leídas', Notification.objects.filter(recipient=user, read_at__isnull=True).values('id'),
+         lambda qs: qs.count()),
+        ('últimas 5 notificaciones', Notification.objects.filter(recipient=user).order_by('-created_at')[:5],
+         list),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed N tickets inside a transaction, time the hot ticket/notification queries "
+        "without and with the model indexes and print their query plans. Everything is "
+        "rolled back at the end unless --keep is given"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tickets', type=int, default=100000, help='Tickets to seed (default 100000)')
+        parser.add_argument('--offices', type=int, default=20)
+        parser.add_argument('--technicians', type=int, default=100)
+        parser.add_argument('--notifications', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per query; the median is reported')
+        parser.add_argument('--plans', action='store_true', help='Print the full query plans')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded rows (indexes are always restored)')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['tickets'] < 1:
+            raise CommandError('--tickets must be positive')
+        try:
+            with transaction.atomic():
+                ctx = self.seed(options)
+                self.analyze()
+                before = self.run_queries(ctx, options, 'sin índices', drop=True)
+                after = self.run_queries(ctx, options, 'con índices', drop=False)
+                self.report(before, after)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            self.stdout.write('Datos de prueba descartados (rollback).')
+
+    def seed(self, options):
+        rng = random.Random(options['seed'])
+        tag = f'bench{int(time.time())}'
+        started = time.monotonic()
+        offices = Office.objects.bulk_create([Office(name=f'{tag} oficina {i}') for i in range(options['offices'])])
+        if not offices[0].pk:
+            offices = list(Office.objects.filter(name__startswith=f'{tag} '))
+        techs = CustomUser.objects.bulk_create([
+            CustomUser(username=f'{tag}_t{i}', role=Roles.TECNICO, approved=True,
+                       office=offices[i % len(offices)], password='!')
+            for i in range(options['technicians'])
+        ])
+        if not techs[0].pk:
+            techs = list(CustomUser.objects.filter(username__startswith=f'{tag}_t'))
+        user = CustomUser.objects.create(username=f'{tag}_jefe', role=Roles.JEFE, approved=True, password='!')
+
+        now = timezone.now()
+        statuses = [s.value for s in TicketStatus]
+        # Histórico realista: la mayoría completados
+        weights = [1, 2, 2, 1, 14]
+        with manual_timestamps(Ticket, Notification):
+            batch = []
+            for n in range(options['tickets']):
+                tech = rng.choice(techs)
+                created = now - timedelta(minutes=rng.randrange(60 * 24 * 730))
+                batch.append(Ticket(
+                    requester_name=f'Solicitante {n}', description='benchmark',
+                    priority=rng.choice(TicketPriority.values),
+                    assigned_office_id=tech.office_id, technician=tech,
+                    status=rng.choices(statuses, weights)[0], created_at=created,
+                ))
+                if len(batch) == 5000:
+                    Ticket.objects.bulk_create(batch)
+                    batch = []
+            Ticket.objects.bulk_create(batch)
+            recipients = [user] + techs[:10]
+            Notification.objects.bulk_create([
+                Notification(
+                    recipient=rng.choice(recipients), text='benchmark',
+                    created_at=now - timedelta(minutes=rng.randrange(60 * 24 * 365)),
+                    read_at=None if rng.random() < 0.05 else now,
+                )
+                for _ in range(options['notifications'])
+            ], batch_size=5000)
+        self.stdout.write(
+            f"Sembrados {options['tickets']} tickets y {options['notifications']} notificaciones "
+            f"en {time.monotonic() - started:.1f}s ({connection.vendor})"
+        )
+        return {'office': techs[0].office, 'tech': techs[0], 'user': user}
+
+    def analyze(self):
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def _indexes(self):
+        return [(model, index) for model in (Ticket, Notification) for index in model._meta.indexes]
+
+    def run_queries(self, ctx, options, label, drop):
+        # Sin entrar en el contexto del schema editor: en SQLite no se permite dentro
+        # de la transacción, pero crear/borrar índices no lo necesita
+        editor = connection.schema_editor()
+        editor.deferred_sql = []
+        for model, index in self._indexes():
+            sql = index.remove_sql(model, editor) if drop else index.create_sql(model, editor)
+            editor.execute(sql)
+        self.analyze()
+
+        results = []
+        for name, qs, evaluate in hot_queries(ctx):
+            timings = []
+            for _ in range(options['repeat']):
+                t0 = time.perf_counter()
+                evaluate(qs._chain())
+                timings.append(time.perf_counter() - t0)
+            plan = qs.explain()
+            results.append((name, statistics.median(timings), plan))
+            if options['plans']:
+                self.stdout.write(f'--- [{label}] {name}\n{plan}\n')
+        return results
+
+    def report(self, before, after):
+        self.stdout.write('')
+        self.stdout.write(f"{'consulta':<42} {'sin índices':>12} {'con índices':>12} {'x':>7}")
+        for (name, slow, _), (_, fast, plan) in zip(before, after):
+            speedup = slow / fast if fast else float('inf')
+            self.stdout.write(f'{name:<42} {slow * 1000:>10.2f}ms {fast * 1000:>10.2f}ms {speedup:>6.1f}x')
+            self.stdout.write(f"    plan: {' | '.join(line.strip() for line in plan.splitlines()[:3])}")
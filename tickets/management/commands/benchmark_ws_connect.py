@@ -0,0 +1,65 @@
+import asyncio
+import time
+
+from channels.testing import WebsocketCommunicator
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts import snapshot
+from accounts.models import CustomUser, Roles
+from gestor_servicios.consumers import StatsConsumer
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure ws/stats/ connection setup rate (connect, 'connected' reply, disconnect) "
+        "with the role/office snapshot cold and warm in the cache"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=500, help='Sequential connections per run (default 500)')
+        parser.add_argument('--concurrency', type=int, default=20, help='Connections set up at the same time (default 20)')
+        parser.add_argument('--username', help='Connect as this user (default: first active supervisor, else any active user)')
+
+    def handle(self, *args, **options):
+        if options['connections'] < 1 or options['concurrency'] < 1:
+            raise CommandError('--connections and --concurrency must be positive')
+        users = CustomUser.objects.filter(is_active=True)
+        if options['username']:
+            user = users.filter(username=options['username']).first()
+        else:
+            user = users.filter(role=Roles.SUPERVISOR, office__isnull=False).first() or users.first()
+        if user is None:
+            raise CommandError('No active user to connect as (run seed_demo first)')
+        # Como AuthMiddlewareStack: el usuario llega cargado, sin la oficina
+        user = CustomUser.objects.get(pk=user.pk)
+        self.stdout.write(f"Connecting as {user.username} ({user.role}, office={user.office_id})")
+
+        for label, cold in (('cold snapshot', True), ('warm snapshot', False)):
+            cache.clear()
+            snapshot.store(user)
+            seconds = asyncio.run(self.run(user, options['connections'], options['concurrency'], cold))
+            self.stdout.write(
+                f"{label}: {options['connections']} connections in {seconds:.2f}s "
+                f"({options['connections'] / seconds:.0f}/s, {seconds / options['connections'] * 1000:.2f}ms each)"
+            )
+
+    async def run(self, user, connections, concurrency, cold):
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one():
+            async with semaphore:
+                if cold:
+                    await cache.adelete(snapshot.KEY.format(user.pk))
+                communicator = WebsocketCommunicator(StatsConsumer.as_asgi(), '/ws/stats/')
+                communicator.scope['user'] = user
+                ok, _ = await communicator.connect()
+                if ok:
+                    reply = await communicator.receive_json_from()
+                    if reply.get('type') != 'connected':
+                        raise CommandError(f'Unexpected reply: {reply}')
+                await communicator.disconnect()
+
+        started = time.monotonic()
+        await asyncio.gather(*(one() for _ in range(connections)))
+        return time.monotonic() - started
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tickets import blobs, uploads
+from tickets.models import Blob
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete evidence files no evidence references any more (refcount 0 for longer than "
+        "EVIDENCE_GC_GRACE_HOURS), content-addressed files without a Blob row, stale upload temp files "
+        "and chunked uploads abandoned for longer than EVIDENCE_UPLOAD_TTL_HOURS"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recount', action='store_true', help='Recompute reference counts from evidences first')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows/files per batch (default 500)')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+        if options['recount']:
+            self.stdout.write(f'Reference counts corrected: {blobs.recount()}')
+        if not options['dry_run']:
+            self.stdout.write(f'Abandoned chunked uploads removed: {uploads.expire()}')
+        report = blobs.collect(chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+        verb = 'Would reclaim' if options['dry_run'] else 'Reclaimed'
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb} {report['bytes'] / 1e6:.1f} MB: {report['blobs']} unreferenced, "
+            f"{report['orphans']} orphaned, {report['temporary']} temporary files; "
+            f"{Blob.objects.filter(refcount__gt=0).count()} files in use"
+        ))
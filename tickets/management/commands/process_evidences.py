@@ -0,0 +1,36 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from gestor_servicios import metrics
+from tickets import evidence
+from tickets.models import Evidence
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-encode pending evidence photos (bounded size, no EXIF) and generate their WebP/JPEG "
+        "thumbnails using a thread pool. Use it once after deploying the image pipeline"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Threads (default 4)')
+        parser.add_argument('--limit', type=int, default=None, help='Process at most this many evidences')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be positive')
+        ids = Evidence.objects.filter(processed_at__isnull=True).order_by('id').values_list('id', flat=True)
+        ids = list(ids[:options['limit']] if options['limit'] else ids)
+        started = time.monotonic()
+        with ThreadPoolExecutor(options['workers'], thread_name_prefix='evidence') as pool:
+            results = Counter(pool.map(evidence.process_safely, ids))
+        elapsed = time.monotonic() - started
+        bytes_in, bytes_out = metrics.get('evidence.bytes_in'), metrics.get('evidence.bytes_out')
+        saved = f' ({bytes_in / 1e6:.1f} MB -> {bytes_out / 1e6:.1f} MB)' if bytes_in else ''
+        self.stdout.write(self.style.SUCCESS(
+            f"Evidences: processed={results['processed']} reused={results['reused']} "
+            f"failed={results['failed']} in {elapsed:.1f}s{saved}"
+        ))
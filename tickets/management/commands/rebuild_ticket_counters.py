@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from gestor_servicios.dates import parse_date
+from tickets import counters
+
+
+class Command(BaseCommand):
+    help = "Rebuild the denormalized ticket counters from the tickets table, or check them with --check"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only compare counters against live aggregates (exit with error on mismatch)')
+        parser.add_argument('--since', help='First local day (YYYY-MM-DD) to rebuild/check; default: all')
+        parser.add_argument('--until', help='Last local day (YYYY-MM-DD) to rebuild/check; default: all')
+
+    def handle(self, *args, **options):
+        window = {}
+        for name, key in (('since', 'start'), ('until', 'end')):
+            if options[name]:
+                window[key] = parse_date(options[name])
+                if window[key] is None:
+                    raise CommandError(f"--{name} must be a date in YYYY-MM-DD format")
+        if options['check']:
+            diffs = counters.check_consistency(**window)
+            if diffs:
+                for diff in diffs[:20]:
+                    self.stdout.write(f"{diff['dims']}: expected={diff['expected']} actual={diff['actual']}")
+                if len(diffs) > 20:
+                    self.stdout.write(f"... and {len(diffs) - 20} more")
+                raise CommandError(f"Ticket counters out of sync: {len(diffs)} mismatching rows")
+            self.stdout.write(self.style.SUCCESS("Ticket counters are consistent"))
+            return
+
+        created = counters.rebuild(**window)
+        self.stdout.write(self.style.SUCCESS(f"Ticket counters rebuilt: {created} rows"))
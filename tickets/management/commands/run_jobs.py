@@ -0,0 +1,51 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from gestor_servicios import metrics
+from tickets import jobs
+
+
+class Command(BaseCommand):
+    help = (
+        "Run queued background jobs (tickets.Job) by priority. With --loop keeps polling "
+        "every --interval seconds; several workers can run at once on PostgreSQL"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='Keep running until interrupted')
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds to sleep when the queue is empty (default 1)')
+        parser.add_argument('--batch-size', type=int, default=20, help='Jobs claimed per batch (default 20)')
+
+    def handle(self, *args, **options):
+        totals = {status: 0 for status in (jobs.Status.DONE, jobs.Status.PENDING, jobs.Status.FAILED)}
+        try:
+            while True:
+                close_old_connections()
+                jobs.requeue_stale()
+                result = jobs.run_pending(options['batch_size'])
+                for status, count in result.items():
+                    totals[status] += count
+                if any(result.values()):
+                    self.stdout.write(
+                        f"done={result[jobs.Status.DONE]} retried={result[jobs.Status.PENDING]} "
+                        f"failed={result[jobs.Status.FAILED]}"
+                    )
+                    continue
+                if not options['loop']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        for name, value in sorted(metrics.snapshot().items()):
+            if name.startswith('jobs.') and name.endswith('.seconds.count'):
+                base = name[:-len('.count')]
+                self.stdout.write(
+                    f"{base[len('jobs.'):-len('.seconds')]}: n={value} "
+                    f"avg={metrics.get(base + '.sum') / value * 1000:.1f}ms max={metrics.get(base + '.max') * 1000:.1f}ms"
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f"Jobs: done={totals[jobs.Status.DONE]} retried={totals[jobs.Status.PENDING]} "
+            f"failed={totals[jobs.Status.FAILED]} queue={jobs.queue_stats()}"
+        ))
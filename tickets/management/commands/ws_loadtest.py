@@ -0,0 +1,130 @@
+import asyncio
+import time
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.models import CustomUser, Roles
+from gestor_servicios import metrics
+from gestor_servicios.consumers import StatsConsumer
+from tickets import broadcast
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+class Command(BaseCommand):
+    help = (
+        "Open many ws/stats/ connections as jefe against the configured channel layer, "
+        "broadcast stats_update messages to stats_jefes and report delivery latency and drops"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', type=int, default=1000, help='Concurrent WebSocket connections (default 1000)')
+        parser.add_argument('--messages', type=int, default=20, help='Messages broadcast to stats_jefes (default 20)')
+        parser.add_argument('--interval', type=float, default=0.05, help='Seconds between messages (default 0.05)')
+        parser.add_argument('--timeout', type=float, default=30.0, help='Seconds to wait for deliveries after the last send')
+
+    def handle(self, *args, **options):
+        if options['connections'] < 1 or options['messages'] < 1:
+            raise CommandError('--connections and --messages must be positive')
+        layer = settings.CHANNEL_LAYERS['default']['BACKEND']
+        self.stdout.write(
+            f"Channel layer: {layer} (capacity {settings.CHANNEL_LAYER_CAPACITY}), "
+            f"stats_jefes shards: {broadcast.shard_count('stats_jefes')}"
+        )
+        metrics.reset()
+        asyncio.run(self.run(**options))
+
+    async def run(self, connections, messages, interval, timeout, **options):
+        # Usuario jefe sin guardar: la conexión no necesita tocar la base de datos
+        user = CustomUser(id=0, username='ws-loadtest', role=Roles.JEFE)
+
+        started = time.monotonic()
+        communicators = []
+        for _ in range(connections):
+            communicator = WebsocketCommunicator(StatsConsumer.as_asgi(), '/ws/stats/')
+            communicator.scope['user'] = user
+            communicators.append(communicator)
+        results = await asyncio.gather(*(self._connect(c) for c in communicators))
+        connected = [c for c, ok in zip(communicators, results) if ok]
+        connect_seconds = time.monotonic() - started
+        self.stdout.write(f"Connected {len(connected)}/{connections} in {connect_seconds:.2f}s")
+        if not connected:
+            raise CommandError('No connection could be established')
+
+        latencies = []
+        receivers = [
+            asyncio.ensure_future(self._receive(c, messages, latencies, timeout + messages * interval))
+            for c in connected
+        ]
+
+        channel_layer = get_channel_layer()
+        send_times = []
+        for seq in range(1, messages + 1):
+            message = {
+                'type': 'stats_update',
+                'payload': {
+                    'event': 'tickets_changed',
+                    'group': 'stats_jefes',
+                    'seq': seq,
+                    'sent_at': time.time(),
+                    'ticket_ids': [],
+                    'tickets': [],
+                },
+            }
+            t0 = time.monotonic()
+            for group in broadcast.shard_groups('stats_jefes'):
+                await channel_layer.group_send(group, message)
+            send_times.append(time.monotonic() - t0)
+            await asyncio.sleep(interval)
+
+        delivered = sum(await asyncio.gather(*receivers))
+        for communicator in connected:
+            await communicator.disconnect()
+
+        expected = len(connected) * messages
+        self.stdout.write(f"Delivered {delivered}/{expected} ({expected - delivered} dropped)")
+        self.stdout.write(
+            "Delivery latency: p50={:.1f}ms p95={:.1f}ms p99={:.1f}ms max={:.1f}ms".format(
+                *(1000 * _percentile(latencies, p) for p in (50, 95, 99, 100))
+            )
+        )
+        self.stdout.write(
+            "group_send per message: p50={:.1f}ms max={:.1f}ms".format(
+                1000 * _percentile(send_times, 50), 1000 * _percentile(send_times, 100)
+            )
+        )
+        style = self.style.SUCCESS if delivered == expected else self.style.WARNING
+        self.stdout.write(style('OK' if delivered == expected else 'Messages were dropped: raise CHANNEL_LAYER_CAPACITY or add shards'))
+
+    async def _connect(self, communicator):
+        ok, _ = await communicator.connect()
+        if ok:
+            reply = await communicator.receive_json_from()
+            ok = reply.get('type') == 'connected'
+        return ok
+
+    async def _receive(self, communicator, expected, latencies, deadline):
+        received = 0
+        end = time.monotonic() + deadline
+        while received < expected:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                message = await communicator.receive_json_from(timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            if message.get('type') != 'stats_update':
+                continue
+            latencies.append(time.time() - message['data']['sent_at'])
+            received += 1
+        return received
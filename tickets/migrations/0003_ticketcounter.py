@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 09:55
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def populate_counters(apps, schema_editor):
+    Ticket = apps.get_model('tickets', 'Ticket')
+    TicketCounter = apps.get_model('tickets', 'TicketCounter')
+    rows = (
+        Ticket.objects
+        .annotate(day=TruncDate('created_at'))
+        .values('assigned_office_id', 'status', 'priority', 'technician_id', 'supervisor_id', 'day')
+        .annotate(total=Count('id'))
+        .order_by()
+    )
+    TicketCounter.objects.bulk_create(
+        [TicketCounter(count=row.pop('total'), **row) for row in rows],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oficinas', '0001_initial'),
+        ('tickets', '0002_ticket_requester_office_text_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('DRAFT', 'Borrador'), ('ASSIGNED', 'Asignado'), ('IN_PROGRESS', 'En curso'), ('PENDING_SUPPLIES', 'Pendiente por insumos'), ('COMPLETED', 'Completado')], max_length=20)),
+                ('priority', models.IntegerField(choices=[(1, 'Muy baja'), (2, 'Baja'), (3, 'Media'), (4, 'Alta'), (5, 'Urgente')])),
+                ('day', models.DateField()),
+                ('count', models.IntegerField(default=0)),
+                ('assigned_office', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='ticket_counters', to='oficinas.office')),
+                ('supervisor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ticket_counters_as_supervisor', to=settings.AUTH_USER_MODEL)),
+                ('technician', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ticket_counters_as_technician', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('assigned_office', 'status', 'priority', 'technician', 'supervisor', 'day'), name='ticket_counter_dims_unique')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
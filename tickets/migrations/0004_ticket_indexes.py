@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oficinas', '0001_initial'),
+        ('tickets', '0003_ticketcounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['-created_at', '-id'], name='ticket_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['-updated_at', '-id'], name='ticket_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['-priority', '-id'], name='ticket_priority_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['assigned_office', '-created_at', '-id'], name='ticket_office_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['assigned_office', 'status', '-created_at'], name='ticket_office_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(fields=['technician', 'status', '-created_at'], name='ticket_tech_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ticket',
+            index=models.Index(condition=models.Q(('status', 'COMPLETED'), _negated=True), fields=['assigned_office', '-priority', 'created_at'], name='ticket_open_office_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-18 10:26
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0004_ticket_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('payload', models.JSONField(blank=True, default=dict)),
+                ('priority', models.PositiveSmallIntegerField(default=5)),
+                ('idempotency_key', models.CharField(blank=True, max_length=200, null=True, unique=True)),
+                ('status', models.CharField(choices=[('PENDING', 'Pendiente'), ('RUNNING', 'En ejecución'), ('DONE', 'Hecho'), ('FAILED', 'Fallido')], default='PENDING', max_length=8)),
+                ('attempts', models.PositiveSmallIntegerField(default=0)),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_ms', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('status', 'PENDING')), fields=['priority', 'run_at', 'id'], name='job_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0005_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evidence',
+            name='content_hash',
+            field=models.CharField(blank=True, db_index=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='evidence',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='evidence',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='evidence',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='evidence',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:03
+
+import tickets.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0006_evidence_processing'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='evidence',
+            name='image',
+            field=models.ImageField(storage=tickets.storage.evidence_storage, upload_to='evidences/'),
+        ),
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('sha256', models.CharField(db_index=True, max_length=64)),
+                ('size', models.BigIntegerField(default=0)),
+                ('refcount', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('refcount__lte', 0)), fields=['updated_at'], name='blob_unreferenced_idx')],
+            },
+        ),
+    ]
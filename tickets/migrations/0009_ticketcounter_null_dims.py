@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-18 11:17
+
+import django.db.models.functions.comparison
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+from django.db.models.functions import TruncDate
+
+DIMENSIONS = ('assigned_office_id', 'status', 'priority', 'technician_id', 'supervisor_id', 'day')
+
+
+def merge_duplicates(apps, schema_editor):
+    # Filas repetidas que la restricción anterior dejaba pasar (técnico/supervisor NULL).
+    # Cada copia recibió los mismos incrementos: se deja una con el conteo real.
+    Ticket = apps.get_model('tickets', 'Ticket')
+    TicketCounter = apps.get_model('tickets', 'TicketCounter')
+    duplicated = (
+        TicketCounter.objects.values(*DIMENSIONS)
+        .annotate(rows=Count('id'), keep=Min('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for group in duplicated:
+        dims = {name: group[name] for name in DIMENSIONS}
+        TicketCounter.objects.filter(**dims).exclude(pk=group['keep']).delete()
+        live = Ticket.objects.annotate(day=TruncDate('created_at')).filter(**dims).count()
+        TicketCounter.objects.filter(pk=group['keep']).update(count=live)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('oficinas', '0001_initial'),
+        ('tickets', '0008_evidence_upload'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.RemoveConstraint(
+            model_name='ticketcounter',
+            name='ticket_counter_dims_unique',
+        ),
+        migrations.AddConstraint(
+            model_name='ticketcounter',
+            constraint=models.UniqueConstraint(models.F('assigned_office'), models.F('status'), models.F('priority'), django.db.models.functions.comparison.Coalesce('technician', 0), django.db.models.functions.comparison.Coalesce('supervisor', 0), models.F('day'), name='ticket_counter_dims_unique'),
+        ),
+    ]
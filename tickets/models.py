@@ -1,6 +1,12 @@
+import uuid
+
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
+from .storage import evidence_storage
+
 
 class TicketPriority(models.IntegerChoices):
 	P1 = 1, _('Muy baja')
@@ -32,6 +38,25 @@ class Ticket(models.Model):
 	created_at = models.DateTimeField(auto_now_add=True)
 	updated_at = models.DateTimeField(auto_now=True)
 
+	class Meta:
+		# Índices según las consultas reales (ver benchmark_ticket_queries):
+		# listados por rol ordenados por fecha/prioridad con id como desempate (cursor),
+		# filtros oficina/técnico + estado, rangos de created_at y MAX(updated_at) de los ETag.
+		indexes = [
+			models.Index(fields=['-created_at', '-id'], name='ticket_created_idx'),
+			models.Index(fields=['-updated_at', '-id'], name='ticket_updated_idx'),
+			models.Index(fields=['-priority', '-id'], name='ticket_priority_idx'),
+			models.Index(fields=['assigned_office', '-created_at', '-id'], name='ticket_office_created_idx'),
+			models.Index(fields=['assigned_office', 'status', '-created_at'], name='ticket_office_status_idx'),
+			models.Index(fields=['technician', 'status', '-created_at'], name='ticket_tech_status_idx'),
+			# Solo tickets abiertos (la mayoría del histórico está completado)
+			models.Index(
+				fields=['assigned_office', '-priority', 'created_at'],
+				name='ticket_open_office_idx',
+				condition=~models.Q(status='COMPLETED'),
+			),
+		]
+
 	def __str__(self):
 		return f"{self.requester_name} - {self.get_priority_display()} ({self.get_status_display()})"
 
@@ -46,12 +71,185 @@ class TicketNote(models.Model):
 		return f"Nota {self.id} para Ticket {self.ticket_id}"
 
 
+class TicketEvent(models.Model):
+	"""Cambio de un ticket que encola avisos (asignación, pendiente de insumos).
+
+	Su ``id`` forma la clave de idempotencia del trabajo: dos reasignaciones en el mismo
+	segundo son dos eventos y dos avisos.
+	"""
+
+	class Kind(models.TextChoices):
+		ASSIGNED = 'ASSIGNED', _('Asignado')
+		PENDING_SUPPLIES = 'PENDING_SUPPLIES', _('Pendiente de insumos')
+
+	ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='events')
+	kind = models.CharField(max_length=20, choices=Kind.choices)
+	# Quién lo provocó (supervisor que asigna, técnico que pide insumos)
+	user = models.ForeignKey('accounts.CustomUser', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self):
+		return f"{self.get_kind_display()} #{self.id} de Ticket {self.ticket_id}"
+
+
 class Evidence(models.Model):
+	"""Foto de un ticket. ``tickets.evidence`` la procesa fuera de la petición: la re-codifica
+	con un tamaño máximo y sin EXIF y genera miniaturas WebP/JPEG (``thumbnails``:
+	``{ancho: {'webp': nombre, 'jpeg': nombre, 'height': alto}}``). Hasta entonces
+	``processed_at`` es nulo y se muestra la imagen tal como se subió.
+	"""
 	ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='evidences')
-	image = models.ImageField(upload_to='evidences/')
+	# Direccionado por contenido (tickets.storage): la misma foto en varios tickets es un solo archivo
+	image = models.ImageField(upload_to='evidences/', storage=evidence_storage)
 	uploaded_at = models.DateTimeField(auto_now_add=True)
+	# sha256 del archivo subido: la misma foto subida dos veces reutiliza lo ya procesado
+	content_hash = models.CharField(max_length=64, blank=True, db_index=True)
+	width = models.PositiveIntegerField(null=True, blank=True)
+	height = models.PositiveIntegerField(null=True, blank=True)
+	thumbnails = models.JSONField(default=dict, blank=True)
+	processed_at = models.DateTimeField(null=True, blank=True)
 
 	def __str__(self):
 		return f"Evidencia {self.id} Ticket {self.ticket_id}"
 
+	def _srcset(self, fmt):
+		return ', '.join(
+			f"{self.image.storage.url(thumb[fmt])} {width}w"
+			for width, thumb in sorted(self.thumbnails.items(), key=lambda item: int(item[0]))
+		)
+
+	@property
+	def webp_srcset(self):
+		return self._srcset('webp')
+
+	@property
+	def jpeg_srcset(self):
+		return self._srcset('jpeg')
+
+	@property
+	def thumbnail_url(self):
+		"""Miniatura JPEG más pequeña (o la imagen completa si aún no está procesada)."""
+		if not self.thumbnails:
+			return self.image.url
+		smallest = min(self.thumbnails, key=int)
+		return self.image.storage.url(self.thumbnails[smallest]['jpeg'])
+
+
+class EvidenceUpload(models.Model):
+	"""Subida por partes de una foto de evidencia (``tickets.uploads``).
+
+	Los bytes recibidos se escriben en un archivo temporal; ``received`` es hasta dónde
+	está completo y desde dónde se reanuda. Al llegar a ``size`` se crea la ``Evidence``.
+	"""
+
+	class Status(models.TextChoices):
+		OPEN = 'OPEN', _('Abierta')
+		COMPLETE = 'COMPLETE', _('Completa')
+
+	id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+	ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name='uploads')
+	user = models.ForeignKey('accounts.CustomUser', on_delete=models.CASCADE, related_name='evidence_uploads')
+	filename = models.CharField(max_length=255)
+	size = models.BigIntegerField()
+	received = models.BigIntegerField(default=0)
+	status = models.CharField(max_length=10, choices=Status.choices, default=Status.OPEN)
+	evidence = models.ForeignKey(Evidence, null=True, blank=True, on_delete=models.SET_NULL)
+	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['status', 'updated_at'], name='evidence_upload_expiry_idx'),
+		]
+
+	def __str__(self):
+		return f"Subida {self.id} ({self.received}/{self.size})"
+
+
+class Blob(models.Model):
+	"""Archivo de ``tickets.storage`` y cuántas evidencias lo usan (foto o miniatura).
+
+	Lo mantienen las señales de ``Evidence`` (``tickets.blobs``); con ``refcount`` en 0
+	durante más de ``EVIDENCE_GC_GRACE_HOURS`` lo borra ``manage.py gc_evidence_files``.
+	"""
+	name = models.CharField(max_length=255, unique=True)
+	sha256 = models.CharField(max_length=64, db_index=True)
+	size = models.BigIntegerField(default=0)
+	refcount = models.IntegerField(default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['updated_at'], name='blob_unreferenced_idx', condition=models.Q(refcount__lte=0)),
+		]
+
+	def __str__(self):
+		return f"{self.name} ({self.refcount})"
+
+
+class TicketCounter(models.Model):
+	"""Conteo desnormalizado de tickets por oficina × estado × prioridad × técnico × supervisor × día.
+
+	Se mantiene desde las señales de ``Ticket`` (ver ``tickets.counters``) para que los
+	KPIs lean pocas filas agregadas en lugar de recorrer toda la tabla de tickets.
+	"""
+	assigned_office = models.ForeignKey('oficinas.Office', related_name='ticket_counters', on_delete=models.CASCADE)
+	status = models.CharField(max_length=20, choices=TicketStatus.choices)
+	priority = models.IntegerField(choices=TicketPriority.choices)
+	technician = models.ForeignKey('accounts.CustomUser', related_name='ticket_counters_as_technician', null=True, blank=True, on_delete=models.SET_NULL)
+	supervisor = models.ForeignKey('accounts.CustomUser', related_name='ticket_counters_as_supervisor', null=True, blank=True, on_delete=models.SET_NULL)
+	# Día local (America/Bogota) de created_at del ticket
+	day = models.DateField()
+	count = models.IntegerField(default=0)
+
+	class Meta:
+		constraints = [
+			# Sin técnico/supervisor cuentan como 0: con las columnas tal cual, NULL es
+			# distinto de NULL y dos inserciones concurrentes duplicarían la fila
+			models.UniqueConstraint(
+				'assigned_office', 'status', 'priority',
+				Coalesce('technician', 0), Coalesce('supervisor', 0), 'day',
+				name='ticket_counter_dims_unique',
+			),
+		]
+
+	def __str__(self):
+		return f"{self.assigned_office_id}/{self.status}/{self.priority}/{self.technician_id}/{self.day}: {self.count}"
+
+
+class Job(models.Model):
+	"""Trabajo diferido (notificaciones, correos) que ejecuta ``manage.py run_jobs``.
+
+	Ver ``tickets.jobs``: se encola en la misma transacción que el cambio que lo origina.
+	"""
+
+	class Status(models.TextChoices):
+		PENDING = 'PENDING', _('Pendiente')
+		RUNNING = 'RUNNING', _('En ejecución')
+		DONE = 'DONE', _('Hecho')
+		FAILED = 'FAILED', _('Fallido')
+
+	name = models.CharField(max_length=100)
+	payload = models.JSONField(default=dict, blank=True)
+	# Menor número = antes (0 alta, 5 normal, 9 baja)
+	priority = models.PositiveSmallIntegerField(default=5)
+	# Encolar dos veces con la misma clave no crea un segundo trabajo
+	idempotency_key = models.CharField(max_length=200, null=True, blank=True, unique=True)
+	status = models.CharField(max_length=8, choices=Status.choices, default=Status.PENDING)
+	attempts = models.PositiveSmallIntegerField(default=0)
+	run_at = models.DateTimeField(default=timezone.now)
+	last_error = models.TextField(blank=True)
+	created_at = models.DateTimeField(auto_now_add=True)
+	started_at = models.DateTimeField(null=True, blank=True)
+	finished_at = models.DateTimeField(null=True, blank=True)
+	duration_ms = models.PositiveIntegerField(null=True, blank=True)
+
+	class Meta:
+		indexes = [
+			models.Index(fields=['priority', 'run_at', 'id'], name='job_due_idx', condition=models.Q(status='PENDING')),
+		]
+
+	def __str__(self):
+		return f"{self.name} #{self.id} ({self.get_status_display()})"
+
 # Create your models here.
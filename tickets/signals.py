@@ -1,11 +1,24 @@
-from django.db.models.signals import post_save, post_delete
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
-from .models import Ticket
+from .models import Evidence, Ticket, TicketStatus
+from gestor_servicios import stats_cache
+from . import blobs, broadcast, counters
+
+
+def _delta(dims, delta):
+    # Delta de contador serializable: el cliente lo suma/resta en sus KPIs sin refetch
+    item = dict(dims)
+    item['day'] = item['day'].isoformat()
+    item['status_label'] = str(TicketStatus(item['status']).label)  # lazy: channels_redis no la serializa
+    item['delta'] = delta
+    return item
 
 
-def _build_payload_for_ticket(ticket: Ticket):
+def _build_payload_for_ticket(ticket: Ticket, before=None, after=None, deleted=False):
     # Payload minimal por rol para actualizar solo lo necesario
     base = {
         'event': 'ticket_update',
@@ -14,43 +27,94 @@ def _build_payload_for_ticket(ticket: Ticket):
         'assigned_office_id': ticket.assigned_office_id,
         'technician_id': ticket.technician_id,
         'supervisor_id': ticket.supervisor_id,
+        'deleted': deleted,
+        'deltas': [],
     }
+    if before != after:
+        if before:
+            base['deltas'].append(_delta(before, -1))
+        if after:
+            base['deltas'].append(_delta(after, 1))
     return base
 
 
-def _broadcast_ticket_change(ticket: Ticket):
-    channel_layer = get_channel_layer()
-    if not channel_layer:
-        return
-    payload = _build_payload_for_ticket(ticket)
-
-    # Grupos destinatarios mínimos:
+def _groups_for_ticket(*dims_list):
+    # Grupos destinatarios mínimos (antes y después del cambio, para mudanzas de oficina/técnico):
     # - Jefes (global)
-    async_to_sync(channel_layer.group_send)('stats_jefes', {
-        'type': 'stats_update',
-        'payload': payload,
-    })
-
-    # - Oficina (supervisores y métricas por oficina)
-    if ticket.assigned_office_id:
-        async_to_sync(channel_layer.group_send)(f'stats_office_{ticket.assigned_office_id}', {
-            'type': 'stats_update',
-            'payload': payload,
-        })
-
-    # - Técnico asignado (métricas personales)
-    if ticket.technician_id:
-        async_to_sync(channel_layer.group_send)(f'stats_tech_{ticket.technician_id}', {
-            'type': 'stats_update',
-            'payload': payload,
-        })
+    groups = ['stats_jefes']
+    for dims in dims_list:
+        if not dims:
+            continue
+        # - Oficina (supervisores y métricas por oficina)
+        if dims['assigned_office_id'] and f"stats_office_{dims['assigned_office_id']}" not in groups:
+            groups.append(f"stats_office_{dims['assigned_office_id']}")
+        # - Técnico asignado (métricas personales)
+        if dims['technician_id'] and f"stats_tech_{dims['technician_id']}" not in groups:
+            groups.append(f"stats_tech_{dims['technician_id']}")
+    return groups
+
+
+def _invalidate_stats(before, after):
+    # Tras el commit: invalidar antes dejaría recalcular (y cachear) datos aún sin confirmar
+    if before != after:
+        transaction.on_commit(partial(stats_cache.invalidate, [before, after]))
+
+
+def _broadcast_ticket_change(ticket: Ticket, before, after, deleted=False):
+    # Se acumula y se envía agrupado tras el commit (ver tickets.broadcast)
+    payload = _build_payload_for_ticket(ticket, before, after, deleted)
+    broadcast.buffer.add(_groups_for_ticket(before, after), payload)
+
+
+@receiver(pre_save, sender=Ticket)
+def on_ticket_pre_save(sender, instance: Ticket, **kwargs):
+    # Guardar las dimensiones previas para mover el contador al estado nuevo
+    instance._counter_dims_before = counters.stored_dims(instance.pk) if instance.pk else None
 
 
 @receiver(post_save, sender=Ticket)
 def on_ticket_save(sender, instance: Ticket, created, **kwargs):
-    _broadcast_ticket_change(instance)
+    before = None if created else getattr(instance, '_counter_dims_before', None)
+    after = counters.dims_for(instance)
+    counters.apply_change(before, after)
+    _invalidate_stats(before, after)
+    _broadcast_ticket_change(instance, before, after)
 
 
 @receiver(post_delete, sender=Ticket)
 def on_ticket_delete(sender, instance: Ticket, **kwargs):
-    _broadcast_ticket_change(instance)
+    before = counters.dims_for(instance)
+    counters.apply_change(before, None)
+    _invalidate_stats(before, None)
+    _broadcast_ticket_change(instance, before, None, deleted=True)
+
+
+@receiver(pre_save, sender=Evidence)
+def on_evidence_pre_save(sender, instance: Evidence, **kwargs):
+    # Archivos que usaba antes del cambio, para mover sus referencias (tickets.blobs)
+    instance._blob_names_before = set()
+    if instance.pk and not kwargs.get('raw'):
+        row = Evidence.objects.filter(pk=instance.pk).values_list('image', 'thumbnails').first()
+        if row:
+            instance._blob_names_before = blobs.names(*row)
+
+
+@receiver(post_save, sender=Evidence)
+def on_evidence_save(sender, instance: Evidence, **kwargs):
+    if kwargs.get('raw'):
+        return  # loaddata: `gc_evidence_files --recount` recalcula las cuentas
+    before = getattr(instance, '_blob_names_before', set())
+    after = blobs.names_for(instance)
+    blobs.retain(after - before)
+    blobs.release(before - after)
+
+
+@receiver(post_delete, sender=Evidence)
+def on_evidence_delete(sender, instance: Evidence, **kwargs):
+    blobs.release(blobs.names_for(instance))
+
+
+@receiver(pre_delete, sender=settings.AUTH_USER_MODEL)
+def on_user_delete(sender, instance, **kwargs):
+    # Sus tickets quedarán con técnico/supervisor en NULL (SET_NULL)
+    counters.detach_user(instance.pk)
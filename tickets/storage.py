@@ -0,0 +1,88 @@
+"""Almacenamiento direccionado por contenido para las fotos de evidencia.
+
+``ContentAddressedStorage`` ignora el nombre que trae el archivo y lo guarda según el
+sha256 de su contenido, repartido en dos niveles de subdirectorios para no acumular
+miles de archivos en uno solo::
+
+    evidences/foto.jpg        -> evidences/3f/a2/3fa2...c9.jpg
+    evidences/thumbs/x.webp   -> evidences/thumbs/51/0b/510b...e4.webp
+
+Subir dos veces la misma foto no ocupa más disco (el segundo ``save`` devuelve el nombre
+existente) y, dado un hash, su ruta se calcula sin consultar nada (``blob_name``).
+Como un archivo puede estar referenciado por varias evidencias, los nombres por contenido
+no se borran desde el código: las referencias se cuentan en ``tickets.blobs`` y
+``manage.py gc_evidence_files`` borra lo que quedó sin usar. La única llamada a
+``delete`` fuera del recolector es para archivos anteriores a este almacenamiento
+(``evidences/foto.jpg``, sin hash en el nombre): son de una sola evidencia, no tienen
+``Blob`` y el recolector no los ve, así que ``tickets.evidence._update`` los borra tras
+confirmarse su re-procesado.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+from gestor_servicios import metrics
+
+BLOB_NAME = re.compile(r'(?:^|/)([0-9a-f]{2})/([0-9a-f]{2})/(\1\2[0-9a-f]{60})(\.[0-9a-z]+)?$')
+INCOMING = '.incoming'
+
+
+@deconstructible(path='tickets.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+
+    def blob_name(self, digest, name):
+        """Nombre del archivo con contenido ``digest`` subido como ``name`` (se conserva el directorio y la extensión)."""
+        directory = posixpath.dirname(name)
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, digest[:2], digest[2:4], digest + extension)
+
+    @staticmethod
+    def digest_of(name):
+        """sha256 de un nombre generado por este almacenamiento, o ``None`` (p. ej. archivos antiguos)."""
+        match = BLOB_NAME.search(name or '')
+        return match.group(3) if match else None
+
+    def get_available_name(self, name, max_length=None):
+        return name  # el nombre definitivo sale del contenido, en _save
+
+    def _save(self, name, content):
+        incoming = self.path(INCOMING)
+        os.makedirs(incoming, exist_ok=True)
+        digest = hashlib.sha256()
+        fd, temp_path = tempfile.mkstemp(dir=incoming)
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode()
+                    digest.update(chunk)
+                    temp.write(chunk)
+            name = self.blob_name(digest.hexdigest(), name)
+            full_path = self.path(name)
+            if os.path.exists(full_path):
+                # Se renueva la fecha: gc_evidence_files no borra lo reutilizado hace poco
+                os.utime(full_path)
+                metrics.inc('storage.deduplicated')
+                return name
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            # Atómico: quien lea el nombre ve el archivo completo o no lo ve
+            os.replace(temp_path, full_path)
+            temp_path = None
+            return name
+        finally:
+            if temp_path is not None and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+def evidence_storage():
+    return _evidence_storage
+
+
+_evidence_storage = ContentAddressedStorage()
@@ -0,0 +1,66 @@
+"""Manejadores de ``tickets.jobs``: avisos y procesamiento que antes se hacían dentro de la petición."""
+from accounts import outbox
+from accounts.models import CustomUser
+from accounts.notify import active_jefes, notify
+from . import evidence
+from .jobs import handler
+from .models import Ticket
+
+
+def _ticket(ticket_id):
+    # El ticket pudo borrarse antes de que corriera el trabajo
+    return Ticket.objects.select_related('assigned_office__supervisor').filter(pk=ticket_id).first()
+
+
+@handler('tickets.created')
+def ticket_created(ticket_id):
+    ticket = _ticket(ticket_id)
+    if ticket is None:
+        return
+    # Jefes y supervisor de la oficina; un supervisor que también es jefe recibe solo el aviso de jefe
+    notify(
+        (active_jefes(), f"🆕 NUEVO REQUERIMIENTO - #{ticket.id}: {ticket.requester_name} solicita servicio en {ticket.assigned_office}"),
+        ([ticket.supervisor_id], f"🆕 Nuevo requerimiento asignado a tu oficina - #{ticket.id}: {ticket.requester_name}"),
+        ticket=ticket,
+    )
+
+
+@handler('tickets.assigned')
+def ticket_assigned(ticket_id, assignee_id):
+    ticket = _ticket(ticket_id)
+    assignee = CustomUser.objects.filter(pk=assignee_id).first()
+    if ticket is None or assignee is None:
+        return
+    notify(([assignee], f"Nuevo requerimiento asignado #{ticket.id}: {ticket.description[:80]}"), ticket=ticket)
+    # Aviso por correo: lo envía `manage.py send_outbox`
+    if assignee.email:
+        outbox.enqueue(
+            subject=f"Nuevo requerimiento asignado #{ticket.id}",
+            body=(
+                f"Hola {assignee.username},\n\n"
+                f"Se te ha asignado el requerimiento #{ticket.id}.\n"
+                f"Descripción: {ticket.description}\n"
+                f"Prioridad: {ticket.get_priority_display()}\n"
+                f"Estado: {ticket.get_status_display()}\n"
+            ),
+            recipients=[assignee.email],
+        )
+
+
+@handler('tickets.pending_supplies')
+def ticket_pending_supplies(ticket_id, technician, note=''):
+    ticket = _ticket(ticket_id)
+    if ticket is None:
+        return
+    recent_note = f" - Insumos solicitados: {note}" if note else ""
+    office = ticket.assigned_office
+    notify(
+        (active_jefes(), f"🔧 INSUMOS SOLICITADOS - Requerimiento #{ticket.id}: {ticket.requester_name} ({office}){recent_note}"),
+        ([office.supervisor_id if office else None], f"🔧 INSUMOS SOLICITADOS - Tu técnico {technician} requiere insumos para el requerimiento #{ticket.id}{recent_note}"),
+        ticket=ticket,
+    )
+
+
+@handler('evidence.process')
+def evidence_process(evidence_id):
+    evidence.process(evidence_id)
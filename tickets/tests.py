@@ -1,8 +1,46 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import date, timedelta
+from unittest import mock
+from PIL import Image
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.core.cache import cache, caches
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.contrib.auth import get_user_model
 from oficinas.models import Office
-from tickets.models import Ticket, TicketStatus, TicketPriority
+from tickets.models import Blob, Evidence, EvidenceUpload, Ticket, TicketEvent, TicketStatus, TicketPriority, TicketCounter, Job
+from tickets import broadcast, counters, jobs, live
+from tickets import evidence as evidence_pipeline
+from tickets import blobs
+from tickets.storage import ContentAddressedStorage, evidence_storage
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from gestor_servicios import dates, metrics, stats
+from gestor_servicios.pagination import CursorPaginator
+from tickets.workload import office_workload
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from gestor_servicios import consumers
+from gestor_servicios.consumers import StatsConsumer
+
+from channels_redis.core import RedisChannelLayer
+
+try:  # Redis sin servidor para los tests: fakeredis (+ lupa para el Lua de group_send)
+    import fakeredis
+    import fakeredis.aioredis
+    import lupa  # noqa: F401
+except ImportError:
+    fakeredis = None
 
 
 User = get_user_model()
@@ -43,4 +81,781 @@ class TicketFlowTests(TestCase):
         self.ticket.refresh_from_db()
         self.assertEqual(self.ticket.status, TicketStatus.IN_PROGRESS)
 
-# Create your tests here.
+
+class TicketCounterTests(TestCase):
+    def setUp(self):
+        self.of1 = Office.objects.create(name='Of1')
+        self.of2 = Office.objects.create(name='Of2')
+        self.tech1 = User.objects.create_user(username='t1', password='pass12345', approved=True, role='TECNICO', office=self.of1)
+
+    def _create(self, **kwargs):
+        data = dict(requester_name='Ana', description='PC', priority=TicketPriority.P3, assigned_office=self.of1, status=TicketStatus.ASSIGNED)
+        data.update(kwargs)
+        return Ticket.objects.create(**data)
+
+    def test_counters_follow_status_office_and_technician_changes(self):
+        ticket = self._create()
+        self._create(status=TicketStatus.COMPLETED)
+        self.assertEqual(counters.total(), 2)
+
+        ticket.status = TicketStatus.IN_PROGRESS
+        ticket.technician = self.tech1
+        ticket.assigned_office = self.of2
+        ticket.save()
+        self.assertEqual(counters.total(counters.counter_queryset(office_id=self.of2.id)), 1)
+        self.assertEqual(counters.total(counters.counter_queryset(technician_id=self.tech1.id, statuses=[TicketStatus.IN_PROGRESS])), 1)
+        self.assertEqual(counters.total(counters.counter_queryset(statuses=[TicketStatus.ASSIGNED])), 0)
+        self.assertEqual(counters.check_consistency(), [])
+
+        ticket.delete()
+        self.assertEqual(counters.total(), 1)
+        self.assertEqual(counters.check_consistency(), [])
+
+    def test_unassigned_dimensions_are_unique(self):
+        ticket = self._create()
+        dims = counters.dims_for(ticket)
+        self.assertIsNone(dims['technician_id'])
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            TicketCounter.objects.create(count=1, **dims)
+        # Carrera perdida: el UPDATE no vio la fila y el INSERT choca con la del otro proceso
+        with mock.patch.object(QuerySet, 'update', side_effect=[0, 1]) as update:
+            counters._bump(dims, 1)
+        self.assertEqual(update.call_count, 2)
+        self.assertEqual(TicketCounter.objects.filter(technician__isnull=True).count(), 1)
+
+    def test_deleting_user_moves_counts_to_unassigned(self):
+        self._create(technician=self.tech1, status=TicketStatus.COMPLETED)
+        self._create(status=TicketStatus.COMPLETED)
+        self.tech1.delete()
+        self.assertEqual(counters.check_consistency(), [])
+        self.assertEqual(TicketCounter.objects.count(), 1)
+
+    def test_rebuild_repairs_bulk_updates(self):
+        ticket = self._create()
+        Ticket.objects.filter(pk=ticket.pk).update(status=TicketStatus.COMPLETED)
+        self.assertEqual(len(counters.check_consistency()), 2)
+        counters.rebuild()
+        self.assertEqual(counters.check_consistency(), [])
+
+    def test_date_range_matches_local_day_at_midnight_edges(self):
+        # 23:30 en Bogotá ya es el día siguiente en UTC
+        day = date(2025, 3, 10)
+        late = self._create()
+        early = self._create()
+        Ticket.objects.filter(pk=late.pk).update(created_at=dates.day_start(day) + timedelta(hours=23, minutes=30))
+        Ticket.objects.filter(pk=early.pk).update(created_at=dates.day_start(day + timedelta(days=1)))
+        in_day = Ticket.objects.filter(dates.date_range_q(day, day))
+        self.assertEqual(list(in_day.values_list('pk', flat=True)), [late.pk])
+        self.assertEqual(
+            set(Ticket.objects.filter(dates.date_range_q(day, day + timedelta(days=1))).values_list('pk', flat=True)),
+            set(Ticket.objects.filter(created_at__date__range=(day, day + timedelta(days=1))).values_list('pk', flat=True)),
+        )
+        self.assertNotIn('django_datetime_cast_date', str(in_day.query))
+
+    def test_rebuild_window_only_touches_those_days(self):
+        old = self._create()
+        self._create()
+        yesterday = timezone.localdate() - timedelta(days=1)
+        Ticket.objects.filter(pk=old.pk).update(created_at=dates.day_start(yesterday), status=TicketStatus.COMPLETED)
+        today = timezone.localdate()
+        self.assertTrue(counters.check_consistency(end=yesterday))
+        counters.rebuild(start=yesterday, end=yesterday)
+        self.assertEqual(counters.check_consistency(end=yesterday), [])
+        # El contador de hoy del ticket movido sigue desfasado hasta reconstruir ese día
+        self.assertTrue(counters.check_consistency(start=today))
+        counters.rebuild(start=today)
+        self.assertEqual(counters.check_consistency(), [])
+
+
+class StatsQueryCountTests(TestCase):
+    def setUp(self):
+        self.of1 = Office.objects.create(name='Of1')
+        self.sup = User.objects.create_user(username='sup', password='pass12345', approved=True, role='SUPERVISOR', office=self.of1)
+        self.jefe = User.objects.create_user(username='jefe', password='pass12345', approved=True, role='JEFE')
+
+    def _add_technician(self, n):
+        tech = User.objects.create_user(username=f't{n}', password='pass12345', approved=True, role='TECNICO', office=self.of1)
+        for status in (TicketStatus.IN_PROGRESS, TicketStatus.COMPLETED):
+            Ticket.objects.create(
+                requester_name='Ana', description='PC', priority=TicketPriority.P5,
+                assigned_office=self.of1, technician=tech, supervisor=self.sup, status=status,
+            )
+
+    def _count_queries(self, user, url):
+        cache.clear()  # medir la consulta, no la caché de KPIs
+        self.client.force_login(user)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_query_count_does_not_grow_with_technicians(self):
+        self._add_technician(1)
+        baseline = {
+            url: self._count_queries(user, url)
+            for user, url in ((self.sup, reverse('my_stats')), (self.sup, reverse('my_stats_data')), (self.jefe, reverse('my_stats_data') + f'?office_id={self.of1.id}'))
+        }
+        for n in range(2, 7):
+            self._add_technician(n)
+        self.assertEqual(self._count_queries(self.sup, reverse('my_stats')), baseline[reverse('my_stats')])
+        self.assertEqual(self._count_queries(self.sup, reverse('my_stats_data')), baseline[reverse('my_stats_data')])
+        self.assertEqual(
+            self._count_queries(self.jefe, reverse('my_stats_data') + f'?office_id={self.of1.id}'),
+            baseline[reverse('my_stats_data') + f'?office_id={self.of1.id}'],
+        )
+
+    def test_supervisor_bundle_matches_tickets(self):
+        for n in range(1, 4):
+            self._add_technician(n)
+        self.client.force_login(self.sup)
+        data = self.client.get(reverse('my_stats_data')).json()
+        self.assertEqual(data['asignados_oficina'], 6)
+        self.assertEqual(data['tecnicos_activos'], 3)
+        self.assertEqual(data['mis_supervisados'], 6)
+        self.assertEqual(data['top_tecnico']['total'], 1)
+
+
+class WorkloadTests(TestCase):
+    def test_office_workload_counts_and_open_age(self):
+        office = Office.objects.create(name='Of1')
+        busy = User.objects.create_user(username='busy', password='pass12345', approved=True, role='TECNICO', office=office)
+        User.objects.create_user(username='idle', password='pass12345', approved=True, role='TECNICO', office=office)
+        for status in (TicketStatus.IN_PROGRESS, TicketStatus.PENDING_SUPPLIES, TicketStatus.COMPLETED):
+            Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=office, technician=busy, status=status)
+
+        with self.assertNumQueries(1):
+            rows = {u.username: u for u in office_workload(office.id)}
+        self.assertEqual(rows['busy'].asignados, 3)
+        self.assertEqual(rows['busy'].abiertos, 2)
+        self.assertEqual(rows['busy'].completados, 1)
+        self.assertEqual(rows['busy'].open_age_days, 0)
+        self.assertEqual(rows['idle'].asignados, 0)
+        self.assertIsNone(rows['idle'].open_age_days)
+
+
+class ConditionalTbodyTests(TestCase):
+    def test_tbody_partial_revalidates_with_etag(self):
+        office = Office.objects.create(name='Of1')
+        sup = User.objects.create_user(username='sup', password='pass12345', approved=True, role='SUPERVISOR', office=office)
+        ticket = Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=office)
+        self.client.force_login(sup)
+        url = reverse('tickets_index') + '?partial=tbody'
+        xhr = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        etag = self.client.get(url, **xhr)['ETag']
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **xhr)
+        self.assertEqual(resp.status_code, 304)
+        self.assertFalse(any('tickets_ticket"."requester_name' in q['sql'] for q in ctx.captured_queries))
+        ticket.status = TicketStatus.IN_PROGRESS
+        ticket.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag, **xhr).status_code, 200)
+
+
+class ConditionalStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.office = Office.objects.create(name='Of1')
+        self.client.force_login(User.objects.create_user(username='jefe', password='pass12345', approved=True, role='JEFE'))
+
+    @override_settings(STATS_CACHE_STALE_SECONDS=0)
+    def test_my_stats_data_answers_304_until_a_ticket_changes(self):
+        url = reverse('my_stats_data')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=self.office)
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        self.assertEqual(resp.json()['total_tickets'], 1)
+
+    def test_technicians_by_office_answers_304_until_a_technician_is_added(self):
+        url = reverse('get_technicians_by_office') + f'?office_id={self.office.id}'
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        User.objects.create_user(username='tec', password='pass12345', approved=True, role='TECNICO', office=self.office)
+        resp = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(resp['ETag'], etag)
+        tec = User.objects.get(username='tec')
+        self.assertEqual([t['id'] for t in resp.json()['technicians']], [tec.id])
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        office = Office.objects.create(name='Of1')
+        for n in range(25):
+            Ticket.objects.create(requester_name=f'R{n}', description='PC', assigned_office=office, priority=n % 3 + 1)
+        # Empates en created_at: el id desempata
+        Ticket.objects.filter(id__in=Ticket.objects.order_by('id').values('id')[:10]).update(
+            created_at=Ticket.objects.order_by('id').first().created_at,
+        )
+
+    def _walk(self, ordering):
+        paginator = CursorPaginator(Ticket.objects.all(), ordering, 7)
+        page = paginator.get_page()
+        pages = [page]
+        while page.has_next:
+            page = paginator.get_page(page.next_cursor)
+            pages.append(page)
+        return paginator, pages
+
+    def test_pages_cover_every_ticket_once_in_order(self):
+        for ordering in ('-created_at', 'priority', '-status'):
+            _, pages = self._walk(ordering)
+            ids = [t.id for page in pages for t in page]
+            expected = list(Ticket.objects.order_by(ordering, '-id' if ordering.startswith('-') else 'id').values_list('id', flat=True))
+            self.assertEqual(ids, expected, ordering)
+
+    def test_previous_cursor_returns_the_same_page(self):
+        paginator, pages = self._walk('-created_at')
+        back = paginator.get_page(pages[2].previous_cursor)
+        self.assertEqual([t.id for t in back], [t.id for t in pages[1]])
+        self.assertTrue(back.has_previous)
+        first = paginator.get_page(pages[1].previous_cursor)
+        self.assertEqual([t.id for t in first], [t.id for t in pages[0]])
+        self.assertFalse(first.has_previous)
+
+    def test_tbody_partial_returns_next_cursor(self):
+        jefe = User.objects.create_user(username='jefe', password='pass12345', approved=True, role='JEFE')
+        self.client.force_login(jefe)
+        xhr = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        data = self.client.get(reverse('tickets_index') + '?partial=tbody', **xhr).json()
+        self.assertTrue(data['has_next'])
+        data = self.client.get(reverse('tickets_index') + f"?partial=tbody&cursor={data['next_cursor']}", **xhr).json()
+        self.assertEqual(data['html'].count('data-ticket-id'), 10)
+        self.assertEqual(CursorPaginator(Ticket.objects.all(), '-created_at', 10, count='approx').get_page().count_label, '25')
+
+
+class StatsCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        metrics.reset()
+        self.of1 = Office.objects.create(name='Of1')
+        self.of2 = Office.objects.create(name='Of2')
+        Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=self.of1)
+
+    def _create(self, office):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Ticket.objects.create(requester_name='Luis', description='Red', assigned_office=office)
+
+    def test_filters_are_normalized_and_hit_without_queries(self):
+        stats.cached_jefe_bundle(statuses=['ASSIGNED', 'DRAFT'])
+        with CaptureQueriesContext(connection) as ctx:
+            bundle = stats.cached_jefe_bundle(statuses=['DRAFT', 'ASSIGNED', 'DRAFT'])
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(bundle['total'], 1)
+        self.assertEqual(metrics.get('stats_cache.hits'), 1)
+
+    @override_settings(STATS_CACHE_STALE_SECONDS=0)
+    def test_invalidation_is_scoped_by_office(self):
+        self.assertEqual(stats.cached_jefe_bundle(office_id=self.of1.id)['total'], 1)
+        self._create(self.of2)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(stats.cached_jefe_bundle(office_id=self.of1.id)['total'], 1)
+        self.assertEqual(len(ctx.captured_queries), 0)
+        self.assertEqual(stats.cached_jefe_bundle()['total'], 2)
+        self._create(self.of1)
+        self.assertEqual(stats.cached_jefe_bundle(office_id=self.of1.id)['total'], 2)
+
+    def test_stale_entry_is_served_while_revalidating(self):
+        self.assertEqual(stats.cached_jefe_bundle()['total'], 1)
+        self._create(self.of1)
+
+        class InlineThread:
+            def __init__(self, target, daemon):
+                self.target = target
+
+            def start(self):
+                self.target()
+
+        with mock.patch('gestor_servicios.stats_cache.threading.Thread', InlineThread), \
+                mock.patch('gestor_servicios.stats_cache.connections'):
+            self.assertEqual(stats.cached_jefe_bundle()['total'], 1)  # valor viejo
+        self.assertEqual(metrics.get('stats_cache.revalidations'), 1)
+        self.assertEqual(stats.cached_jefe_bundle()['total'], 2)
+
+
+class BroadcastBufferTests(TestCase):
+    @override_settings(TICKET_BROADCAST_WINDOW=60)
+    def test_commits_within_the_window_are_sent_once_per_group(self):
+        office = Office.objects.create(name='Of1')
+        sent = []
+
+        class Layer:
+            async def group_send(self, group, message):
+                sent.append((group, message))
+
+        with mock.patch('tickets.broadcast.get_channel_layer', return_value=Layer()):
+            with self.captureOnCommitCallbacks(execute=True):
+                t1 = Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=office)
+                t2 = Ticket.objects.create(requester_name='Luis', description='Red', assigned_office=office)
+            with self.captureOnCommitCallbacks(execute=True):  # segunda transacción, misma ventana
+                t1.status = TicketStatus.ASSIGNED
+                t1.save()
+            self.assertEqual(sent, [])
+            self.assertIsNotNone(broadcast.buffer._timer)
+            broadcast.buffer.flush()  # lo que haría el temporizador al cerrar la ventana
+
+        messages = dict(sent)
+        self.assertEqual(sorted(messages), ['stats_jefes', f'stats_office_{office.id}'])
+        payload = messages['stats_jefes']['payload']
+        self.assertEqual(payload['event'], 'tickets_changed')
+        self.assertEqual(payload['ticket_ids'], [t1.id, t2.id])
+        self.assertEqual(payload['tickets'][0]['status'], TicketStatus.ASSIGNED)
+        # Crear + cambiar de estado en la misma ventana: un único delta neto
+        deltas = payload['tickets'][0]['deltas']
+        self.assertEqual([(d['status'], d['delta']) for d in deltas], [(TicketStatus.ASSIGNED, 1)])
+
+    def test_rolled_back_changes_are_never_sent(self):
+        office = Office.objects.create(name='Of1')
+        sent = []
+
+        class Layer:
+            async def group_send(self, group, message):
+                sent.append(message['payload']['ticket_ids'])
+
+        with mock.patch('tickets.broadcast.get_channel_layer', return_value=Layer()):
+            with self.captureOnCommitCallbacks(execute=True):
+                with self.assertRaises(RuntimeError):
+                    with transaction.atomic():
+                        Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=office)
+                        raise RuntimeError
+                kept = Ticket.objects.create(requester_name='Luis', description='Red', assigned_office=office)
+        self.assertEqual(broadcast.buffer._pending, {})
+        self.assertEqual(sent, [[kept.id], [kept.id]])
+
+    def test_office_move_reaches_both_offices_with_sequential_seq(self):
+        of1 = Office.objects.create(name='Of1')
+        of2 = Office.objects.create(name='Of2')
+        sent = []
+
+        class Layer:
+            async def group_send(self, group, message):
+                sent.append((group, message['payload']))
+
+        with mock.patch('tickets.broadcast.get_channel_layer', return_value=Layer()):
+            with self.captureOnCommitCallbacks(execute=True):
+                ticket = Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=of1)
+            sent.clear()
+            for _ in range(2):
+                with self.captureOnCommitCallbacks(execute=True):
+                    ticket.assigned_office = of2 if ticket.assigned_office_id == of1.id else of1
+                    ticket.save()
+
+        first = dict(sent[:3])
+        self.assertEqual(sorted(first), sorted(['stats_jefes', f'stats_office_{of1.id}', f'stats_office_{of2.id}']))
+        deltas = first[f'stats_office_{of1.id}']['tickets'][0]['deltas']
+        self.assertEqual(
+            [(d['assigned_office_id'], d['delta']) for d in deltas],
+            [(of1.id, -1), (of2.id, 1)],
+        )
+        second = dict(sent[3:])
+        for group, payload in second.items():
+            self.assertEqual(payload['seq'], first[group]['seq'] + 1)
+
+    @override_settings(STATS_JEFES_SHARDS=3)
+    def test_sharded_jefes_group_receives_on_every_shard(self):
+        self.assertIn(broadcast.shard_for('stats_jefes', 'specific.abc!1'), broadcast.shard_groups('stats_jefes'))
+        self.assertEqual(broadcast.shard_for('stats_office_1', 'specific.abc!1'), 'stats_office_1')
+        sent = []
+
+        class Layer:
+            async def group_send(self, group, message):
+                sent.append((group, message['payload']['group']))
+
+        with mock.patch('tickets.broadcast.get_channel_layer', return_value=Layer()):
+            with self.captureOnCommitCallbacks(execute=True):
+                Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=Office.objects.create(name='Of1'))
+
+        jefes = sorted(item for item in sent if item[1] == 'stats_jefes')
+        self.assertEqual(jefes, [(f'stats_jefes.{n}', 'stats_jefes') for n in range(3)])
+
+
+@unittest.skipUnless(fakeredis or os.getenv('REDIS_TEST_URL'), 'requiere fakeredis, channels-redis y lupa, o REDIS_TEST_URL')
+class RedisBroadcastTests(TestCase):
+    """El camino entre procesos: ``seq`` en la caché de Redis y ``group_send`` por channels_redis."""
+
+    def setUp(self):
+        url = os.getenv('REDIS_TEST_URL')
+        if url:
+            cache_options, host = {}, url
+        else:
+            server = fakeredis.FakeServer()
+            cache_options = {'connection_class': fakeredis.FakeConnection, 'server': server}
+            host = {
+                'address': 'redis://localhost:6379/15',
+                'connection_class': fakeredis.aioredis.FakeConnection,
+                'server': server,
+            }
+        self.settings_override = override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': url or 'redis://localhost:6379/15',
+                'OPTIONS': cache_options,
+                'KEY_PREFIX': 'test_broadcast',
+            }},
+            CHANNEL_LAYERS={'default': {
+                'BACKEND': 'channels_redis.core.RedisChannelLayer',
+                'CONFIG': {'hosts': [host], 'prefix': 'test_broadcast'},
+            }},
+            TICKET_BROADCAST_WINDOW=0,
+        )
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+        cache.clear()
+        self.addCleanup(cache.clear)
+        # Otro proceso: su propia capa y su propia conexión a la caché
+        self.other_layer = RedisChannelLayer(hosts=[host], prefix='test_broadcast')
+        self.other_cache = caches.create_connection('default')
+
+    async def receive(self, channel):
+        return await asyncio.wait_for(self.other_layer.receive(channel), timeout=5)
+
+    def test_seq_and_group_send_cross_processes(self):
+        office = Office.objects.create(name='Of1')
+        group = f'stats_office_{office.id}'
+        channel = async_to_sync(self.other_layer.new_channel)()
+        async_to_sync(self.other_layer.group_add)(group, channel)
+        errors = metrics.get('broadcast.send_errors')
+
+        for expected in (1, 2):
+            with self.captureOnCommitCallbacks(execute=True):
+                ticket = Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=office)
+            message = async_to_sync(self.receive)(channel)
+            self.assertEqual(message['type'], 'stats_update')
+            self.assertEqual(message['payload']['ticket_ids'], [ticket.id])
+            self.assertEqual(message['payload']['seq'], expected)
+            self.assertEqual(self.other_cache.get(broadcast.SEQ_KEY.format(group)), expected)
+        self.assertEqual(metrics.get('broadcast.send_errors'), errors)
+
+
+class ConsumerTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.office = Office.objects.create(name='Of1')
+        self.sup = User.objects.create_user(username='sup', password='x', role='SUPERVISOR', approved=True, office=self.office)
+
+    async def connect(self, path):
+        communicator = WebsocketCommunicator(StatsConsumer.as_asgi(), path)
+        communicator.scope['user'] = self.sup
+        await communicator.connect()
+        return communicator, await communicator.receive_json_from()
+
+
+class WebSocketTopicTests(ConsumerTestMixin, TestCase):
+    async def test_one_socket_only_gets_subscribed_topics(self):
+        layer = get_channel_layer()
+        stats = {'type': 'stats_update', 'payload': {'event': 'tickets_changed', 'ticket_ids': []}}
+        note = {'type': 'notification_update', 'data': {'event': 'unread_count', 'unread': 3}}
+        communicator, connected = await self.connect('/ws/stats/?topics=notifications')
+        self.assertEqual((connected['topics'], connected['groups'], connected['unread']), (['notifications'], [], 0))
+
+        await layer.group_send(f'stats_office_{self.office.id}', stats)
+        await layer.group_send(f'user_{self.sup.id}', note)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'notification_update')
+        self.assertTrue(await communicator.receive_nothing())
+
+        await communicator.send_json_to({'type': 'subscribe', 'topic': 'stats'})
+        subscribed = await communicator.receive_json_from()
+        self.assertEqual(subscribed['added'], ['stats'])
+        self.assertEqual(subscribed['seq'], {f'stats_office_{self.office.id}': 0})
+        await communicator.send_json_to({'type': 'unsubscribe', 'topic': 'notifications'})
+        self.assertEqual((await communicator.receive_json_from())['topics'], ['stats'])
+
+        await layer.group_send(f'user_{self.sup.id}', note)
+        await layer.group_send(f'stats_office_{self.office.id}', stats)
+        self.assertEqual((await communicator.receive_json_from())['type'], 'stats_update')
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_legacy_connection_keeps_all_topics(self):
+        communicator, connected = await self.connect('/ws/stats/?rows=1')
+        self.assertEqual(connected['topics'], ['notifications', 'stats', 'tickets'])
+        await communicator.disconnect()
+
+
+class ListWindowTests(TestCase):
+    def setUp(self):
+        self.office = Office.objects.create(name='Of1')
+
+    def test_list_window_only_reports_changes_to_visible_rows(self):
+        other = Office.objects.create(name='Of2')
+        jefe = User.objects.create_user(username='jefe', password='x', role='JEFE', approved=True)
+        mine = [Ticket.objects.create(requester_name=f'R{i}', description='PC', assigned_office=self.office) for i in range(3)]
+        elsewhere = Ticket.objects.create(requester_name='Z', description='Red', assigned_office=other)
+        window = live.ListWindow(jefe, {'office': str(self.office.id), 'size': '2'})
+        self.assertEqual(window.refresh(), [mine[2].id, mine[1].id])
+
+        with self.assertNumQueries(1):
+            self.assertIsNone(window.update([elsewhere.id]))  # no cumple los filtros
+        self.assertIsNone(window.update([mine[0].id]))  # cumple pero queda fuera de la ventana
+
+        update = window.update([mine[1].id])
+        self.assertEqual(update['order'], [mine[2].id, mine[1].id])
+        self.assertEqual(list(update['rows']), [mine[1].id])
+
+        new = Ticket.objects.create(requester_name='N', description='PC', assigned_office=self.office)
+        update = window.update([new.id])
+        self.assertEqual(update['order'], [new.id, mine[2].id])
+        self.assertEqual(list(update['rows']), [new.id])
+
+
+class WebSocketMetricsTests(ConsumerTestMixin, TestCase):
+    async def test_connection_gauges_and_dropped_messages(self):
+        group = f'stats_office_{self.office.id}'
+        communicator, _ = await self.connect('/ws/stats/?topics=stats')
+        self.assertEqual(metrics.gauges('ws.')['ws.group_connections'][f'group={group}'], 1)
+        self.assertEqual(consumers.presence[self.sup.id], 1)
+        dropped = metrics.get('ws.messages_dropped')
+        for seq in (1, 4):  # se perdieron el 2 y el 3
+            await get_channel_layer().group_send(group, {'type': 'stats_update', 'payload': {'group': group, 'seq': seq}})
+            await communicator.receive_json_from()
+        self.assertEqual(metrics.get('ws.messages_dropped') - dropped, 2)
+        await communicator.disconnect()
+        self.assertNotIn(f'group={group}', metrics.gauges('ws.').get('ws.group_connections', {}))
+        self.assertNotIn(self.sup.id, consumers.presence)
+
+    def test_prometheus_endpoint_requires_staff_or_token(self):
+        metrics.observe('ws.send_seconds', 0.003)
+        url = reverse('metrics_prometheus')
+        self.assertEqual(self.client.get(url).status_code, 403)
+        with self.settings(METRICS_TOKEN='secreto'):
+            resp = self.client.get(url, HTTP_AUTHORIZATION='Bearer secreto')
+        self.assertContains(resp, '# TYPE gestor_ws_send_seconds histogram')
+        self.assertContains(resp, 'gestor_ws_send_seconds_bucket{le="0.005"}')
+        self.sup.is_staff = True
+        self.sup.save()
+        self.client.force_login(self.sup)
+        self.assertGreaterEqual(self.client.get(reverse('ws_metrics')).json()['send']['count'], 1)
+
+
+@override_settings(JOBS_EAGER=False, JOBS_MAX_ATTEMPTS=2)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        self.calls = []
+        jobs.handler('test.record')(lambda value: self.calls.append(value))
+
+    def test_priority_order_idempotency_and_timing(self):
+        jobs.enqueue('test.record', {'value': 'normal'})
+        first = jobs.enqueue('test.record', {'value': 'alta'}, priority=jobs.HIGH, key='k1')
+        self.assertEqual(jobs.enqueue('test.record', {'value': 'otra vez'}, key='k1').pk, first.pk)
+        self.assertEqual(jobs.queue_stats()['pending'], 2)
+        self.assertEqual(jobs.run_pending()[Job.Status.DONE], 2)
+        self.assertEqual(self.calls, ['alta', 'normal'])
+        job = Job.objects.get(pk=first.pk)
+        self.assertEqual((job.status, job.attempts), (Job.Status.DONE, 1))
+        self.assertIsNotNone(job.duration_ms)
+        self.assertEqual(jobs.run_pending()[Job.Status.DONE], 0)
+
+    def test_failures_retry_then_fail(self):
+        def boom():
+            raise RuntimeError('falla')
+        jobs.handler('test.boom')(boom)
+        job = jobs.enqueue('test.boom')
+        with self.assertLogs('tickets.jobs', 'WARNING'):
+            self.assertEqual(jobs.run_pending()[Job.Status.PENDING], 1)
+        job.refresh_from_db()
+        self.assertGreater(job.run_at, job.created_at)
+        Job.objects.filter(pk=job.pk).update(run_at=job.created_at)
+        with self.assertLogs('tickets.jobs', 'ERROR'):
+            self.assertEqual(jobs.run_pending()[Job.Status.FAILED], 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.Status.FAILED, 2))
+        self.assertIn('falla', job.last_error)
+
+    def test_pending_supplies_view_only_enqueues(self):
+        office = Office.objects.create(name='Of1')
+        jefe = User.objects.create_user(username='j1', password='pass12345', approved=True, role='JEFE')
+        tech = User.objects.create_user(username='t1', password='pass12345', approved=True, role='TECNICO', office=office)
+        ticket = Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=office, technician=tech, status=TicketStatus.IN_PROGRESS)
+        self.client.force_login(tech)
+        resp = self.client.post(reverse('ticket_update', args=[ticket.id]), {'status': TicketStatus.PENDING_SUPPLIES, 'note': 'cable'})
+        self.assertEqual(resp.status_code, 302)
+        self.assertFalse(jefe.notifications.exists())
+        self.assertEqual(Job.objects.get().name, 'tickets.pending_supplies')
+        jobs.run_pending()
+        self.assertIn('cable', jefe.notifications.get().text)
+
+    def test_reassignments_in_the_same_second_each_enqueue_a_job(self):
+        office = Office.objects.create(name='Of1')
+        sup = User.objects.create_user(username='s1', password='pass12345', approved=True, role='SUPERVISOR', office=office)
+        t1 = User.objects.create_user(username='t1', password='pass12345', approved=True, role='TECNICO', office=office)
+        t2 = User.objects.create_user(username='t2', password='pass12345', approved=True, role='TECNICO', office=office)
+        ticket = Ticket.objects.create(requester_name='Ana', description='PC', assigned_office=office, status=TicketStatus.ASSIGNED)
+        self.client.force_login(sup)
+        now = timezone.now().replace(microsecond=0)
+        with mock.patch('django.utils.timezone.now', return_value=now):
+            for tech in (t1, t2, t1):
+                self.client.post(reverse('ticket_assign', args=[ticket.id]), {'technician': tech.id})
+        assigned = Job.objects.filter(name='tickets.assigned').order_by('id')
+        self.assertEqual([job.payload['assignee_id'] for job in assigned], [t1.id, t2.id, t1.id])
+        self.assertEqual(ticket.events.filter(kind=TicketEvent.Kind.ASSIGNED).count(), 3)
+
+
+@override_settings(JOBS_EAGER=False, EVIDENCE_MAX_DIMENSION=800, EVIDENCE_THUMBNAIL_SIZES=(160, 320))
+class EvidencePipelineTests(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=self.media)
+        media.enable()
+        self.addCleanup(media.disable)
+        office = Office.objects.create(name='Of1')
+        self.tech = User.objects.create_user(username='t1', password='pass12345', approved=True, role='TECNICO', office=office)
+        self.tickets = [
+            Ticket.objects.create(
+                requester_name='Juan', description='Cámara', assigned_office=office,
+                technician=self.tech, status=TicketStatus.IN_PROGRESS,
+            )
+            for _ in range(2)
+        ]
+
+    def photo(self):
+        # Foto "de teléfono": 1200x600 girada por EXIF (Orientation=6) y con datos de GPS
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        exif[0x8825] = {2: (4.0, 36.0, 0.0)}
+        buffer = io.BytesIO()
+        Image.new('RGB', (1200, 600), (200, 30, 30)).save(buffer, 'JPEG', exif=exif)
+        return buffer.getvalue()
+
+    def upload(self, ticket, data):
+        return self.client.post(
+            reverse('ticket_add_evidence', args=[ticket.id]),
+            {'image': SimpleUploadedFile('foto.jpg', data, content_type='image/jpeg')},
+        )
+
+    def test_upload_is_processed_off_request_and_deduplicated(self):
+        self.client.login(username='t1', password='pass12345')
+        data = self.photo()
+        self.assertEqual(self.upload(self.tickets[0], data).status_code, 302)
+        first = Evidence.objects.get()
+        self.assertIsNone(first.processed_at)
+        self.assertEqual(Job.objects.get().name, 'evidence.process')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.run_pending()
+        first.refresh_from_db()
+        self.assertEqual((first.width, first.height), (400, 800))  # rotada y acotada a 800
+        self.assertEqual(first.content_hash, hashlib.sha256(data).hexdigest())
+        self.assertEqual(sorted(first.thumbnails, key=int), ['80', '160'])
+        with first.image.open('rb') as f, Image.open(f) as stored:
+            self.assertEqual(stored.size, (400, 800))
+            self.assertFalse(stored.getexif())
+
+        self.upload(self.tickets[1], data)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(evidence_pipeline.process(Evidence.objects.latest('id').pk), 'reused')
+        second = Evidence.objects.latest('id')
+        self.assertEqual((second.image.name, second.thumbnails), (first.image.name, first.thumbnails))
+
+        resp = self.client.get(reverse('ticket_detail', args=[self.tickets[0].id]))
+        self.assertContains(resp, 'loading="lazy"')
+        self.assertContains(resp, f"/media/{first.thumbnails['160']['webp']} 160w")
+
+    def files(self):
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), self.media)
+            for directory, _, names in os.walk(self.media) for name in names
+        )
+
+    @override_settings(EVIDENCE_GC_GRACE_HOURS=0)
+    def test_duplicate_uploads_share_one_file_and_gc_reclaims_unreferenced(self):
+        self.client.login(username='t1', password='pass12345')
+        data = self.photo()
+        digest = hashlib.sha256(data).hexdigest()
+        for ticket in self.tickets:
+            self.upload(ticket, data)
+        first, second = Evidence.objects.order_by('id')
+        self.assertEqual(first.image.name, f'evidences/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(second.image.name, first.image.name)
+        self.assertEqual(self.files(), [first.image.name])
+        self.assertEqual(blobs.find(digest).refcount, 2)
+        self.assertEqual(blobs.collect()['blobs'], 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            jobs.run_pending()
+        first.refresh_from_db()
+        self.assertEqual(blobs.find(digest).refcount, 0)  # el original ya no lo usa nadie
+        self.assertEqual(Blob.objects.get(name=first.image.name).refcount, 2)
+        self.assertEqual(blobs.collect()['blobs'], 1)
+        self.assertEqual(len(self.files()), 5)  # foto re-codificada + 2 miniaturas x 2 formatos
+
+        orphan = f'evidences/ab/cd/abcd{"0" * 60}.jpg'
+        evidence_storage().save(orphan, ContentFile(b'x'))  # nombre por contenido: no es `orphan`
+        Evidence.objects.all().delete()
+        report = blobs.collect()
+        self.assertEqual((report['blobs'], report['orphans']), (5, 1))
+        self.assertEqual(self.files(), [])
+        Blob.objects.create(name=first.image.name, sha256='0' * 64, refcount=3)
+        self.assertEqual(blobs.recount(), 1)
+        self.assertEqual(Blob.objects.get().refcount, 0)
+
+    def put_chunk(self, url, data, first, total):
+        return self.client.put(
+            url, data[first:first + 1000], content_type='application/octet-stream',
+            headers={'Content-Range': f'bytes {first}-{min(first + 1000, total) - 1}/{total}'},
+        )
+
+    @override_settings(EVIDENCE_UPLOAD_CHUNK_BYTES=1000, EVIDENCE_UPLOAD_MAX_BYTES=100_000)
+    def test_chunked_upload_resumes_and_validates_ranges(self):
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir, ignore_errors=True)
+        self.client.login(username='t1', password='pass12345')
+        data = self.photo()
+        start_url = reverse('ticket_upload_start', args=[self.tickets[0].id])
+        with override_settings(EVIDENCE_UPLOAD_DIR=upload_dir):
+            resp = self.client.post(start_url, {'filename': 'foto.jpg', 'size': 200_000}, content_type='application/json')
+            self.assertEqual(resp.status_code, 413)
+            resp = self.client.post(start_url, {'filename': 'foto.jpg', 'size': len(data)}, content_type='application/json')
+            self.assertEqual(resp.status_code, 201)
+            url = resp.json()['url']
+
+            self.assertEqual(self.put_chunk(url, data, 0, len(data)).json()['offset'], 1000)
+            resp = self.put_chunk(url, data, 2000, len(data))  # se saltó una parte
+            self.assertEqual((resp.status_code, resp.json()['offset']), (409, 1000))
+            self.assertEqual(self.put_chunk(url, data, 0, len(data)).json()['offset'], 1000)  # reenvío
+            resp = self.client.put(
+                url, data[1000:1500], content_type='application/octet-stream',
+                headers={'Content-Range': f'bytes 1000-1999/{len(data)}'},
+            )  # conexión cortada a mitad de la parte
+            self.assertEqual((resp.status_code, resp.json()['offset']), (400, 1000))
+            self.assertEqual(self.client.get(url).json()['offset'], 1000)  # reanudar desde aquí
+
+            offset = 1000
+            with self.captureOnCommitCallbacks(execute=True):
+                while offset < len(data):
+                    resp = self.put_chunk(url, data, offset, len(data))
+                    offset = resp.json()['offset']
+            self.assertTrue(resp.json()['complete'])
+            self.assertEqual(os.listdir(upload_dir), [])
+
+        evidence = Evidence.objects.get()
+        self.assertEqual((evidence.ticket, resp.json()['evidence_id']), (self.tickets[0], evidence.pk))
+        self.assertEqual(ContentAddressedStorage.digest_of(evidence.image.name), hashlib.sha256(data).hexdigest())
+        self.assertEqual(Job.objects.get().name, 'evidence.process')
+        self.assertGreaterEqual(metrics.get('uploads.bytes'), len(data))
+
+    @override_settings(EVIDENCE_UPLOAD_CHUNK_BYTES=1000)
+    def test_chunked_upload_that_is_not_an_image_is_discarded(self):
+        upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, upload_dir, ignore_errors=True)
+        self.client.login(username='t1', password='pass12345')
+        data = b'no soy una foto ' * 100
+        with override_settings(EVIDENCE_UPLOAD_DIR=upload_dir):
+            resp = self.client.post(
+                reverse('ticket_upload_start', args=[self.tickets[0].id]),
+                {'filename': 'foto.jpg', 'size': len(data)}, content_type='application/json',
+            )
+            url = resp.json()['url']
+            with self.captureOnCommitCallbacks(execute=True):
+                self.put_chunk(url, data, 0, len(data))
+                resp = self.put_chunk(url, data, 1000, len(data))
+            self.assertEqual((resp.status_code, resp.json()['offset']), (415, 0))
+            self.assertEqual(self.client.get(url).status_code, 404)
+            self.assertEqual(os.listdir(upload_dir), [])
+        self.assertFalse(EvidenceUpload.objects.exists())
+        self.assertFalse(Evidence.objects.exists())
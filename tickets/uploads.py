@@ -0,0 +1,275 @@
+"""Subidas de evidencias por partes, reanudables.
+
+Para fotos grandes en conexiones de oficina de campo, en lugar de un único POST
+multipart:
+
+1. ``POST /tickets/<id>/evidencia/subidas/`` con ``{"filename", "size"}`` abre la subida
+   (``start``) y devuelve su id, el tamaño de parte y el desplazamiento (0).
+2. ``PUT /tickets/evidencia/subidas/<id>/`` con ``Content-Range: bytes a-b/total`` y los
+   bytes de la parte en el cuerpo (``write_chunk``). La parte debe empezar en o antes de
+   ``received`` (sin huecos); reenviar una parte ya recibida no hace nada.
+3. ``GET`` de la misma URL devuelve ``received``: tras un corte, el cliente sigue desde ahí.
+
+Los bytes se copian del cuerpo de la petición a disco por bloques de ``BLOCK_SIZE``
+(``_spool``), así que ni las partes ni la imagen completa se guardan en memoria.
+Con la última parte se comprueba que es una imagen (si no, la subida se descarta y se
+responde 415), se crea la ``Evidence`` (el
+almacenamiento la copia por contenido, ``tickets.storage``) y se programa su
+procesamiento (``tickets.evidence``). ``expire`` borra las subidas abandonadas más de
+``EVIDENCE_UPLOAD_TTL_HOURS`` (lo llama ``manage.py gc_evidence_files``).
+"""
+import os
+import tempfile
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image, UnidentifiedImageError
+
+from gestor_servicios import metrics
+from . import evidence as evidence_pipeline
+from .models import Evidence, EvidenceUpload
+
+Status = EvidenceUpload.Status
+
+BLOCK_SIZE = 64 * 1024
+EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp', '.tif', '.tiff')
+
+
+class UploadError(Exception):
+    """Petición de subida inválida; ``status`` es el código HTTP y ``offset`` desde dónde seguir."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def max_bytes():
+    return _setting('EVIDENCE_UPLOAD_MAX_BYTES', 25 * 1024 * 1024)
+
+
+def chunk_bytes():
+    return _setting('EVIDENCE_UPLOAD_CHUNK_BYTES', 1024 * 1024)
+
+
+def upload_dir():
+    path = _setting('EVIDENCE_UPLOAD_DIR', None) or os.path.join(tempfile.gettempdir(), 'gestor-evidence-uploads')
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def part_path(upload):
+    return os.path.join(upload_dir(), f'{upload.pk}.part')
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def start(ticket, user, filename, size):
+    """Abre una subida de ``size`` bytes para ``ticket``."""
+    filename = os.path.basename(str(filename or '')).strip()[:255]
+    if os.path.splitext(filename)[1].lower() not in EXTENSIONS:
+        raise UploadError('Formato no admitido: sube una imagen (JPG, PNG, WebP...)')
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        raise UploadError('Tamaño inválido')
+    if size <= 0:
+        raise UploadError('El archivo está vacío')
+    if size > max_bytes():
+        raise UploadError(f'El archivo supera el máximo de {max_bytes() // (1024 * 1024)} MB', status=413)
+    upload = EvidenceUpload.objects.create(ticket=ticket, user=user, filename=filename, size=size)
+    open(part_path(upload), 'wb').close()
+    metrics.inc('uploads.started')
+    return upload
+
+
+def describe(upload):
+    data = {
+        'id': str(upload.pk),
+        'filename': upload.filename,
+        'size': upload.size,
+        'offset': upload.received,
+        'chunk_size': chunk_bytes(),
+        'complete': upload.status == Status.COMPLETE,
+    }
+    if upload.evidence_id:
+        data['evidence_id'] = upload.evidence_id
+    return data
+
+
+def parse_content_range(header):
+    """``bytes a-b/total`` -> ``(a, b, total)``."""
+    try:
+        unit, _, spec = (header or '').partition(' ')
+        span, _, total = spec.partition('/')
+        first, _, last = span.partition('-')
+        if unit != 'bytes':
+            raise ValueError
+        first, last, total = int(first), int(last), int(total)
+    except ValueError:
+        raise UploadError('Falta o es inválida la cabecera Content-Range (bytes a-b/total)')
+    if first < 0 or last < first or last >= total:
+        raise UploadError('Rango fuera del archivo')
+    return first, last, total
+
+
+def _spool(stream, length):
+    """Copia ``length`` bytes del cuerpo de la petición a un temporal, por bloques; ``None`` si llegan menos."""
+    fd, path = tempfile.mkstemp(dir=upload_dir(), suffix='.chunk')
+    copied = 0
+    with os.fdopen(fd, 'wb') as chunk:
+        while copied < length:
+            block = stream.read(min(BLOCK_SIZE, length - copied))
+            if not block:
+                break
+            chunk.write(block)
+            copied += len(block)
+    if copied != length:
+        _remove(path)
+        return None
+    return path
+
+
+def _append(upload, chunk_path, first):
+    """Escribe la parte a partir de ``received`` (lo anterior a ``received`` ya está en el archivo)."""
+    skip = upload.received - first
+    with open(chunk_path, 'rb') as chunk, open(part_path(upload), 'r+b') as part:
+        chunk.seek(skip)
+        part.seek(upload.received)
+        for block in iter(lambda: chunk.read(BLOCK_SIZE), b''):
+            part.write(block)
+
+
+def _locked(upload_id, user):
+    upload = EvidenceUpload.objects.select_for_update().filter(pk=upload_id, user=user).first()
+    if upload is None:
+        raise UploadError('Subida no encontrada', status=404)
+    return upload
+
+
+def _check(upload, first, last, total):
+    """``True`` si la parte trae bytes nuevos, ``False`` si ya se recibió entera; ``UploadError`` si no encaja."""
+    if total != upload.size:
+        raise UploadError('El total no coincide con el tamaño declarado', offset=upload.received)
+    if last - first + 1 > chunk_bytes():
+        raise UploadError(f'Parte mayor de {chunk_bytes()} bytes', status=413, offset=upload.received)
+    if first > upload.received:
+        metrics.inc('uploads.rejected_chunks')
+        raise UploadError('Falta una parte anterior', status=409, offset=upload.received)
+    return last >= upload.received
+
+
+def write_chunk(upload_id, user, content_range, stream):
+    """Escribe una parte. Devuelve la subida actualizada (completa si era la última).
+
+    El cuerpo se lee a un temporal antes de bloquear la fila: una conexión lenta no
+    retiene la transacción (en SQLite, la base entera) mientras llegan los bytes.
+    """
+    first, last, total = parse_content_range(content_range)
+    started = time.monotonic()
+    with transaction.atomic():
+        upload = _locked(upload_id, user)
+        if upload.status != Status.OPEN:
+            return upload  # la respuesta a la última parte se perdió: ya está completa
+        if not _check(upload, first, last, total):
+            metrics.inc('uploads.duplicate_chunks')
+            return upload  # reenvío de algo ya recibido
+    chunk_path = _spool(stream, last - first + 1)
+    if chunk_path is None:
+        metrics.inc('uploads.truncated_chunks')
+        raise UploadError('La parte llegó incompleta', offset=upload.received)
+    discarded = False
+    try:
+        with transaction.atomic():
+            # Otra petición con la misma parte pudo adelantarse mientras se leía
+            upload = _locked(upload_id, user)
+            if upload.status != Status.OPEN or not _check(upload, first, last, total):
+                return upload
+            _append(upload, chunk_path, first)
+            metrics.inc('uploads.bytes', last + 1 - upload.received)
+            upload.received = last + 1
+            upload.save(update_fields=['received', 'updated_at'])
+            # Se descarta sin lanzar: la excepción desharía el borrado dentro del atomic
+            discarded = upload.received == upload.size and finish(upload) is None
+    finally:
+        _remove(chunk_path)
+    metrics.observe('uploads.chunk_seconds', time.monotonic() - started)
+    if discarded:
+        raise UploadError('El archivo no es una imagen válida: vuelve a subirlo', status=415, offset=0)
+    return upload
+
+
+def _is_image(path):
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except (UnidentifiedImageError, OSError, SyntaxError):
+        return False
+    return True
+
+
+def finish(upload):
+    """Crea la ``Evidence`` con el archivo ensamblado (dentro de la transacción de la última parte).
+
+    Si no es una imagen borra la subida y su temporal y devuelve ``None``: el cliente
+    tiene que empezar otra desde 0.
+    """
+    path = part_path(upload)
+    if not _is_image(path):
+        metrics.inc('uploads.invalid')
+        upload.delete()
+        transaction.on_commit(lambda: _remove(path))
+        return None
+    with open(path, 'rb') as assembled:
+        evidence = Evidence.objects.create(ticket=upload.ticket, image=File(assembled, name=upload.filename))
+    evidence_pipeline.schedule(evidence)
+    upload.status = Status.COMPLETE
+    upload.evidence = evidence
+    upload.save(update_fields=['status', 'evidence', 'updated_at'])
+    transaction.on_commit(lambda: _remove(path))
+    metrics.inc('uploads.completed')
+    metrics.observe('uploads.seconds', (timezone.now() - upload.created_at).total_seconds())
+    return evidence
+
+
+def abort(upload):
+    path = part_path(upload)
+    upload.delete()
+    transaction.on_commit(lambda: _remove(path))
+
+
+def expire(ttl=None):
+    """Borra las subidas sin actividad desde hace ``EVIDENCE_UPLOAD_TTL_HOURS`` y sus temporales."""
+    ttl = ttl or timedelta(hours=_setting('EVIDENCE_UPLOAD_TTL_HOURS', 24))
+    before = timezone.now() - ttl
+    expired = 0
+    for upload in EvidenceUpload.objects.filter(status=Status.OPEN, updated_at__lt=before).iterator():
+        _remove(part_path(upload))
+        upload.delete()
+        expired += 1
+    EvidenceUpload.objects.filter(status=Status.COMPLETE, updated_at__lt=before).delete()
+    with os.scandir(upload_dir()) as entries:
+        for entry in entries:  # partes de peticiones que se cortaron a medio leer
+            if entry.name.endswith('.chunk') and entry.is_file() and entry.stat().st_mtime < before.timestamp():
+                _remove(entry.path)
+    return expired
+
+
+def stats():
+    return {
+        'open': EvidenceUpload.objects.filter(status=Status.OPEN).count(),
+        'bytes_per_second': round(metrics.rate('uploads.bytes'), 1),
+    }
@@ -1,18 +1,32 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Count
-from django.db import models
+from django.db import models, transaction
 from django.core.paginator import Paginator
 from accounts.models import Roles, CustomUser
 from oficinas.models import Office
-from .models import Ticket, TicketStatus
+from .models import EvidenceUpload, Ticket, TicketEvent, TicketStatus
+from .workload import office_workload
+from .access import DEFAULT_SORT, SORTS, filter_tickets, order_tickets, visible_tickets, visibility_scope
+from gestor_servicios.conditional import conditional, directory_version, make_etag
+from gestor_servicios.pagination import CursorPage, CursorPaginator
 from accounts.decorators import jefe_required, supervisor_required, tecnico_required
 from .forms import TicketCreateForm, TechnicianUpdateForm, TicketNoteForm, EvidenceForm
-from accounts.models import Notification
-from django.core.mail import send_mail
+from . import jobs
+from . import evidence as evidence_pipeline
+from . import uploads as evidence_uploads
 from django.template.loader import render_to_string
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
+from django.conf import settings
+from django.core.cache import cache
+from django.urls import reverse
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import require_http_methods, require_POST
+from gestor_servicios import metrics
+from search import codes as search_codes, index as search_index
+from search.text import normalize
+import json
+import time
 
 
 def is_jefe(user):
@@ -27,67 +41,55 @@ def is_tecnico(user):
 	return user.is_authenticated and user.is_tecnico
 
 
+def filtered_tickets(request):
+	"""Tickets visibles para el usuario con los filtros del listado (status, priority, office, tech, q)."""
+	return filter_tickets(request.user, request.GET)
+
+
+def _is_tbody_request(request):
+	return request.headers.get('x-requested-with') == 'XMLHttpRequest' and request.GET.get('partial') == 'tbody'
+
+
+def tbody_stamp(request):
+	# Solo el fragmento del polling/WS es condicional; la página completa se sirve siempre
+	if not _is_tbody_request(request):
+		return None
+	stamp = filtered_tickets(request).aggregate(last=models.Max('updated_at'), total=models.Count('id'))
+	return (stamp['last'], stamp['total'], directory_version()), stamp['last']
+
+
 @login_required
+@conditional(tbody_stamp)
 def index(request):
-	# Role-aware base queryset
-	if request.user.is_jefe:
-		qs = Ticket.objects.select_related('assigned_office', 'technician').all()
-	elif request.user.is_supervisor:
-		qs = Ticket.objects.filter(assigned_office=request.user.office)
-	else:
-		qs = Ticket.objects.filter(technician=request.user)
-
-	# Filters
+	# Role-aware base queryset + filters
+	qs = filtered_tickets(request)
 	status = request.GET.get('status')
 	priority = request.GET.get('priority')
 	office = request.GET.get('office')
 	tech = request.GET.get('tech')
 	q = request.GET.get('q')
 
-	if status:
-		qs = qs.filter(status=status)
-	if priority:
-		qs = qs.filter(priority=priority)
-	if office:
-		qs = qs.filter(assigned_office_id=office)
-	if tech:
-		qs = qs.filter(technician_id=tech)
-	if q:
-		qs = qs.filter(models.Q(requester_name__icontains=q) | models.Q(description__icontains=q))
-
 	# Sorting
-	sort_by = request.GET.get('sort', '-created_at')  # Default: newest first
-	valid_sorts = [
-		'-created_at',  # Newest first
-		'created_at',   # Oldest first
-		'-updated_at',  # Recently updated first
-		'updated_at',   # Least recently updated first
-		'-priority',    # High priority first
-		'priority',     # Low priority first
-		'status',       # Status alphabetical
-		'-status'       # Status reverse alphabetical
-	]
-	
-	if sort_by in valid_sorts:
-		qs = qs.order_by(sort_by)
-	else:
-		qs = qs.order_by('-created_at')
+	sort_by = request.GET.get('sort', DEFAULT_SORT)  # Default: newest first
+	if sort_by not in SORTS or (sort_by == 'relevance' and not q):
+		sort_by = DEFAULT_SORT
+	qs = order_tickets(qs, sort_by, q)
 
-	# Pagination
-	page = request.GET.get('page', 1)
-	paginator = Paginator(qs, 10)
-	tickets = paginator.get_page(page)
+	# Pagination: por cursor (keyset, id como desempate) y total aproximado;
+	# ?page=N se mantiene para enlaces antiguos con OFFSET
+	if request.GET.get('page') or sort_by == 'relevance':
+		paginator = Paginator(qs, 10)
+		tickets = paginator.get_page(request.GET.get('page'))
+	else:
+		tickets = CursorPaginator(qs, sort_by, 10, count='approx').get_page(request.GET.get('cursor'))
 
 	# Workload for supervisors view
 	tech_counts = None
 	tecnicos = None
 	offices = None
-	if request.user.is_supervisor:
-		tech_counts = (
-			CustomUser.objects.filter(office=request.user.office, role=Roles.TECNICO)
-			.annotate(asignados=Count('tickets_assigned_to', filter=models.Q(tickets_assigned_to__status__in=[TicketStatus.ASSIGNED, TicketStatus.IN_PROGRESS, TicketStatus.PENDING_SUPPLIES])))
-		)
-		tecnicos = CustomUser.objects.filter(office=request.user.office, role=Roles.TECNICO)
+	if request.user.is_supervisor and request.user.office_id:
+		tech_counts = office_workload(request.user.office_id)
+		tecnicos = tech_counts
 	if request.user.is_jefe:
 		offices = Office.objects.all()
 		tecnicos = CustomUser.objects.filter(role=Roles.TECNICO)
@@ -107,12 +109,62 @@ def index(request):
 		'tecnicos': tecnicos,
 		'offices': offices,
 	}
-	if request.headers.get('x-requested-with') == 'XMLHttpRequest' and request.GET.get('partial') == 'tbody':
+	if _is_tbody_request(request):
 		html = render_to_string('tickets/_table_body.html', context | {'no_layout': True}, request=request)
-		return JsonResponse({'html': html})
+		data = {'html': html}
+		if isinstance(tickets, CursorPage):
+			# "Cargar más": el cliente pide la siguiente página con este cursor
+			data.update({'has_next': tickets.has_next, 'next_cursor': tickets.next_cursor})
+		return JsonResponse(data)
 	return render(request, 'tickets/index.html', context)
 
 
+LOOKUP_LIMIT = 8
+
+
+def _lookup_results(user, q):
+	visible = visible_tickets(user)
+	code_ids = search_codes.lookup(q, LOOKUP_LIMIT, within=visible)
+	ids = list(dict.fromkeys(code_ids + search_index.ranked_ids(q, search_index.TICKET_KINDS, LOOKUP_LIMIT, within=visible)))[:LOOKUP_LIMIT]
+	tickets = visible.in_bulk(ids)
+	return [
+		{
+			'id': ticket_id,
+			'equipment_code': tickets[ticket_id].equipment_code,
+			'requester_name': tickets[ticket_id].requester_name,
+			'description': tickets[ticket_id].description[:80],
+			'status': tickets[ticket_id].get_status_display(),
+			'match': 'code' if ticket_id in code_ids else 'text',
+			'url': reverse('ticket_detail', args=[ticket_id]),
+		}
+		for ticket_id in ids if ticket_id in tickets
+	]
+
+
+@login_required
+@cache_control(private=True, max_age=10)
+def lookup(request):
+	"""Autocompletado del buscador (JSON): tickets visibles por código de equipo y por texto.
+
+	Pensado para llamarse mientras se escribe: la respuesta queda en caché por alcance de
+	visibilidad, consulta y versión del índice (``SEARCH_LOOKUP_TTL``), y el navegador la
+	reutiliza unos segundos, así que volver a un prefijo ya pedido no toca la base de datos.
+	"""
+	q = ' '.join(request.GET.get('q', '').split())[:100]
+	if len(q) < 2:
+		return JsonResponse({'q': q, 'results': []})
+	key = 'ticket_lookup:' + make_etag(visibility_scope(request.user), search_index.version(), normalize(q))
+	results = cache.get(key)
+	if results is None:
+		started = time.monotonic()
+		results = _lookup_results(request.user, q)
+		metrics.observe('search.lookup_seconds', time.monotonic() - started)
+		cache.set(key, results, getattr(settings, 'SEARCH_LOOKUP_TTL', 300))
+	else:
+		metrics.inc('search.lookup_cache_hits')
+	return JsonResponse({'q': q, 'results': results})
+
+
 @login_required
 @jefe_required
 def create(request):
@@ -125,25 +177,10 @@ def create(request):
 			# Set supervisor inferred from office if exists
 			assigned_office: Office = ticket.assigned_office
 			ticket.supervisor = assigned_office.supervisor if assigned_office else None
-			ticket.save()
-			
-			# Crear notificaciones para nuevos requerimientos
-			# Notificar a todos los jefes
-			jefes = CustomUser.objects.filter(role=Roles.JEFE, is_active=True)
-			for jefe in jefes:
-				Notification.objects.create(
-					recipient=jefe,
-					ticket=ticket,
-					text=f"🆕 NUEVO REQUERIMIENTO - #{ticket.id}: {ticket.requester_name} solicita servicio en {ticket.assigned_office}"
-				)
-			
-			# Notificar al supervisor de la oficina asignada (si existe y no es jefe)
-			if ticket.supervisor and ticket.supervisor.role != Roles.JEFE:
-				Notification.objects.create(
-					recipient=ticket.supervisor,
-					ticket=ticket,
-					text=f"🆕 Nuevo requerimiento asignado a tu oficina - #{ticket.id}: {ticket.requester_name}"
-				)
+			with transaction.atomic():
+				ticket.save()
+				# Avisos a jefes y supervisor: fuera de la petición (tickets.tasks)
+				jobs.enqueue('tickets.created', {'ticket_id': ticket.id}, priority=jobs.HIGH, key=f'tickets.created:{ticket.id}')
 			
 			messages.success(request, 'Requerimiento creado y asignado a oficina')
 			return redirect('tickets_index')
@@ -168,35 +205,19 @@ def assign(request, ticket_id):
 		# When assigned to someone, move status to IN_PROGRESS
 		ticket.status = TicketStatus.IN_PROGRESS
 		ticket.supervisor = request.user
-		ticket.save()
-		# Notify the assigned technician (or supervisor if self)
+		# Notify the assigned technician (or supervisor if self): notificación y correo en segundo plano
 		assignee = ticket.technician or request.user
-		Notification.objects.create(
-			recipient=assignee,
-			ticket=ticket,
-			text=f"Nuevo requerimiento asignado #{ticket.id}: {ticket.description[:80]}"
-		)
-		# Optional email notification
-		try:
-			if assignee.email:
-				send_mail(
-					subject=f"Nuevo requerimiento asignado #{ticket.id}",
-					message=(
-						f"Hola {assignee.username},\n\n"
-						f"Se te ha asignado el requerimiento #{ticket.id}.\n"
-						f"Descripción: {ticket.description}\n"
-						f"Prioridad: {ticket.get_priority_display()}\n"
-						f"Estado: {ticket.get_status_display()}\n"
-					),
-					from_email=None,
-					recipient_list=[assignee.email],
-					fail_silently=True,
-				)
-		except Exception:
-			pass
+		with transaction.atomic():
+			ticket.save()
+			event = TicketEvent.objects.create(ticket=ticket, kind=TicketEvent.Kind.ASSIGNED, user=request.user)
+			jobs.enqueue(
+				'tickets.assigned', {'ticket_id': ticket.id, 'assignee_id': assignee.id},
+				priority=jobs.HIGH, key=f'tickets.assigned:{ticket.id}:{assignee.id}:{event.id}',
+			)
 		messages.success(request, 'Ticket asignado')
 		return redirect('tickets_index')
-	tecnicos = CustomUser.objects.filter(office=request.user.office, role=Roles.TECNICO, is_active=True, approved=True)
+	# Carga actual de cada técnico (una sola consulta) para elegir a quién asignar
+	tecnicos = office_workload(request.user.office_id, active_only=True)
 	return render(request, 'tickets/assign.html', {'ticket': ticket, 'tecnicos': tecnicos})
 
 
@@ -211,41 +232,25 @@ def update_status(request, ticket_id):
 		messages.info(request, 'El requerimiento ya está completado y no se puede actualizar.')
 		return redirect('tickets_index')
 	if request.method == 'POST':
+		old_status = ticket.status  # Antes de validar: is_valid() ya copia los datos del form a la instancia
 		form = TechnicianUpdateForm(request.POST, instance=ticket)
 		if form.is_valid():
-			old_status = ticket.status  # Guardar el estado anterior
-			updated_ticket = form.save()
 			note_text = form.cleaned_data.get('note')
-			if note_text:
-				from .models import TicketNote
-				TicketNote.objects.create(ticket=updated_ticket, author=request.user, text=note_text)
-			
-			# Enviar notificaciones si se cambió a PENDING_SUPPLIES
-			if old_status != TicketStatus.PENDING_SUPPLIES and updated_ticket.status == TicketStatus.PENDING_SUPPLIES:
-				# Obtener la nota más reciente que debería contener la información de insumos
-				recent_note = ""
+			with transaction.atomic():
+				updated_ticket = form.save()
 				if note_text:
-					recent_note = f" - Insumos solicitados: {note_text}"
+					from .models import TicketNote
+					TicketNote.objects.create(ticket=updated_ticket, author=request.user, text=note_text)
 				
-				# Notificar a todos los jefes
-				jefes = CustomUser.objects.filter(role=Roles.JEFE, is_active=True)
-				for jefe in jefes:
-					Notification.objects.create(
-						recipient=jefe,
-						ticket=updated_ticket,
-						text=f"🔧 INSUMOS SOLICITADOS - Requerimiento #{updated_ticket.id}: {updated_ticket.requester_name} ({updated_ticket.assigned_office}){recent_note}"
+				# Enviar notificaciones si se cambió a PENDING_SUPPLIES
+				if old_status != TicketStatus.PENDING_SUPPLIES and updated_ticket.status == TicketStatus.PENDING_SUPPLIES:
+					# Avisos a jefes y supervisor de la oficina (tickets.tasks)
+					event = TicketEvent.objects.create(ticket=updated_ticket, kind=TicketEvent.Kind.PENDING_SUPPLIES, user=request.user)
+					jobs.enqueue(
+						'tickets.pending_supplies',
+						{'ticket_id': updated_ticket.id, 'technician': request.user.username, 'note': note_text or ''},
+						key=f'tickets.pending_supplies:{updated_ticket.id}:{event.id}',
 					)
-				
-				# Notificar al supervisor de la oficina (si existe)
-				if updated_ticket.assigned_office and updated_ticket.assigned_office.supervisor:
-					supervisor = updated_ticket.assigned_office.supervisor
-					# Evitar notificación duplicada si el supervisor también es jefe
-					if supervisor.role != Roles.JEFE:
-						Notification.objects.create(
-							recipient=supervisor,
-							ticket=updated_ticket,
-							text=f"🔧 INSUMOS SOLICITADOS - Tu técnico {request.user.username} requiere insumos para el requerimiento #{updated_ticket.id}{recent_note}"
-						)
 			
 			messages.success(request, 'Estado actualizado')
 			return redirect('tickets_index')
@@ -303,9 +308,7 @@ def add_note(request, ticket_id):
 	return render(request, 'tickets/add_note.html', {'form': form, 'ticket': ticket})
 
 
-@login_required
-def add_evidence(request, ticket_id):
-	from .models import Evidence
+def _evidence_ticket(request, ticket_id):
 	ticket = get_object_or_404(Ticket, pk=ticket_id)
 	# Only the assigned technician, the ticket's supervisor, or supervisors of the office can upload evidence (NOT jefes)
 	if not (
@@ -315,14 +318,73 @@ def add_evidence(request, ticket_id):
 	):
 		from django.core.exceptions import PermissionDenied
 		raise PermissionDenied("No autorizado para subir evidencias de este ticket")
+	return ticket
+
+
+@login_required
+def add_evidence(request, ticket_id):
+	from .models import Evidence
+	ticket = _evidence_ticket(request, ticket_id)
 	if request.method == 'POST':
 		form = EvidenceForm(request.POST, request.FILES)
 		if form.is_valid():
-			Evidence.objects.create(ticket=ticket, image=form.cleaned_data['image'])
+			with transaction.atomic():
+				evidence = Evidence.objects.create(ticket=ticket, image=form.cleaned_data['image'])
+				# Re-codificación y miniaturas en segundo plano (tickets.evidence)
+				evidence_pipeline.schedule(evidence)
 			messages.success(request, 'Evidencia subida')
 			return redirect('tickets_index')
 	else:
 		form = EvidenceForm()
-	return render(request, 'tickets/add_evidence.html', {'form': form, 'ticket': ticket})
+	return render(request, 'tickets/add_evidence.html', {
+		'form': form,
+		'ticket': ticket,
+		'upload_url': reverse('ticket_upload_start', args=[ticket.id]),
+		'max_upload_mb': evidence_uploads.max_bytes() // (1024 * 1024),
+	})
+
+
+def _upload_error(error):
+	data = {'error': str(error)}
+	if error.offset is not None:
+		data['offset'] = error.offset
+	return JsonResponse(data, status=error.status)
+
+
+@login_required
+@require_POST
+def upload_start(request, ticket_id):
+	"""Abre una subida por partes (ver tickets.uploads): JSON {filename, size}"""
+	ticket = _evidence_ticket(request, ticket_id)
+	try:
+		data = json.loads(request.body or b'{}')
+	except ValueError:
+		return JsonResponse({'error': 'JSON inválido'}, status=400)
+	try:
+		upload = evidence_uploads.start(ticket, request.user, data.get('filename'), data.get('size'))
+	except evidence_uploads.UploadError as error:
+		return _upload_error(error)
+	response = evidence_uploads.describe(upload)
+	response['url'] = reverse('ticket_upload', args=[upload.pk])
+	response['max_size'] = evidence_uploads.max_bytes()
+	return JsonResponse(response, status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def upload_chunk(request, upload_id):
+	"""GET: desde dónde seguir; PUT: una parte (Content-Range); DELETE: cancelar"""
+	if request.method == 'PUT':
+		try:
+			upload = evidence_uploads.write_chunk(upload_id, request.user, request.headers.get('Content-Range'), request)
+		except evidence_uploads.UploadError as error:
+			return _upload_error(error)
+		return JsonResponse(evidence_uploads.describe(upload))
+	upload = get_object_or_404(EvidenceUpload, pk=upload_id, user=request.user)
+	if request.method == 'DELETE':
+		if upload.status == EvidenceUpload.Status.OPEN:
+			evidence_uploads.abort(upload)
+		return HttpResponse(status=204)
+	return JsonResponse(evidence_uploads.describe(upload))
 
 # Create your views here.
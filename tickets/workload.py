@@ -0,0 +1,57 @@
+"""Matriz de carga de trabajo: técnico × estado para una oficina.
+
+Se calcula con una sola consulta agrupada sobre ``TicketCounter`` y la reutilizan
+las estadísticas del supervisor, el listado de tickets y la pantalla de asignación.
+"""
+from django.db.models import Min, Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from accounts.models import CustomUser, Roles
+from .models import TicketStatus
+
+
+# Estados que cuentan como carga abierta de un técnico
+OPEN_STATUSES = [TicketStatus.ASSIGNED, TicketStatus.IN_PROGRESS, TicketStatus.PENDING_SUPPLIES]
+
+_PREFIX = 'ticket_counters_as_technician__'
+
+
+def _count(**filters):
+    condition = Q(**{f'{_PREFIX}{k}': v for k, v in filters.items()}) if filters else None
+    return Coalesce(Sum(f'{_PREFIX}count', filter=condition), Value(0))
+
+
+def office_workload(office_id, active_only=False):
+    """Técnicos de la oficina anotados con su carga.
+
+    Cada usuario devuelto trae:
+      - ``asignados``: total de tickets (todas las oficinas)
+      - ``abiertos``: tickets en ``OPEN_STATUSES``
+      - ``por_estado``: dict ``{código de estado: total}``
+      - ``completados``, ``en_progreso``, ``pendientes_insumos``
+      - ``completados_oficina``: completados en esta oficina
+      - ``oldest_open_day`` / ``open_age_days``: día de creación del ticket abierto
+        más antiguo y su antigüedad en días (``None`` si no tiene abiertos)
+    """
+    annotations = {f'n_{choice.value}': _count(status=choice.value) for choice in TicketStatus}
+    annotations['asignados'] = _count()
+    annotations['completados_oficina'] = _count(status=TicketStatus.COMPLETED, assigned_office_id=office_id)
+    annotations['oldest_open_day'] = Min(
+        f'{_PREFIX}day',
+        filter=Q(**{f'{_PREFIX}status__in': OPEN_STATUSES, f'{_PREFIX}count__gt': 0}),
+    )
+    qs = CustomUser.objects.filter(office_id=office_id, role=Roles.TECNICO)
+    if active_only:
+        qs = qs.filter(is_active=True, approved=True)
+    technicians = list(qs.annotate(**annotations).order_by('first_name', 'last_name', 'username'))
+
+    today = timezone.localdate()
+    for tech in technicians:
+        tech.por_estado = {choice.value: getattr(tech, f'n_{choice.value}') for choice in TicketStatus}
+        tech.abiertos = sum(tech.por_estado[s] for s in OPEN_STATUSES)
+        tech.completados = tech.por_estado[TicketStatus.COMPLETED]
+        tech.en_progreso = tech.por_estado[TicketStatus.IN_PROGRESS]
+        tech.pendientes_insumos = tech.por_estado[TicketStatus.PENDING_SUPPLIES]
+        tech.open_age_days = (today - tech.oldest_open_day).days if tech.oldest_open_day else None
+    return technicians